@@ -17,7 +17,7 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 def lip_sync(video, audio, checkbox):
 
     # 开始对齐
-    result = video_with_audio_task_service.face_handle.handle(Wav2LipInputModel.model_validate({
+    result = video_with_audio_task_service.face_handle.handle_to_file(Wav2LipInputModel.model_validate({
         "video_path": video,
         "audio_path": audio,
         "improve_video": checkbox
@@ -25,9 +25,8 @@ def lip_sync(video, audio, checkbox):
 
     result_vidio_path = os.path.join(current_dir, "result.mp4")
 
-    # 将结果保存到临时文件
-    with open(result_vidio_path, "wb") as f:
-        f.write(result)
+    # 将结果移动到返回给页面的路径
+    shutil.move(result, result_vidio_path)
     
     return result_vidio_path
 
@@ -4,8 +4,10 @@ from typing import Optional
 from fastapi import HTTPException, Depends, Request, APIRouter
 from pydantic import BaseModel
 
-from module.ORM.model import ImageToVideoTaskModel, VideoAndAudioToVideoTaskModel
+from constants.ImageToVideoTaskConstants import TaskStatus
+from module.ORM.model import ImageToVideoTaskModel, VideoAndAudioToVideoTaskModel, AvatarTemplateModel
 from module.ORM.table_config import Authorizations
+from services.model_inference.wav2lip.avatar_template_service import avatar_template_queue
 from services.model_inference.wav2lip.model_service import video_with_audio_task_queue
 from utils.snowflake import Snowflake
 
@@ -31,17 +33,33 @@ async def verify_token_in_cookie(request: Request):
 
 
 class VideoWithAudioRequest(BaseModel):
-    video_key: str
+    video_key: Optional[str] = None
     audio_key: str
+    # 使用预处理好的模板, 与 video_key 二选一
+    template_id: Optional[int] = None
     improve_video: Optional[bool] = False
     callback_url: Optional[str] = None
 
 
+class AvatarTemplateRequest(BaseModel):
+    video_key: str
+
+
 @router.post("/video_with_audio")
 async def face_detection(request_body: VideoWithAudioRequest, payload: dict = Depends(verify_token_in_cookie)):
+    video_key = request_body.video_key
+    if request_body.template_id is not None:
+        template = avatar_template_queue.get_result(request_body.template_id)
+        if template is None or template.get("status") != TaskStatus.COMPLETED.value:
+            raise HTTPException(status_code=400, detail="模板不存在或未完成预处理")
+        video_key = template.get("video_key")
+    if video_key is None:
+        raise HTTPException(status_code=400, detail="video_key 和 template_id 不能同时为空")
+
     task_data = {
-        "video_key": request_body.video_key,
+        "video_key": video_key,
         "audio_key": request_body.audio_key,
+        "template_id": request_body.template_id,
         "improve_video":request_body.improve_video,
         "callback_url": request_body.callback_url,
         "status": 0
@@ -59,3 +77,23 @@ async def read_item(task_id: int, payload: dict = Depends(verify_token_in_cookie
     if result is None:
         return "任务正在处理中"
     return result
+
+
+@router.post("/avatar_template")
+async def create_avatar_template(request_body: AvatarTemplateRequest, payload: dict = Depends(verify_token_in_cookie)):
+    template_id = avatar_template_queue.add_task(AvatarTemplateModel.parse_obj({
+        "video_key": request_body.video_key,
+        "status": 0
+    }))
+
+    if template_id is None:
+        raise HTTPException(status_code=400, detail="模板预处理队列已满")
+    return {"template_id": template_id}
+
+
+@router.get("/avatar_template/{template_id}")
+async def read_avatar_template(template_id: int, payload: dict = Depends(verify_token_in_cookie)):
+    template = avatar_template_queue.get_result(template_id)
+    if template is None:
+        raise HTTPException(status_code=404, detail="模板不存在")
+    return template
@@ -10,6 +10,7 @@
 """
 import io
 import tempfile
+import threading
 from abc import ABC, abstractmethod
 from typing import List, Dict
 
@@ -19,12 +20,17 @@ import numpy as np
 import torchaudio
 from torchaudio.transforms import Resample
 
+from model.video_decoder import iter_video_frames
+
 
 class BaseHandle(ABC):
     """
     Abstract class for the Model interface
     """
 
+    # 视频解码后端, opencv 或 pyav, 见 model/video_decoder.py
+    video_decoder_backend = "opencv"
+
     @abstractmethod
     def initialize(self, **kwargs):
         """
@@ -60,6 +66,20 @@ class BaseHandle(ABC):
         """
         pass
 
+    # 重采样器按 (原采样率, 目标采样率) 缓存, 避免每次调用都重新计算 sinc 卷积核
+    _resamplers = {}
+    _resamplers_lock = threading.Lock()
+
+    @classmethod
+    def get_resampler(cls, orig_freq, new_freq) -> Resample:
+        key = (orig_freq, new_freq)
+        with cls._resamplers_lock:
+            resampler = cls._resamplers.get(key)
+            if resampler is None:
+                resampler = Resample(orig_freq=orig_freq, new_freq=new_freq)
+                cls._resamplers[key] = resampler
+        return resampler
+
     def load_wav_from_bytes(self, byte_data, target_sample_rate=16000):
         # 使用 io.BytesIO 将字节数据转换为类文件对象
         bytes_io = io.BytesIO(byte_data)
@@ -68,8 +88,7 @@ class BaseHandle(ABC):
 
         # 如果需要将采样率转换为目标采样率
         if sample_rate != target_sample_rate:
-            resampler = Resample(orig_freq=sample_rate, new_freq=target_sample_rate)
-            waveform = resampler(waveform)
+            waveform = self.get_resampler(sample_rate, target_sample_rate)(waveform)
 
         return waveform
 
@@ -79,69 +98,66 @@ class BaseHandle(ABC):
 
         # 如果需要将采样率转换为目标采样率
         if sample_rate != target_sample_rate:
-            resampler = Resample(orig_freq=sample_rate, new_freq=target_sample_rate)
-            waveform = resampler(waveform)
+            waveform = self.get_resampler(sample_rate, target_sample_rate)(waveform)
 
         return waveform.squeeze()
 
-    def decode_video_from_bytes(self, video_bytes: bytes, resize_factor=1, rotate=False, crop=(0, -1, 0, -1)):
+    def decode_video_from_bytes(self, video_bytes: bytes, resize_factor=1, rotate=False, crop=(0, -1, 0, -1),
+                                max_frames=None):
         # 创建临时文件
         with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as temp_file:
             temp_file.write(video_bytes)
             temp_file_path = temp_file.name
 
-        # 使用 OpenCV 读取视频
-        video_stream = cv2.VideoCapture(temp_file_path)
-        fps = video_stream.get(cv2.CAP_PROP_FPS)
-        print('Reading video frames...')
+        return self.decode_video_from_file(temp_file_path, resize_factor, rotate, crop, max_frames)
 
-        full_frames = []
-        while True:
-            still_reading, frame = video_stream.read()
-            if not still_reading:
-                video_stream.release()
-                break
-            if resize_factor > 1:
-                frame = cv2.resize(frame, (frame.shape[1] // resize_factor, frame.shape[0] // resize_factor))
-
-            if rotate:
-                frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
-
-            y1, y2, x1, x2 = crop
-            if x2 == -1: x2 = frame.shape[1]
-            if y2 == -1: y2 = frame.shape[0]
-
-            frame = frame[y1:y2, x1:x2]
-
-            full_frames.append(frame)
+    def decode_video_from_file(self, video_path, resize_factor=1, rotate=False, crop=(0, -1, 0, -1),
+                               max_frames=None):
+        fps = self.get_video_fps(video_path)
+        print('Reading video frames...')
 
+        full_frames = list(self.iter_video_frames_from_file(video_path, resize_factor, rotate, crop, max_frames))
 
         return full_frames, fps
 
-    def decode_video_from_file(self, video_path, resize_factor=1, rotate=False, crop=(0, -1, 0, -1)):
-        # 使用 OpenCV 读取视频
+    @staticmethod
+    def get_video_fps(video_path) -> float:
+        """
+        读取视频帧率
+        """
         video_stream = cv2.VideoCapture(video_path)
         fps = video_stream.get(cv2.CAP_PROP_FPS)
-        print('Reading video frames...')
-
-        full_frames = []
-        while True:
-            still_reading, frame = video_stream.read()
-            if not still_reading:
-                video_stream.release()
-                break
-            if resize_factor > 1:
-                frame = cv2.resize(frame, (frame.shape[1] // resize_factor, frame.shape[0] // resize_factor))
-
-            if rotate:
-                frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
+        video_stream.release()
+        return fps
 
-            y1, y2, x1, x2 = crop
-            if x2 == -1: x2 = frame.shape[1]
-            if y2 == -1: y2 = frame.shape[0]
+    def iter_video_frames_from_file(self, video_path, resize_factor=1, rotate=False, crop=(0, -1, 0, -1),
+                                    max_frames=None, backend=None):
+        """
+        逐帧读取视频, 内存中只保留当前帧, 用于流式处理
+        :param max_frames: 最多读取的帧数, 读够后立即停止解码
+        :param backend: 解码后端, 默认使用 video_decoder_backend
+        """
+        # 旋转信息和缩放由解码后端处理, 两个后端输出相同方向和尺寸的帧
+        frames = iter_video_frames(video_path, backend or self.video_decoder_backend, resize_factor, max_frames)
+        try:
+            for frame in frames:
+                yield self._transform_frame(frame, 1, rotate, crop)
+        finally:
+            frames.close()
+
+    @staticmethod
+    def _transform_frame(frame, resize_factor=1, rotate=False, crop=(0, -1, 0, -1)):
+        """
+        对单帧执行缩放、旋转和裁剪
+        """
+        if resize_factor > 1:
+            frame = cv2.resize(frame, (int(frame.shape[1] // resize_factor), int(frame.shape[0] // resize_factor)))
 
-            frame = frame[y1:y2, x1:x2]
+        if rotate:
+            frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
 
-            full_frames.append(frame)
+        y1, y2, x1, x2 = crop
+        if x2 == -1: x2 = frame.shape[1]
+        if y2 == -1: y2 = frame.shape[0]
 
-        return full_frames, fps
+        return frame[y1:y2, x1:x2]
@@ -4,6 +4,7 @@ import numpy as np
 # import tensorflow as tf
 from scipy import signal
 from scipy.io import wavfile
+import torch
 from model.Wav2Lip.hparams import hparams as hp
 
 
@@ -59,6 +60,23 @@ def melspectrogram(wav):
     return S
 
 
+def melspectrogram_torch(wav, device=None):
+    """melspectrogram 的 torch 实现, 可以在模型所在的设备上计算, 返回 float32 张量
+    :param wav: 一维波形, torch.Tensor 或 numpy 数组
+    :param device: 计算设备, 默认使用波形所在的设备
+    """
+    wav = torch.as_tensor(wav, dtype=torch.float32, device=device)
+    if hp.preemphasize:
+        # 与 signal.lfilter([1, -k], [1], wav) 相同
+        wav = torch.cat([wav[:1], wav[1:] - hp.preemphasis * wav[:-1]])
+    D = _stft_torch(wav)
+    S = _amp_to_db_torch(_linear_to_mel_torch(D.abs())) - hp.ref_level_db
+
+    if hp.signal_normalization:
+        return _normalize_torch(S)
+    return S
+
+
 def _lws_processor():
     import lws
     return lws.lws(hp.n_fft, get_hop_size(), fftsize=hp.win_size, mode="speech")
@@ -70,6 +88,19 @@ def _stft(y):
         return librosa.stft(y=y, n_fft=hp.n_fft, hop_length=get_hop_size(), win_length=hp.win_size)
 
 
+_torch_windows = {}
+
+
+def _stft_torch(y):
+    # 与 librosa.stft 的默认参数一致: 中心对齐, 常数填充, 周期 hann 窗
+    win_size = hp.win_size or hp.n_fft
+    key = (str(y.device), win_size)
+    if key not in _torch_windows:
+        _torch_windows[key] = torch.hann_window(win_size, periodic=True, device=y.device)
+    return torch.stft(y, n_fft=hp.n_fft, hop_length=get_hop_size(), win_length=win_size,
+                      window=_torch_windows[key], center=True, pad_mode="constant", return_complex=True)
+
+
 ##########################################################
 # Those are only correct when using lws!!! (This was messing with Wavenet quality for a long time!)
 def num_frames(length, fsize, fshift):
@@ -110,6 +141,17 @@ def _linear_to_mel(spectogram):
     return np.dot(_mel_basis, spectogram)
 
 
+_torch_mel_basis = {}
+
+
+def _linear_to_mel_torch(spectogram):
+    # 每个设备缓存一份 mel 滤波器组
+    key = str(spectogram.device)
+    if key not in _torch_mel_basis:
+        _torch_mel_basis[key] = torch.from_numpy(_build_mel_basis()).to(spectogram.device)
+    return torch.matmul(_torch_mel_basis[key], spectogram)
+
+
 def _build_mel_basis():
     assert hp.fmax <= hp.sample_rate // 2
     return librosa.filters.mel(sr=hp.sample_rate, n_fft=hp.n_fft, n_mels=hp.num_mels,
@@ -121,6 +163,11 @@ def _amp_to_db(x):
     return 20 * np.log10(np.maximum(min_level, x))
 
 
+def _amp_to_db_torch(x):
+    min_level = np.exp(hp.min_level_db / 20 * np.log(10))
+    return 20 * torch.log10(torch.clamp(x, min=min_level))
+
+
 def _db_to_amp(x):
     return np.power(10.0, (x) * 0.05)
 
@@ -140,6 +187,21 @@ def _normalize(S):
         return hp.max_abs_value * ((S - hp.min_level_db) / (-hp.min_level_db))
 
 
+def _normalize_torch(S):
+    if hp.allow_clipping_in_normalization:
+        if hp.symmetric_mels:
+            return torch.clamp((2 * hp.max_abs_value) * ((S - hp.min_level_db) / (-hp.min_level_db)) - hp.max_abs_value,
+                               -hp.max_abs_value, hp.max_abs_value)
+        else:
+            return torch.clamp(hp.max_abs_value * ((S - hp.min_level_db) / (-hp.min_level_db)), 0, hp.max_abs_value)
+
+    assert S.max() <= 0 and S.min() - hp.min_level_db >= 0
+    if hp.symmetric_mels:
+        return (2 * hp.max_abs_value) * ((S - hp.min_level_db) / (-hp.min_level_db)) - hp.max_abs_value
+    else:
+        return hp.max_abs_value * ((S - hp.min_level_db) / (-hp.min_level_db))
+
+
 def _denormalize(D):
     if hp.allow_clipping_in_normalization:
         if hp.symmetric_mels:
@@ -0,0 +1,151 @@
+"""
+模板视频 (avatar template) 预处理结果的存储
+
+同一个模板视频会搭配大量不同的音频, 将视频帧、96x96 人脸和人脸坐标预先保存为
+可内存映射的文件, 推理时直接读取, 跳过视频解码和人脸检测.
+
+视频帧默认以原始 uint8 保存 (frame_format=raw), 与直接使用视频时的帧完全相同, 读取时不需要解码.
+原始的 1080p 视频帧每帧约 6MB (25fps 时每分钟约 9GB), 超过 max_frame_bytes 的模板预处理失败.
+更长的模板可以显式选择 frame_format=jpg: 视频帧逐帧编码为 JPEG, 占用空间约为原始帧的 1/10 到 1/20,
+代价是每个任务都要逐帧解码, 且贴回人脸的背景帧有 JPEG 压缩损失, 与直接使用视频的结果不完全一致.
+人脸总是在压缩前从原始帧中裁剪并以原始 uint8 保存, 两种格式的模型输入相同.
+
+目录结构:
+    {root_dir}/{template_id}/meta.json    帧数、帧率、尺寸、视频帧格式
+    {root_dir}/{template_id}/frames.u8    raw 格式: (frame_count, height, width, 3) uint8 视频帧
+    {root_dir}/{template_id}/frames.jpg   jpg 格式: 逐帧 JPEG 依次拼接
+    {root_dir}/{template_id}/frame_offsets.npy  jpg 格式: (frame_count + 1,) 每帧在 frames.jpg 中的起始位置
+    {root_dir}/{template_id}/faces.u8     (frame_count, img_size, img_size, 3) uint8 人脸
+    {root_dir}/{template_id}/coords.npy   (frame_count, 4) 人脸坐标 (y1, y2, x1, x2)
+    {root_dir}/.{template_id}.lock        预处理时持有的文件锁, 同一节点的多个进程不会同时预处理同一个模板
+"""
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import cv2
+import numpy as np
+from filelock import FileLock
+
+logger = logging.getLogger(__name__)
+
+FRAME_FORMATS = ("raw", "jpg")
+
+
+class AvatarTemplateBundle:
+    """
+    预处理好的模板视频, 视频帧和人脸为只读的内存映射
+    """
+
+    def __init__(self, template_dir):
+        with open(os.path.join(template_dir, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.fps = meta["fps"]
+        self.frame_count = meta["frame_count"]
+        self.frame_format = meta.get("frame_format", "raw")
+        if self.frame_format == "jpg":
+            self.frames = np.memmap(os.path.join(template_dir, "frames.jpg"), dtype=np.uint8, mode="r")
+            self.frame_offsets = np.load(os.path.join(template_dir, "frame_offsets.npy"))
+        else:
+            self.frames = np.memmap(os.path.join(template_dir, "frames.u8"), dtype=np.uint8, mode="r",
+                                    shape=(self.frame_count, meta["height"], meta["width"], 3))
+        self.faces = np.memmap(os.path.join(template_dir, "faces.u8"), dtype=np.uint8, mode="r",
+                               shape=(self.frame_count, meta["img_size"], meta["img_size"], 3))
+        self.coords = np.load(os.path.join(template_dir, "coords.npy"))
+
+    def read_frames(self, idx):
+        """读取 idx 对应的视频帧, 返回新分配的 BGR 图像列表, 贴回人脸时不会修改模板"""
+        if self.frame_format == "jpg":
+            return [cv2.imdecode(self.frames[self.frame_offsets[i]:self.frame_offsets[i + 1]], cv2.IMREAD_COLOR)
+                    for i in idx]
+        # 花式索引会从内存映射中复制数据
+        return list(self.frames[idx])
+
+
+class AvatarTemplateStore:
+    def __init__(self, root_dir, frame_format="raw", max_frame_bytes=16 * 1024 ** 3, frame_quality=95):
+        """
+        :param root_dir: 模板保存目录
+        :param frame_format: 视频帧格式, raw 无损且读取时不需要解码, jpg 节省空间但有压缩损失, 见模块说明
+        :param max_frame_bytes: raw 格式单个模板视频帧的最大字节数, 超过时预处理失败
+        :param frame_quality: jpg 格式的 JPEG 质量
+        """
+        if frame_format not in FRAME_FORMATS:
+            raise ValueError(f"不支持的模板视频帧格式: {frame_format}, 可选: {FRAME_FORMATS}")
+        self.root_dir = root_dir
+        self.frame_format = frame_format
+        self.max_frame_bytes = max_frame_bytes
+        self.frame_quality = frame_quality
+        os.makedirs(root_dir, exist_ok=True)
+
+    def _get_template_dir(self, template_id):
+        return os.path.join(self.root_dir, str(template_id))
+
+    def exists(self, template_id) -> bool:
+        # meta.json 最后写入, 存在即说明模板完整
+        return os.path.isfile(os.path.join(self._get_template_dir(template_id), "meta.json"))
+
+    def lock(self, template_id) -> FileLock:
+        """模板的跨进程文件锁, 检查模板是否存在、下载和 build 都需要在锁内进行"""
+        return FileLock(os.path.join(self.root_dir, f".{template_id}.lock"))
+
+    def load(self, template_id) -> AvatarTemplateBundle:
+        if not self.exists(template_id):
+            raise ValueError(f"模板 {template_id} 不存在")
+        return AvatarTemplateBundle(self._get_template_dir(template_id))
+
+    def build(self, template_id, fps, face_frames, img_size) -> AvatarTemplateBundle:
+        """逐帧写入模板, 内存中只保留当前帧, 调用方需持有 lock(template_id)
+        :param template_id: 模板ID
+        :param fps: 视频帧率
+        :param face_frames: 可迭代的 (视频帧, 96x96 人脸, 人脸坐标 (y1, y2, x1, x2))
+        :param img_size: 人脸尺寸
+        """
+        temp_dir = tempfile.mkdtemp(prefix=f".tmp-{template_id}-", dir=self.root_dir)
+        try:
+            frame_count, frame_shape, coords, frame_offsets = 0, None, [], [0]
+            frames_name = "frames.jpg" if self.frame_format == "jpg" else "frames.u8"
+            with open(os.path.join(temp_dir, frames_name), "wb") as frames_file, \
+                    open(os.path.join(temp_dir, "faces.u8"), "wb") as faces_file:
+                for frame, face, face_coords in face_frames:
+                    if frame_shape is None:
+                        frame_shape = frame.shape
+                    elif frame.shape != frame_shape:
+                        raise ValueError("模板视频帧尺寸不一致")
+                    if self.frame_format == "jpg":
+                        ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.frame_quality])
+                        if not ok:
+                            raise ValueError("模板视频帧编码失败")
+                        frames_file.write(encoded.tobytes())
+                        frame_offsets.append(frame_offsets[-1] + len(encoded))
+                    else:
+                        if (frame_count + 1) * frame.nbytes > self.max_frame_bytes:
+                            raise ValueError(f"模板视频帧超过 {self.max_frame_bytes} 字节, 请缩短模板视频、"
+                                             f"降低分辨率或使用 jpg 格式")
+                        frames_file.write(np.ascontiguousarray(frame, dtype=np.uint8).tobytes())
+                    faces_file.write(np.ascontiguousarray(face, dtype=np.uint8).tobytes())
+                    coords.append([int(c) for c in face_coords])
+                    frame_count += 1
+
+            if frame_count == 0:
+                raise ValueError('Video contains no frames!')
+
+            np.save(os.path.join(temp_dir, "coords.npy"), np.array(coords, dtype=np.int64))
+            if self.frame_format == "jpg":
+                np.save(os.path.join(temp_dir, "frame_offsets.npy"), np.array(frame_offsets, dtype=np.int64))
+            with open(os.path.join(temp_dir, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({"fps": fps, "frame_count": frame_count, "height": frame_shape[0],
+                           "width": frame_shape[1], "img_size": img_size, "frame_format": self.frame_format}, f)
+
+            template_dir = self._get_template_dir(template_id)
+            if os.path.exists(template_dir):
+                shutil.rmtree(template_dir)
+            os.replace(temp_dir, template_dir)
+        except BaseException:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+
+        logger.info(f"模板 {template_id} 预处理完成, 帧数: {frame_count}")
+        return AvatarTemplateBundle(template_dir)
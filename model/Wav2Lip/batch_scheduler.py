@@ -0,0 +1,143 @@
+"""
+跨任务动态批处理
+
+多个任务线程各自提交 (mel, face) 批次, 调度线程把它们拼成 wav2lip_batch_size 大小的批次后统一前向,
+再把预测结果按行拆分回各自的任务. 队列中没有更多请求时最多等待 max_wait_ms 后以不满的批次执行.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class _InferenceRequest:
+    def __init__(self, mel_batch, img_batch):
+        self.mel_batch = mel_batch
+        self.img_batch = img_batch
+        self.future = Future()
+        # 下一个尚未调度的行
+        self.offset = 0
+        self.parts = []
+        self.finished_rows = 0
+
+    def __len__(self):
+        return len(self.mel_batch)
+
+
+class InferenceScheduler:
+    """
+    推理调度器, predict 接收拼好的 numpy 批次并返回按行对应的预测结果
+    """
+
+    def __init__(self, predict, batch_size, max_wait_ms=10):
+        self.predict = predict
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.requests = queue.Queue()
+        # 上一轮没有装下的请求, 剩余的行优先进入下一个批次
+        self.carry = None
+        self.stopped = False
+        self.batch_count = 0
+        self.row_count = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        logger.info(f"推理调度器已启动, batch_size: {self.batch_size}, 最长等待: {self.max_wait * 1000:.0f}ms")
+
+    def submit(self, mel_batch, img_batch) -> Future:
+        """
+        提交一个批次, 返回的 Future 结果为该批次的预测
+        """
+        if len(mel_batch) != len(img_batch):
+            raise ValueError("mel 批次与人脸批次长度不一致")
+        request = _InferenceRequest(mel_batch, img_batch)
+        if len(request) == 0:
+            request.future.set_result(np.empty((0,)))
+            return request.future
+        self.requests.put(request)
+        return request.future
+
+    def stop(self):
+        self.stopped = True
+        self.requests.put(None)
+
+    def stats(self):
+        return {
+            "batches": self.batch_count,
+            "rows": self.row_count,
+            "mean_batch_size": self.row_count / self.batch_count if self.batch_count else 0,
+        }
+
+    def run(self):
+        while not self.stopped:
+            batch = self._collect_batch()
+            if batch:
+                self._run_batch(batch)
+
+    def _next_request(self, timeout):
+        if self.carry is not None:
+            request, self.carry = self.carry, None
+            return request
+        try:
+            request = self.requests.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if request is None:
+            self.stopped = True
+        return request
+
+    def _collect_batch(self):
+        """
+        收集请求直到凑满一个批次或者等待超时, 返回 [(request, start, end)]
+        """
+        batch = []
+        size = 0
+        deadline = None
+        while size < self.batch_size:
+            timeout = None if deadline is None else deadline - time.monotonic()
+            if timeout is not None and timeout <= 0:
+                break
+            request = self._next_request(timeout)
+            if request is None:
+                break
+            if request.future.done():
+                # 之前的批次已经失败, 丢弃剩余的行
+                continue
+            if deadline is None:
+                deadline = time.monotonic() + self.max_wait
+            take = min(self.batch_size - size, len(request) - request.offset)
+            batch.append((request, request.offset, request.offset + take))
+            request.offset += take
+            size += take
+            if request.offset < len(request):
+                self.carry = request
+        return batch
+
+    def _run_batch(self, batch):
+        try:
+            mel_batch = np.concatenate([request.mel_batch[start:end] for request, start, end in batch])
+            img_batch = np.concatenate([request.img_batch[start:end] for request, start, end in batch])
+            pred = self.predict(mel_batch, img_batch)
+        except BaseException as e:
+            logger.error(f"批次推理失败: {e}")
+            for request, _, _ in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+
+        self.batch_count += 1
+        self.row_count += len(mel_batch)
+        position = 0
+        for request, start, end in batch:
+            request.parts.append(pred[position:position + end - start])
+            position += end - start
+            request.finished_rows += end - start
+            if request.finished_rows == len(request):
+                result = request.parts[0] if len(request.parts) == 1 else np.concatenate(request.parts)
+                request.future.set_result(result)
@@ -0,0 +1,79 @@
+"""
+INT8 量化模型的口型同步质量回归检查
+
+    python -m model.Wav2Lip.evaluation.quantization_lse_check --syncnet_dir /path/to/syncnet_python \
+        --videos a.mp4 b.mp4 --audios a.wav b.wav
+
+分别使用 fp32 和 int8 模型在 CPU 上生成视频, 再用 scores_LSE 中的 SyncNetInstance 计算 LSE-D (越小越好)
+和 LSE-C (越大越好). int8 的平均 LSE-D 增加或平均 LSE-C 下降超过阈值时以非零状态码退出.
+syncnet_dir 为按 evaluation/README.md 准备好的 syncnet_python 目录 (已复制 scores_LSE 中的脚本并下载模型),
+SyncNetInstance 固定使用 GPU 计算分数.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+
+def generate_videos(precision, videos, audios):
+    from model.Wav2Lip.wav2lip_handle import Wav2LipHandle, Wav2LipInputModel
+
+    handle = Wav2LipHandle(device="cpu")
+    handle.precision = precision
+    handle.warmup = False
+    handle.initialize()
+    if handle.precision != precision:
+        raise RuntimeError(f"{precision} 模型加载失败, 请先执行 python -m model.Wav2Lip.quantization")
+    # inference 返回编码完成的视频文件路径
+    return [handle.inference(handle.preprocess(Wav2LipInputModel(video_path=video_path, audio_path=audio_path)))
+            for video_path, audio_path in zip(videos, audios)]
+
+
+def score_videos(syncnet, opt, video_files):
+    """返回每个视频的 (LSE-D, LSE-C)"""
+    scores = []
+    for video_file in video_files:
+        offset, confidence, min_distance = syncnet.evaluate(opt, videofile=video_file)
+        scores.append((float(min_distance), float(confidence)))
+    return np.array(scores)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LSE-D / LSE-C regression check for the INT8 Wav2Lip model')
+    parser.add_argument('--syncnet_dir', type=str, required=True)
+    parser.add_argument('--initial_model', type=str, default=None, help='Defaults to <syncnet_dir>/data/syncnet_v2.model')
+    parser.add_argument('--videos', nargs='+', required=True)
+    parser.add_argument('--audios', nargs='+', required=True)
+    parser.add_argument('--tmp_dir', type=str, default='temp/lse_check')
+    parser.add_argument('--batch_size', type=int, default=20)
+    parser.add_argument('--vshift', type=int, default=15)
+    parser.add_argument('--max_lse_d_increase', type=float, default=0.1)
+    parser.add_argument('--max_lse_c_decrease', type=float, default=0.1)
+    opt = parser.parse_args()
+    if len(opt.videos) != len(opt.audios):
+        parser.error('--videos and --audios must have the same length')
+    opt.reference = 'quantization'
+
+    sys.path.insert(0, opt.syncnet_dir)
+    from SyncNetInstance_calc_scores import SyncNetInstance
+
+    syncnet = SyncNetInstance()
+    syncnet.loadParameters(opt.initial_model or os.path.join(opt.syncnet_dir, 'data', 'syncnet_v2.model'))
+
+    results = {}
+    for precision in ('fp32', 'int8'):
+        video_files = generate_videos(precision, opt.videos, opt.audios)
+        results[precision] = score_videos(syncnet, opt, video_files)
+        lse_d, lse_c = results[precision].mean(axis=0)
+        print(f"{precision}: LSE-D {lse_d:.3f}, LSE-C {lse_c:.3f}")
+
+    lse_d_increase, lse_c_decrease = (results['int8'] - results['fp32']).mean(axis=0) * np.array([1, -1])
+    print(f"int8 - fp32: LSE-D {lse_d_increase:+.3f}, LSE-C {-lse_c_decrease:+.3f}")
+    if lse_d_increase > opt.max_lse_d_increase or lse_c_decrease > opt.max_lse_c_decrease:
+        print("INT8 模型口型同步质量下降超过阈值")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
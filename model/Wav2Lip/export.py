@@ -0,0 +1,145 @@
+"""
+导出 TorchScript / ONNX 模型
+
+    python -m model.Wav2Lip.export --device cuda --batch_buckets 16 32 64 128
+    python -m model.Wav2Lip.export --format onnx
+
+TorchScript: Wav2Lip 和 S3FD 分别 trace 后 freeze, 保存到 models/exported, 文件名带设备类型 (freeze 后的常量与设备相关).
+meta.<设备>.json 记录导出时使用的批次档位和内存格式, Wav2LipHandle.initialize 优先加载导出的模型,
+推理时把每个批次补齐到最近的档位, 输入形状固定, cuDNN 自动调优的结果可以一直复用.
+freeze 后权重是图中的常量, 加载后无法再转换为 channels_last, 需要在导出时指定 --channels_last.
+
+ONNX: 导出 wav2lip.onnx 和 s3fd.onnx, 批次和图片尺寸为动态维度, 由 Wav2LipOnnxHandle 使用 ONNX Runtime 加载.
+"""
+import argparse
+import inspect
+import json
+import os
+import time
+
+import torch
+
+from model.Wav2Lip.face_detection.detection.sfd.net_s3fd import s3fd
+from model.Wav2Lip.inference import load_model
+
+CURRENT_PATH = os.path.dirname(os.path.abspath(__file__))
+EXPORT_DIR = os.path.join(CURRENT_PATH, "models", "exported")
+S3FD_PATH = os.path.join(CURRENT_PATH, "face_detection", "detection", "sfd", "s3fd.pth")
+
+
+def get_exported_paths(device_type, export_dir=EXPORT_DIR):
+    """返回 (wav2lip, s3fd, meta) 导出文件路径"""
+    return (os.path.join(export_dir, f"wav2lip.{device_type}.pt"),
+            os.path.join(export_dir, f"s3fd.{device_type}.pt"),
+            os.path.join(export_dir, f"meta.{device_type}.json"))
+
+
+def get_onnx_paths(export_dir=EXPORT_DIR):
+    """返回 (wav2lip, s3fd) ONNX 文件路径"""
+    return os.path.join(export_dir, "wav2lip.onnx"), os.path.join(export_dir, "s3fd.onnx")
+
+
+def _onnx_export(model, args, path, input_names, output_names, dynamic_axes, opset_version=17):
+    # 新版本 torch 默认使用 dynamo 导出, 这里固定使用 TorchScript 导出以支持 dynamic_axes
+    kwargs = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    torch.onnx.export(model, args, path, input_names=input_names, output_names=output_names,
+                      dynamic_axes=dynamic_axes, opset_version=opset_version, do_constant_folding=True, **kwargs)
+
+
+def export_wav2lip_onnx(model, path, img_size=96):
+    """导出 Wav2Lip, 输入 mel (B, 1, 80, 16) 和 face (B, 6, 96, 96), 批次为动态维度"""
+    example = (torch.zeros((1, 1, 80, 16)), torch.zeros((1, 6, img_size, img_size)))
+    _onnx_export(model.cpu().eval(), example, path, ["mel", "face"], ["pred"],
+                 {"mel": {0: "batch"}, "face": {0: "batch"}, "pred": {0: "batch"}})
+
+
+def export_s3fd_onnx(net, path, example_size=(240, 320)):
+    """导出 S3FD, 批次和图片尺寸为动态维度, 输出 6 层特征图的分类和回归结果"""
+    example = torch.zeros((1, 3) + tuple(example_size))
+    output_names = [f"{kind}{level}" for level in range(6) for kind in ("cls", "reg")]
+    dynamic_axes = {"image": {0: "batch", 2: "height", 3: "width"}}
+    dynamic_axes.update({name: {0: "batch", 2: f"{name}_height", 3: f"{name}_width"} for name in output_names})
+    _onnx_export(net.cpu().eval(), example, path, ["image"], output_names, dynamic_axes)
+
+
+def load_export_meta(meta_path):
+    if not os.path.exists(meta_path):
+        return {}
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def export_wav2lip(checkpoint_path, device, batch_buckets, img_size=96, channels_last=False):
+    model = load_model(checkpoint_path, device, channels_last=channels_last)
+    memory_format = torch.channels_last if channels_last else torch.contiguous_format
+    # Wav2Lip 的 4 维输入路径只有卷积, trace 得到的图与批次大小无关
+    example = (torch.zeros((max(batch_buckets), 1, 80, 16), device=device).contiguous(memory_format=memory_format),
+               torch.zeros((max(batch_buckets), 6, img_size, img_size), device=device)
+               .contiguous(memory_format=memory_format))
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(model, example))
+
+    # 每个档位执行一次, 与原模型对比
+    for bucket in batch_buckets:
+        mel_batch = torch.randn((bucket, 1, 80, 16), device=device)
+        img_batch = torch.rand((bucket, 6, img_size, img_size), device=device)
+        with torch.no_grad():
+            diff = (traced(mel_batch, img_batch) - model(mel_batch, img_batch)).abs().max().item()
+        print(f"wav2lip batch {bucket}: max diff {diff:.2e}")
+    return traced
+
+
+def load_s3fd(s3fd_path, device):
+    net = s3fd()
+    net.load_state_dict(torch.load(s3fd_path, map_location=device, weights_only=True))
+    return net.to(device).eval()
+
+
+def export_s3fd(s3fd_path, device, example_size=(720, 1280)):
+    net = load_s3fd(s3fd_path, device)
+    example = torch.zeros((1, 3) + tuple(example_size), device=device)
+    with torch.no_grad():
+        # 输出为列表, 需要 strict=False
+        traced = torch.jit.freeze(torch.jit.trace(net, example, strict=False))
+        diff = max((a - b).abs().max().item() for a, b in zip(traced(example), net(example)))
+    print(f"s3fd: max diff {diff:.2e}")
+    return traced
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export Wav2Lip and S3FD to TorchScript')
+    parser.add_argument('--checkpoint_path', type=str, default=os.path.join(CURRENT_PATH, "models", "wav2lip.pth"))
+    parser.add_argument('--s3fd_path', type=str, default=S3FD_PATH)
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--batch_buckets', nargs='+', type=int, default=[16, 32, 64, 128],
+                        help='Wav2Lip batch sizes, batches are padded to the nearest bucket at inference time')
+    parser.add_argument('--export_dir', type=str, default=EXPORT_DIR)
+    parser.add_argument('--format', type=str, default='torchscript', choices=['torchscript', 'onnx'])
+    parser.add_argument('--channels_last', action='store_true',
+                        help='Store Wav2Lip weights in channels_last, frozen weights can not be converted after export')
+    args = parser.parse_args()
+
+    os.makedirs(args.export_dir, exist_ok=True)
+    if args.format == 'onnx':
+        start = time.time()
+        wav2lip_path, s3fd_path = get_onnx_paths(args.export_dir)
+        export_wav2lip_onnx(load_model(args.checkpoint_path, 'cpu'), wav2lip_path)
+        export_s3fd_onnx(load_s3fd(args.s3fd_path, 'cpu'), s3fd_path)
+        print(f"exported to {args.export_dir} in {time.time() - start:.1f}s")
+        return
+
+    device = torch.device(args.device)
+    batch_buckets = sorted(set(args.batch_buckets))
+    wav2lip_path, s3fd_path, meta_path = get_exported_paths(device.type, args.export_dir)
+
+    start = time.time()
+    export_wav2lip(args.checkpoint_path, device, batch_buckets, channels_last=args.channels_last).save(wav2lip_path)
+    export_s3fd(args.s3fd_path, device).save(s3fd_path)
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump({"device": device.type, "batch_buckets": batch_buckets, "channels_last": args.channels_last,
+                   "torch_version": torch.__version__}, f)
+    print(f"exported to {args.export_dir} in {time.time() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+人脸检测结果缓存
+
+同一个模板视频会搭配不同音频反复使用, 以视频内容哈希和预处理参数为 key, 缓存逐帧的人脸框,
+命中时跳过人脸检测. 缓存的是按 pad 扩展后、平滑前的人脸框, 平滑在读取时按实际使用的帧数进行,
+因此不同长度的音频可以共用同一个缓存项, 结果与重新检测完全一致.
+"""
+import hashlib
+import json
+import logging
+from threading import Lock
+from typing import Optional
+
+import numpy as np
+
+from module.cache.disk_lru_cache import DiskLRUCache
+from utils.file_hash import file_sha256
+
+logger = logging.getLogger(__name__)
+
+
+class FaceBoxCache:
+    def __init__(self, cache_dir, max_bytes):
+        self.store = DiskLRUCache(cache_dir, max_bytes)
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(video_path, resize_factor, rotate, crop, pad, content_id=None, backend="opencv") -> str:
+        """根据视频内容和预处理参数生成缓存 key
+        :param content_id: 代替内容哈希的标识, 如边下载边处理时的 OSS ETag
+        :param backend: 视频解码后端, 不同后端解码出的像素可能略有差异, 检测结果分开缓存
+        """
+        params = json.dumps([float(resize_factor), bool(rotate), [int(c) for c in crop], [int(p) for p in pad],
+                             backend])
+        return hashlib.sha256(((content_id or file_sha256(video_path)) + params).encode()).hexdigest()
+
+    def get(self, key, num_frames) -> Optional[np.ndarray]:
+        """读取前 num_frames 帧的人脸框, 缓存不存在或帧数不足时返回 None
+        :param key: make_key 生成的 key
+        :param num_frames: 需要的帧数, None 表示需要整个视频
+        """
+        path = self.store.get_path(f"{key}.npz")
+        boxes = None
+        if path is not None:
+            try:
+                with np.load(path) as data:
+                    cached_boxes, complete = data["boxes"], bool(data["complete"])
+                # complete 表示缓存已覆盖整个视频, 视频帧数少于 num_frames 时也可以直接使用
+                if complete or (num_frames is not None and len(cached_boxes) >= num_frames):
+                    boxes = cached_boxes[:num_frames]
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"人脸框缓存 {path} 读取失败: {e}")
+
+        with self.lock:
+            if boxes is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return boxes
+
+    def put(self, key, boxes, complete=False):
+        """写入人脸框, 已有缓存覆盖的帧数不少于 boxes 时不覆盖
+        :param key: make_key 生成的 key
+        :param boxes: 逐帧的人脸框 [x1, y1, x2, y2]
+        :param complete: boxes 是否覆盖了整个视频
+        """
+        boxes = np.asarray(boxes)
+        path = self.store.get_path(f"{key}.npz")
+        if path is not None:
+            try:
+                with np.load(path) as data:
+                    if bool(data["complete"]) or (len(data["boxes"]) >= len(boxes) and not complete):
+                        return
+            except (OSError, ValueError, KeyError):
+                pass
+        with self.store.open_for_write(f"{key}.npz") as f:
+            np.savez(f, boxes=boxes, complete=np.array(complete))
+        logger.debug(f"人脸框缓存写入完成, 帧数: {len(boxes)}")
+
+    def stats(self):
+        stats = self.store.stats()
+        stats.update({"hits": self.hits, "misses": self.misses})
+        return stats
@@ -48,7 +48,7 @@ ROOT = os.path.dirname(os.path.abspath(__file__))
 
 class FaceAlignment:
     def __init__(self, landmarks_type, network_size=NetworkSize.LARGE,
-                 device='cuda', flip_input=False, face_detector='sfd', verbose=False):
+                 device='cuda', flip_input=False, face_detector='sfd', verbose=False, **face_detector_kwargs):
         self.device = device
         self.flip_input = flip_input
         self.landmarks_type = landmarks_type
@@ -62,7 +62,7 @@ class FaceAlignment:
         # Get the face detector
         face_detector_module = __import__('model.Wav2Lip.face_detection.detection.' + face_detector,
                                           globals(), locals(), [face_detector], 0)
-        self.face_detector = face_detector_module.FaceDetector(device=device, verbose=verbose)
+        self.face_detector = face_detector_module.FaceDetector(device=device, verbose=verbose, **face_detector_kwargs)
 
     def get_detections_for_batch(self, images):
         images = images[..., ::-1]
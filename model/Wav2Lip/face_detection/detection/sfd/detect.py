@@ -27,7 +27,7 @@ def detect(net, img, device):
     img = torch.from_numpy(img).float().to(device)
     BB, CC, HH, WW = img.size()
     with torch.no_grad():
-        olist = net(img)
+        olist = list(net(img))
 
     bboxlist = []
     for i in range(len(olist) // 2):
@@ -55,7 +55,12 @@ def detect(net, img, device):
 
     return bboxlist
 
-def batch_detect(net, imgs, device):
+def batch_detect(net, imgs, device, threshold=0.05):
+    """Run S3FD on a batch of images and decode every anchor with vectorized tensor ops.
+
+    Returns a list with one array of shape [num_boxes, 5] (x1, y1, x2, y2, score) per image,
+    keeping only the anchors whose face score is above ``threshold``.
+    """
     imgs = imgs - np.array([104, 117, 123])
     imgs = imgs.transpose(0, 3, 1, 2)
 
@@ -65,33 +70,33 @@ def batch_detect(net, imgs, device):
     imgs = torch.from_numpy(imgs).float().to(device)
     BB, CC, HH, WW = imgs.size()
     with torch.no_grad():
-        olist = net(imgs)
+        # TorchScript 导出的模型返回元组
+        olist = list(net(imgs))
 
-    bboxlist = []
     for i in range(len(olist) // 2):
         olist[i * 2] = F.softmax(olist[i * 2], dim=1)
     olist = [oelem.data.cpu() for oelem in olist]
+
+    variances = [0.1, 0.2]
+    boxes, scores = [], []
     for i in range(len(olist) // 2):
         ocls, oreg = olist[i * 2], olist[i * 2 + 1]
         FB, FC, FH, FW = ocls.size()  # feature map size
         stride = 2**(i + 2)    # 4,8,16,32,64,128
         anchor = stride * 4
-        poss = zip(*np.where(ocls[:, 1, :, :] > 0.05))
-        for Iindex, hindex, windex in poss:
-            axc, ayc = stride / 2 + windex * stride, stride / 2 + hindex * stride
-            score = ocls[:, 1, hindex, windex]
-            loc = oreg[:, :, hindex, windex].contiguous().view(BB, 1, 4)
-            priors = torch.Tensor([[axc / 1.0, ayc / 1.0, stride * 4 / 1.0, stride * 4 / 1.0]]).view(1, 1, 4)
-            variances = [0.1, 0.2]
-            box = batch_decode(loc, priors, variances)
-            box = box[:, 0] * 1.0
-            # cv2.rectangle(imgshow,(int(x1),int(y1)),(int(x2),int(y2)),(0,0,255),1)
-            bboxlist.append(torch.cat([box, score.unsqueeze(1)], 1).cpu().numpy())
-    bboxlist = np.array(bboxlist)
-    if 0 == len(bboxlist):
-        bboxlist = np.zeros((1, BB, 5))
-
-    return bboxlist
+        # priors of every position in this feature map, in (h, w) row-major order
+        hindex, windex = torch.meshgrid(torch.arange(FH), torch.arange(FW), indexing='ij')
+        priors = torch.stack([stride / 2 + windex * stride, stride / 2 + hindex * stride,
+                              torch.full_like(hindex, anchor), torch.full_like(hindex, anchor)], dim=-1)
+        priors = priors.float().view(1, FH * FW, 4)
+        loc = oreg.view(BB, 4, FH * FW).permute(0, 2, 1).contiguous()
+        boxes.append(batch_decode(loc, priors, variances))
+        scores.append(ocls[:, 1].reshape(BB, FH * FW))
+
+    dets = torch.cat([torch.cat(boxes, 1), torch.cat(scores, 1).unsqueeze(2)], 2).numpy()
+    keep = dets[:, :, 4] > threshold
+
+    return [dets[b][keep[b]] for b in range(BB)]
 
 def flip_detect(net, img, device):
     img = cv2.flip(img, 1)
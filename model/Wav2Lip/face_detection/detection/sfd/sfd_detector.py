@@ -14,9 +14,21 @@ models_urls = {
 
 
 class SFDDetector(FaceDetector):
-    def __init__(self, device, path_to_detector=os.path.join(os.path.dirname(os.path.abspath(__file__)), 's3fd.pth'), verbose=False):
+    def __init__(self, device, path_to_detector=os.path.join(os.path.dirname(os.path.abspath(__file__)), 's3fd.pth'), verbose=False,
+                 path_to_scripted=None, net=None):
         super(SFDDetector, self).__init__(device, verbose)
 
+        # 外部传入的检测网络, 如 ONNX Runtime 封装, 需要接收 NCHW 张量并返回 6 组 (cls, reg) 输出
+        if net is not None:
+            self.face_detector = net
+            return
+
+        # 优先使用导出的 TorchScript 模型, 跳过构建网络和加载权重
+        if path_to_scripted is not None and os.path.isfile(path_to_scripted):
+            self.face_detector = torch.jit.load(path_to_scripted, map_location=device)
+            self.face_detector.eval()
+            return
+
         # Initialise the face detector
         if not os.path.isfile(path_to_detector):
             model_weights = load_url(models_urls['s3fd'])
@@ -40,8 +52,7 @@ class SFDDetector(FaceDetector):
 
     def detect_from_batch(self, images):
         bboxlists = batch_detect(self.face_detector, images, device=self.device)
-        keeps = [nms(bboxlists[:, i, :], 0.3) for i in range(bboxlists.shape[1])]
-        bboxlists = [bboxlists[keep, i, :] for i, keep in enumerate(keeps)]
+        bboxlists = [bboxlist[nms(bboxlist, 0.3)] for bboxlist in bboxlists]
         bboxlists = [[x for x in bboxlist if x[-1] > 0.5] for bboxlist in bboxlists]
 
         return bboxlists
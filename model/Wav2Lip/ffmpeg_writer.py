@@ -0,0 +1,73 @@
+"""
+通过管道把原始视频帧直接写入 ffmpeg 编码
+
+只启动一个 ffmpeg 进程, 在同一次编码中混入音频, 不再写中间的 avi 文件
+"""
+import logging
+import subprocess
+import tempfile
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class FFmpegVideoWriter:
+    def __init__(self, output_path, fps, frame_size, audio_path=None, codec="libx264", preset="veryfast", crf=23,
+                 audio_codec="aac", ffmpeg_binary="ffmpeg"):
+        """
+        :param output_path: 输出文件路径
+        :param fps: 帧率
+        :param frame_size: 帧尺寸 (宽, 高), 写入的帧必须都是这个尺寸的 BGR uint8 图像
+        :param audio_path: 需要混入的音频, 为 None 时只输出视频
+        :param codec: 视频编码器
+        :param preset: 编码速度预设
+        :param crf: 质量参数, 越小质量越高
+        :param audio_codec: 音频编码器
+        """
+        self.output_path = output_path
+        self.frame_size = frame_size
+        frame_w, frame_h = frame_size
+
+        command = [ffmpeg_binary, '-y', '-loglevel', 'warning',
+                   '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{frame_w}x{frame_h}', '-r', str(fps),
+                   '-i', 'pipe:0']
+        if audio_path is not None:
+            command += ['-i', audio_path, '-map', '0:v:0', '-map', '1:a:0', '-c:a', audio_codec]
+        command += ['-c:v', codec, '-preset', preset, '-crf', str(crf), '-pix_fmt', 'yuv420p']
+        if frame_w % 2 or frame_h % 2:
+            # yuv420p 要求宽高为偶数
+            command += ['-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2']
+        command += [output_path]
+
+        # stderr 写入临时文件, 避免管道写满导致 ffmpeg 阻塞
+        self.stderr = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=self.stderr)
+
+    def write(self, frame):
+        try:
+            self.process.stdin.write(np.ascontiguousarray(frame, dtype=np.uint8).data)
+        except BrokenPipeError:
+            self.process.wait()
+            raise RuntimeError(f"ffmpeg 编码失败: {self._read_stderr()}")
+
+    def close(self):
+        """结束写入并等待 ffmpeg 完成编码"""
+        self.process.stdin.close()
+        return_code = self.process.wait()
+        stderr = self._read_stderr()
+        self.stderr.close()
+        if return_code != 0:
+            raise RuntimeError(f"ffmpeg 编码失败 ({return_code}): {stderr}")
+        if stderr:
+            logger.warning(stderr)
+
+    def abort(self):
+        """出错时终止 ffmpeg 进程"""
+        self.process.kill()
+        self.process.wait()
+        self.stderr.close()
+
+    def _read_stderr(self):
+        self.stderr.seek(0)
+        return self.stderr.read().decode(errors="ignore").strip()
@@ -1,3 +1,4 @@
+from collections import deque
 from os import listdir, path
 import numpy as np
 import scipy, cv2, os, sys, argparse
@@ -73,6 +74,34 @@ def get_smoothened_boxes(boxes, T):
     return boxes
 
 
+def iter_smoothened_boxes(boxes, T):
+    """
+    get_smoothened_boxes 的流式版本, 逐个消费人脸框并输出平滑结果, 只缓存 T 个框,
+    输出与 get_smoothened_boxes 完全一致 (包括末尾窗口复用已平滑结果的行为)
+    """
+    pending = deque()
+    smoothed = deque(maxlen=T)
+    dtype = None
+    for box in boxes:
+        box = np.asarray(box)
+        dtype = box.dtype
+        pending.append(box)
+        if len(pending) == T:
+            out = np.mean(pending, axis=0).astype(dtype)
+            smoothed.append(out)
+            pending.popleft()
+            yield out
+
+    if not pending:
+        return
+    # 末尾不足 T 个框时, 窗口固定为最后 T 个框, 其中已输出的部分使用平滑后的值
+    head = list(smoothed)[-(T - len(pending)):]
+    tail = np.array(head + list(pending), dtype=dtype)
+    for i in range(len(head), len(tail)):
+        tail[i] = np.mean(tail[len(tail) - T:], axis=0)
+        yield tail[i]
+
+
 def face_detect(images):
     detector = face_detection.FaceAlignment(face_detection.LandmarksType._2D,
                                             flip_input=False, device=device)
@@ -173,7 +202,7 @@ def _load(checkpoint_path, device='cuda'):
     return checkpoint
 
 
-def load_model(path, device='cuda'):
+def load_model(path, device='cuda', channels_last=False):
     model = Wav2Lip()
     print("Load checkpoint from: {}".format(path))
     checkpoint = _load(path, device=device)
@@ -184,9 +213,46 @@ def load_model(path, device='cuda'):
     model.load_state_dict(new_s)
 
     model = model.to(device)
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
     return model.eval()
 
 
+# 推理精度对应的 autocast 数据类型, 权重始终保持 fp32; int8 使用 quantization.py 导出的量化模型, 不需要 autocast
+PRECISION_DTYPES = {"fp32": None, "bf16": torch.bfloat16, "fp16": torch.float16, "int8": None}
+
+
+def resolve_precision(precision, device):
+    """检查推理精度是否受设备支持, 不支持时回退到 fp32"""
+    if precision not in PRECISION_DTYPES:
+        raise ValueError(f"不支持的推理精度: {precision}, 可选: {list(PRECISION_DTYPES)}")
+    device = torch.device(device)
+    if precision == "fp16" and device.type != "cuda":
+        print("fp16 only supported on cuda, falling back to fp32")
+        return "fp32"
+    if precision == "int8" and device.type != "cpu":
+        print("int8 only supported on cpu, falling back to fp32")
+        return "fp32"
+    if precision == "bf16" and device.type == "cuda" and not torch.cuda.is_bf16_supported():
+        print("bf16 not supported on this gpu, falling back to fp32")
+        return "fp32"
+    return precision
+
+
+def run_model(model, mel_batch, img_batch, precision="fp32", channels_last=False):
+    """
+    执行一次前向, 输入为 NCHW 张量, 输出为 float32 的 NCHW 张量
+    """
+    dtype = PRECISION_DTYPES[precision]
+    if channels_last:
+        mel_batch = mel_batch.contiguous(memory_format=torch.channels_last)
+        img_batch = img_batch.contiguous(memory_format=torch.channels_last)
+    with torch.inference_mode(), torch.autocast(device_type=img_batch.device.type, dtype=dtype,
+                                                enabled=dtype is not None):
+        pred = model(mel_batch, img_batch)
+    return pred.float()
+
+
 def main():
     if not os.path.isfile(args.face):
         raise ValueError('--face argument must be a valid path to video/image file')
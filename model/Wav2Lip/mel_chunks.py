@@ -0,0 +1,55 @@
+"""
+梅尔频谱分块
+
+每个视频帧对应一个 80x16 的梅尔频谱窗口, 第 i 帧窗口起点为 int(i * 80 / fps), 最后再补一个以频谱末尾结束的窗口.
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+MEL_STEP_SIZE = 16
+
+
+class MelChunks:
+    """
+    梅尔频谱分块, 不复制数据
+
+    窗口起点不等距 (80 / fps 通常不是整数), 无法用单个跨步视图表示, 这里保存整段频谱的滑动窗口视图
+    (num_windows, 80, 16) 和每帧的起点. 整数索引和迭代返回视图, 切片时才复制出一个批次的数据.
+    """
+
+    def __init__(self, mel, starts):
+        self.windows = sliding_window_view(mel, MEL_STEP_SIZE, axis=1).transpose(1, 0, 2)
+        self.starts = starts
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        return self.windows[self.starts[index]]
+
+    def __iter__(self):
+        for start in self.starts:
+            yield self.windows[start]
+
+    @property
+    def shape(self):
+        return (len(self.starts),) + self.windows.shape[1:]
+
+
+def split_mel_chunks(mel, fps) -> MelChunks:
+    """
+    按视频帧率把梅尔频谱切分为每帧一个窗口
+    :param mel: 梅尔频谱, (80, 时间步)
+    :param fps: 视频帧率
+    """
+    mel_length = mel.shape[1]
+    if mel_length < MEL_STEP_SIZE:
+        raise ValueError(f"音频过短, 梅尔频谱长度 {mel_length} 小于 {MEL_STEP_SIZE}")
+    mel_idx_multiplier = 80. / fps
+    last_start = mel_length - MEL_STEP_SIZE
+    # 多取几个候选起点, 保证至少有一个越过末尾
+    candidates = (np.arange(int((last_start + 1) / mel_idx_multiplier) + 3) * mel_idx_multiplier).astype(np.int64)
+    starts = candidates[candidates <= last_start]
+    # 最后一个窗口与频谱末尾对齐
+    starts = np.append(starts, last_start)
+    return MelChunks(mel, starts)
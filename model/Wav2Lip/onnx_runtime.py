@@ -0,0 +1,46 @@
+"""
+ONNX Runtime 会话和 S3FD 封装, onnxruntime 为可选依赖, 在创建会话时才导入
+"""
+import os
+
+import numpy as np
+import torch
+
+
+def create_session(model_path, device, intra_op_threads=0):
+    """
+    创建 ONNX Runtime 会话, CUDA 设备优先使用 CUDAExecutionProvider, 不可用时回退到 CPU
+    :param intra_op_threads: 单个算子使用的线程数, 0 表示由 ONNX Runtime 决定
+    """
+    try:
+        import onnxruntime as ort
+    except ImportError as e:
+        raise ImportError("wav2lip_backend=onnx 需要安装 onnxruntime 或 onnxruntime-gpu") from e
+
+    if not os.path.isfile(model_path):
+        raise FileNotFoundError(f"ONNX 模型不存在: {model_path}, 请先执行 python -m model.Wav2Lip.export --format onnx")
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = intra_op_threads
+    providers = ["CPUExecutionProvider"]
+    if device.type == "cuda" and "CUDAExecutionProvider" in ort.get_available_providers():
+        providers.insert(0, ("CUDAExecutionProvider", {"device_id": device.index or 0}))
+    return ort.InferenceSession(model_path, sess_options=options, providers=providers)
+
+
+class OnnxS3FD:
+    """
+    S3FD 的 ONNX Runtime 封装, 输入输出与 torch 版本相同, 供 batch_detect 直接调用
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.input_name = session.get_inputs()[0].name
+
+    def __call__(self, images: torch.Tensor):
+        outputs = self.session.run(None, {self.input_name: images.detach().cpu().numpy().astype(np.float32)})
+        return [torch.from_numpy(output) for output in outputs]
+
+    def eval(self):
+        return self
@@ -0,0 +1,73 @@
+"""
+批量贴回预测的人脸
+
+平滑后的人脸框尺寸在相邻帧之间通常相同, 按 (宽, 高) 分组后, 同组的预测结果以 uint8 channels_last 张量
+一次 F.interpolate 完成缩放, 再写回各自的原始帧. 与逐帧 cv2.resize 相比像素值最多相差 1.
+"""
+from collections import defaultdict
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+
+class FacePaster:
+    """
+    按人脸框尺寸分组批量缩放预测结果并贴回原始帧, uint8 转换缓冲区在批次之间复用
+    """
+
+    def __init__(self):
+        self.buffer = None
+
+    def _to_uint8(self, pred):
+        # 与逐帧 astype(np.uint8) 的截断方式相同, 写入复用的缓冲区
+        if self.buffer is None or self.buffer.shape[1:] != pred.shape[1:] or len(self.buffer) < len(pred):
+            self.buffer = np.empty(pred.shape, dtype=np.uint8)
+        buffer = self.buffer[:len(pred)]
+        np.copyto(buffer, pred, casting="unsafe")
+        return buffer
+
+    def paste(self, pred, frames, coords):
+        """
+        :param pred: (N, H, W, 3) 0~255 的预测结果
+        :param frames: N 个原始帧, 原地修改
+        :param coords: N 个 (y1, y2, x1, x2) 人脸框
+        """
+        groups = defaultdict(list)
+        for i, (y1, y2, x1, x2) in enumerate(coords):
+            groups[(y2 - y1, x2 - x1)].append(i)
+
+        # NHWC 内存上的 NCHW 视图即 channels_last, uint8 双线性插值在该格式上有向量化实现
+        faces = torch.from_numpy(self._to_uint8(pred)).permute(0, 3, 1, 2)
+        for size, indices in groups.items():
+            group = faces if len(indices) == len(faces) else faces[indices]
+            resized = F.interpolate(group, size=size, mode="bilinear", align_corners=False)
+            resized = resized.permute(0, 2, 3, 1).numpy()
+            for face, i in zip(resized, indices):
+                y1, y2, x1, x2 = coords[i]
+                frames[i][y1:y2, x1:x2] = face
+        return frames
+
+
+if __name__ == '__main__':
+    # 逐帧与批量贴回耗时对比: python -m model.Wav2Lip.paste_back
+    import time
+
+    import cv2
+
+    rng = np.random.default_rng(0)
+    pred = rng.random((128, 96, 96, 3)) * 255
+    coords = [(100, 300, 200, 400)] * 128
+    frames = [np.ones((720, 1280, 3), dtype=np.uint8) for _ in range(128)]
+
+    def paste_per_frame():
+        for p, f, (y1, y2, x1, x2) in zip(pred, frames, coords):
+            f[y1:y2, x1:x2] = cv2.resize(p.astype(np.uint8), (x2 - x1, y2 - y1))
+
+    paster = FacePaster()
+    for name, paste in (("逐帧", paste_per_frame), ("批量", lambda: paster.paste(pred, frames, coords))):
+        paste()
+        start = time.perf_counter()
+        for _ in range(10):
+            paste()
+        print(f"{name}: {(time.perf_counter() - start) * 100:.1f}ms / 128 帧")
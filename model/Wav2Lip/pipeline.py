@@ -0,0 +1,131 @@
+"""
+推理流水线工具
+
+批次生成、模型前向、贴回和编码分别在不同线程中执行, 线程之间通过有界队列传递数据,
+模型推理第 N+1 个批次时, 第 N 个批次的贴回和编码同时进行.
+"""
+import queue
+import threading
+
+import torch
+
+_END = object()
+
+
+class BackgroundGenerator:
+    """
+    在后台线程中迭代 iterable, 通过有界队列输出结果, 后台线程中的异常会在消费端重新抛出
+    """
+
+    def __init__(self, iterable, max_size=2):
+        self.queue = queue.Queue(max_size)
+        self.stopped = threading.Event()
+        self.finished = False
+        self.thread = threading.Thread(target=self._run, args=(iterable,), daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self, iterable):
+        error = None
+        try:
+            for item in iterable:
+                if not self._put(item):
+                    break
+        except BaseException as e:
+            error = e
+        finally:
+            # 提前停止时在生成器所在的线程中关闭它, 释放视频解码等资源
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                close()
+        self._put((_END, error))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.finished:
+            raise StopIteration
+        item = self.queue.get()
+        if isinstance(item, tuple) and len(item) == 2 and item[0] is _END:
+            self.finished = True
+            if item[1] is not None:
+                raise item[1]
+            raise StopIteration
+        return item
+
+    def close(self):
+        """停止后台线程, 未消费的结果会被丢弃"""
+        self.finished = True
+        self.stopped.set()
+        self.thread.join()
+
+
+class BackgroundWorker:
+    """
+    在后台线程中按提交顺序执行 func, 队列满时 submit 阻塞; func 出错后丢弃后续任务,
+    错误在下一次 submit 或 join 时抛出
+    """
+
+    def __init__(self, func, max_size=2):
+        self.func = func
+        self.queue = queue.Queue(max_size)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            args = self.queue.get()
+            if args is _END:
+                return
+            if self.error is not None:
+                continue
+            try:
+                self.func(*args)
+            except BaseException as e:
+                self.error = e
+
+    def submit(self, *args):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(args)
+
+    def close(self):
+        """等待已提交的任务执行完毕, 不抛出错误"""
+        if self.thread.is_alive():
+            self.queue.put(_END)
+            self.thread.join()
+
+    def join(self):
+        """等待已提交的任务执行完毕, 执行出错时抛出错误"""
+        self.close()
+        if self.error is not None:
+            raise self.error
+
+
+class PinnedBuffers:
+    """
+    为每个输入维护一块可复用的固定内存 (pinned memory), 主机到 GPU 的拷贝可以异步进行
+    """
+
+    def __init__(self):
+        self.buffers = {}
+
+    def to_device(self, name, tensor, device):
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.shape[1:] != tensor.shape[1:] or buffer.shape[0] < tensor.shape[0]:
+            buffer = torch.empty(tensor.shape, dtype=torch.float32, pin_memory=True)
+            self.buffers[name] = buffer
+        staging = buffer[:tensor.shape[0]]
+        # 同一 CUDA 流上前一个批次的推理结果取回时已经同步, 复用缓冲区是安全的
+        staging.copy_(tensor)
+        return staging.to(device, non_blocking=True)
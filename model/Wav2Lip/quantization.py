@@ -0,0 +1,127 @@
+"""
+Wav2Lip INT8 静态量化 (CPU)
+
+    python -m model.Wav2Lip.quantization --videos a.mp4 b.mp4 --audios a.wav b.wav
+
+使用 FX 图模式量化: Conv2d / ConvTranspose2d 与 BatchNorm、ReLU 融合后量化为 INT8, 激活值的量化参数
+由样例模板视频和音频经 Wav2LipHandle 预处理后得到的批次校准. 量化后的模型 trace 为 TorchScript,
+保存到 models/exported/wav2lip.int8.pt, 配置 wav2lip_precision=int8 时由 Wav2LipHandle 加载.
+"""
+import argparse
+import os
+import time
+
+import torch
+from torch import nn
+
+from model.Wav2Lip.export import EXPORT_DIR
+from model.Wav2Lip.inference import load_model
+from model.Wav2Lip.models.wav2lip import Wav2Lip
+
+CURRENT_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+def get_quantized_path(export_dir=EXPORT_DIR):
+    return os.path.join(export_dir, "wav2lip.int8.pt")
+
+
+class Wav2LipInference(nn.Module):
+    """
+    只包含推理用的 4 维输入路径, Wav2Lip.forward 中按输入维度分支的写法无法被 FX 符号追踪
+    """
+
+    def __init__(self, model: Wav2Lip):
+        super().__init__()
+        self.audio_encoder = model.audio_encoder
+        self.face_encoder_blocks = model.face_encoder_blocks
+        self.face_decoder_blocks = model.face_decoder_blocks
+        self.output_block = model.output_block
+
+    def forward(self, audio_sequences, face_sequences):
+        x = self.audio_encoder(audio_sequences)
+        feats = []
+        face = face_sequences
+        for f in self.face_encoder_blocks:
+            face = f(face)
+            feats.append(face)
+        for f in self.face_decoder_blocks:
+            x = f(x)
+            x = torch.cat((x, feats.pop()), dim=1)
+        return self.output_block(x)
+
+
+def prepare_model(model: Wav2Lip, backend="x86"):
+    """插入观察器, 返回待校准的模型"""
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx
+
+    torch.backends.quantized.engine = backend
+    example = (torch.zeros((1, 1, 80, 16)), torch.zeros((1, 6, 96, 96)))
+    return prepare_fx(Wav2LipInference(model.cpu().eval()), get_default_qconfig_mapping(backend), example)
+
+
+def convert_model(prepared, batch_size=16):
+    """转换为 INT8 模型并 trace 为 TorchScript"""
+    from torch.ao.quantization.quantize_fx import convert_fx
+
+    quantized = convert_fx(prepared).eval()
+    example = (torch.zeros((batch_size, 1, 80, 16)), torch.zeros((batch_size, 6, 96, 96)))
+    with torch.no_grad():
+        return torch.jit.freeze(torch.jit.trace(quantized, example))
+
+
+def calibrate(prepared, batches):
+    """
+    :param batches: (mel_batch, img_batch) NCHW 张量, 与推理时的输入相同
+    :return: 使用的批次数
+    """
+    count = 0
+    with torch.no_grad():
+        for mel_batch, img_batch in batches:
+            prepared(mel_batch, img_batch)
+            count += 1
+    return count
+
+
+def iter_template_batches(handle, videos, audios, max_batches=None):
+    """使用 Wav2LipHandle 的预处理生成校准批次"""
+    from model.Wav2Lip.wav2lip_handle import Wav2LipInputModel
+
+    count = 0
+    for video_path, audio_path in zip(videos, audios):
+        input_data = handle.preprocess(Wav2LipInputModel(video_path=video_path, audio_path=audio_path))
+        for img_batch, mel_batch, _, _ in input_data[0]:
+            if max_batches is not None and count >= max_batches:
+                return
+            count += 1
+            yield (torch.from_numpy(mel_batch).permute(0, 3, 1, 2).float(),
+                   torch.from_numpy(img_batch).permute(0, 3, 1, 2).float())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Calibrate and export an INT8 Wav2Lip model for CPU inference')
+    parser.add_argument('--checkpoint_path', type=str, default=os.path.join(CURRENT_PATH, "models", "wav2lip.pth"))
+    parser.add_argument('--videos', nargs='+', required=True, help='Sample template videos used for calibration')
+    parser.add_argument('--audios', nargs='+', required=True, help='Audio paired with each video')
+    parser.add_argument('--max_batches', type=int, default=None)
+    parser.add_argument('--backend', type=str, default='x86', choices=['x86', 'fbgemm', 'qnnpack', 'onednn'])
+    parser.add_argument('--output', type=str, default=get_quantized_path())
+    args = parser.parse_args()
+    if len(args.videos) != len(args.audios):
+        parser.error('--videos and --audios must have the same length')
+
+    from model.Wav2Lip.wav2lip_handle import Wav2LipHandle
+
+    start = time.time()
+    handle = Wav2LipHandle(device="cpu")
+    handle.warmup = False
+    handle.initialize()
+    prepared = prepare_model(load_model(args.checkpoint_path, "cpu"), args.backend)
+    count = calibrate(prepared, iter_template_batches(handle, args.videos, args.audios, args.max_batches))
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    convert_model(prepared).save(args.output)
+    print(f"calibrated on {count} batches, saved to {args.output} in {time.time() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
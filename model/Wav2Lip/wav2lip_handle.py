@@ -1,7 +1,7 @@
+import itertools
 import os
-import platform
-import subprocess
-from typing import Optional
+from collections import deque
+from typing import Any, Optional
 import cv2
 import numpy as np
 from torch import Tensor
@@ -10,10 +10,23 @@ from model.Interface import BaseHandle
 import torch
 from pydantic import BaseModel
 from model.Wav2Lip import audio
-from model.Wav2Lip.inference import load_model, get_smoothened_boxes
+from model.Wav2Lip.mel_chunks import split_mel_chunks
+from model.Wav2Lip.inference import load_model, get_smoothened_boxes, iter_smoothened_boxes, resolve_precision, \
+    run_model
+from model.Wav2Lip.avatar_template import AvatarTemplateBundle, AvatarTemplateStore
+from model.Wav2Lip.face_box_cache import FaceBoxCache
+from model.Wav2Lip.batch_scheduler import InferenceScheduler
+from model.Wav2Lip.export import get_exported_paths, load_export_meta
+from model.Wav2Lip.ffmpeg_writer import FFmpegVideoWriter
+from model.Wav2Lip.paste_back import FacePaster
+from model.Wav2Lip.pipeline import BackgroundGenerator, BackgroundWorker, PinnedBuffers
+from model.Wav2Lip.quantization import get_quantized_path
 from model.Wav2Lip.face_detection.api import FaceAlignment, LandmarksType
+from model.video_decoder import get_pyav_fps
 from module.config.env_config import config
 import logging
+from module.cache.memory_lru_cache import MemoryLRUCache
+from utils.file_hash import file_sha256
 from utils.snowflake import Snowflake
 
 from GFPGAN.gfpgan_handle import GFPGANHandle
@@ -25,12 +38,16 @@ class Wav2LipInputModel(BaseModel):
     """
     Wav2Lip模型配置
     """
-    video_path: str
+    video_path: Optional[str] = None
+    # 正在下载到 video_path 的 GrowingFile, 设置时边下载边解码
+    video_stream: Optional[Any] = None
     audio_path: str
+    # 使用预处理好的模板代替 video_path, 跳过视频解码和人脸检测
+    template_id: Optional[int] = None
     improve_video: Optional[bool] = False
     # If True, then use only first video frame for inference
     resize_factor: Optional[float] = config.get("resize_factor", 1, dtype=float)
-    rotate: Optional[bool] = config.get("rotate", False)
+    rotate: Optional[bool] = config.get("rotate", False, dtype=bool)
 
 
 class Wav2LipHandle(BaseHandle):
@@ -38,21 +55,73 @@ class Wav2LipHandle(BaseHandle):
     人脸识别处理类
     """
 
-    def __init__(self):
+    def __init__(self, device=None, temp_dir=None):
+        """
+        :param device: 推理设备, 如 cuda:1, 默认有 GPU 时使用 cuda
+        :param temp_dir: 临时输出目录, 多进程部署时每个进程使用独立的目录
+        """
         self.model = None
+        # 常驻的 S3FD 人脸检测器, 在 initialize 中加载
+        self.detector = None
         self.face_det_batch_size = config.get("face_det_batch_size", 1, dtype=int)
         self.box = (-1, -1, -1, -1)
         self.wav2lip_batch_size = config.get("wav2lip_batch_size", 128, dtype=int)
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.temp_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), config.get("temp_dir", "temp"))
+        self.device = torch.device(device or ("cuda" if torch.cuda.is_available() else "cpu"))
+        # 缓存和模板在同一节点的进程之间共享, 只有临时输出按进程区分
+        base_temp_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), config.get("temp_dir", "temp"))
+        self.temp_dir = temp_dir or base_temp_dir
+        os.makedirs(self.temp_dir, exist_ok=True)
         self.snowflake = Snowflake(2, 1)
         self.crop = [0, -1, 0, -1]
         self.static = False
         self.img_size = 96
         self.pad = [0, 10, 0, 0]
         self.nosmooth = False
+        # 流式模式: 解码、人脸检测、推理和编码以生成器串联, 内存占用与视频长度无关
+        self.stream_mode = config.get("wav2lip_stream_mode", True, dtype=bool)
+        # 启动时预热模型, 避免首个任务承担 cuDNN 自动调优的耗时
+        self.warmup = config.get("wav2lip_warmup", True, dtype=bool)
+        self.warmup_frame_size = (config.get("warmup_frame_height", 720, dtype=int),
+                                  config.get("warmup_frame_width", 1280, dtype=int))
         self.current_path = os.path.dirname(os.path.abspath(__file__))
-        
+        # 输出视频编码参数
+        self.ffmpeg_codec = config.get("ffmpeg_codec", "libx264")
+        self.ffmpeg_preset = config.get("ffmpeg_preset", "veryfast")
+        self.ffmpeg_crf = config.get("ffmpeg_crf", 23, dtype=int)
+        # 视频解码后端, opencv 或 pyav
+        self.video_decoder_backend = config.get("video_decoder_backend", "opencv")
+        # 梅尔频谱计算后端, librosa 或 torch
+        self.mel_backend = config.get("wav2lip_mel_backend", "librosa")
+        # 推理精度 fp32 / bf16 / fp16 / int8, 设备不支持时回退到 fp32; channels_last 内存格式对 CPU 和 Tensor Core 更友好
+        self.precision = resolve_precision(config.get("wav2lip_precision", "fp32"), self.device)
+        self.channels_last = config.get("wav2lip_channels_last", False, dtype=bool)
+        # 优先加载 export.py 导出的 TorchScript 模型, 批次档位从导出信息中读取
+        self.prefer_exported = config.get("wav2lip_prefer_exported", True, dtype=bool)
+        self.batch_buckets = []
+        # 推理流水线各阶段之间的队列长度, 限制同时驻留内存的批次数
+        self.pipeline_queue_size = config.get("wav2lip_pipeline_queue_size", 2, dtype=int)
+        # 按人脸框尺寸分组批量缩放贴回预测结果, 关闭时逐帧 cv2.resize
+        self.batch_paste = config.get("wav2lip_batch_paste", True, dtype=bool)
+        # 跨任务动态批处理, 多个任务线程的批次合并后统一前向
+        self.batch_scheduler_enabled = config.get("wav2lip_batch_scheduler_enabled", False, dtype=bool)
+        self.batch_max_wait_ms = config.get("wav2lip_batch_max_wait_ms", 10, dtype=float)
+        self.scheduler = None
+        # 人脸检测结果缓存, 同一模板视频搭配不同音频时跳过人脸检测
+        self.face_box_cache = None
+        if config.get("face_box_cache_enabled", True, dtype=bool):
+            self.face_box_cache = FaceBoxCache(
+                config.get("face_box_cache_dir", os.path.join(base_temp_dir, "face_box_cache")),
+                config.get("face_box_cache_max_bytes", 256 * 1024 * 1024, dtype=int))
+        # 音频特征缓存, 同一段音频搭配多个模板视频时跳过解码、重采样和梅尔频谱计算
+        self.audio_feature_cache = None
+        if config.get("audio_feature_cache_enabled", True, dtype=bool):
+            self.audio_feature_cache = MemoryLRUCache(
+                config.get("audio_feature_cache_max_bytes", 64 * 1024 * 1024, dtype=int))
+        self.avatar_templates = AvatarTemplateStore(
+            config.get("avatar_template_dir", os.path.join(base_temp_dir, "avatar_templates")),
+            config.get("avatar_template_frame_format", "raw"),
+            config.get("avatar_template_max_frame_bytes", 16 * 1024 ** 3, dtype=int),
+            config.get("avatar_template_frame_quality", 95, dtype=int))
 
         self.GFPGanHandle = GFPGANHandle()
 
@@ -60,135 +129,285 @@ class Wav2LipHandle(BaseHandle):
         """
         初始化人脸识别模型
         """
-        self.model = load_model(os.path.join(self.current_path,"models/wav2lip.pth"), self.device)
+        self._load_models()
+        if self.warmup:
+            self.warm_up()
+        if self.batch_scheduler_enabled:
+            scheduler_buffers = PinnedBuffers()
+            self.scheduler = InferenceScheduler(lambda mel_batch, img_batch: self._forward(mel_batch, img_batch,
+                                                                                            scheduler_buffers),
+                                                self.wav2lip_batch_size, self.batch_max_wait_ms)
+            self.scheduler.start()
+
+    def _load_models(self):
+        """
+        加载 Wav2Lip 模型和 S3FD 人脸检测器
+        """
+        wav2lip_scripted, s3fd_scripted, export_meta = get_exported_paths(self.device.type)
+        if not self.prefer_exported:
+            s3fd_scripted = None
+        if self.precision == "int8" and not os.path.exists(get_quantized_path()):
+            logger.warning(f"INT8 模型 {get_quantized_path()} 不存在, 使用 fp32 推理, "
+                           f"请先执行 python -m model.Wav2Lip.quantization 校准导出")
+            self.precision = "fp32"
+        if self.precision == "int8":
+            # quantization.py 校准导出的 INT8 模型, 批次为动态维度
+            self.model = torch.jit.load(get_quantized_path(), map_location=self.device)
+            self.batch_buckets = []
+            logger.info(f"加载 INT8 模型 {get_quantized_path()}")
+        elif self.prefer_exported and os.path.exists(wav2lip_scripted):
+            # 优先使用 export.py 导出的 TorchScript 模型
+            self.model = torch.jit.load(wav2lip_scripted, map_location=self.device)
+            meta = load_export_meta(export_meta)
+            self.batch_buckets = meta.get("batch_buckets", [])
+            # freeze 后权重是常量, 无法再转换内存格式, 输入使用导出时的格式
+            exported_channels_last = meta.get("channels_last", False)
+            if exported_channels_last != self.channels_last:
+                logger.warning(f"wav2lip_channels_last={self.channels_last} 与导出模型不一致, "
+                               f"使用导出时的 channels_last={exported_channels_last}, "
+                               f"如需切换请使用 python -m model.Wav2Lip.export 重新导出")
+                self.channels_last = exported_channels_last
+            logger.info(f"加载 TorchScript 模型 {wav2lip_scripted}, 批次档位: {self.batch_buckets}")
+        else:
+            self.model = load_model(os.path.join(self.current_path,"models/wav2lip.pth"), self.device,
+                                    channels_last=self.channels_last)
         logger.debug("Wav2Lip model loaded successfully")
+        self.detector = FaceAlignment(LandmarksType._2D, flip_input=False, device=str(self.device),
+                                      path_to_scripted=s3fd_scripted)
+        logger.debug("Face detector loaded successfully")
+
+    def warm_up(self):
+        """
+        使用空白数据分别执行一次人脸检测和 Wav2Lip 推理, 让权重常驻设备并完成 cuDNN 自动调优
+        """
+        frame_h, frame_w = self.warmup_frame_size
+        frames = np.zeros((self.face_det_batch_size, frame_h, frame_w, 3), dtype=np.uint8)
+        self.detector.get_detections_for_batch(frames)
+
+        # 与实际推理使用相同的精度和内存格式, 有批次档位时每个档位都预热一次
+        for batch_size in self.batch_buckets or [self.wav2lip_batch_size]:
+            img_batch = np.zeros((batch_size, self.img_size, self.img_size, 6), dtype=np.float32)
+            mel_batch = np.zeros((batch_size, 80, 16, 1), dtype=np.float32)
+            self._forward(mel_batch, img_batch)
+        logger.info("Wav2Lip 模型预热完成")
 
     def preprocess(self, raw_data: Wav2LipInputModel):
         """
         预处理输入数据
         """
         # 音频数据处理
-        wav = self.load_wav_from_file(raw_data.audio_path)
-        mel = audio.melspectrogram(wav)
+        mel = self._load_audio_features(raw_data.audio_path)
         logger.debug("Audio data processed successfully")
-        # 视频输入处理
-        video, fps = self.decode_video_from_file(raw_data.video_path, raw_data.resize_factor, raw_data.rotate,
-                                                 self.crop)
-        logger.debug("Video data processed successfully")
-        # 生成音频特征块
+        if raw_data.template_id is not None:
+            template = self.avatar_templates.load(raw_data.template_id)
+            mel_chunks = self.generate_audio_feature_chunks(mel, template.fps)
+            self._check_mel(mel)
+            gen_data = self.template_datagen(template, mel_chunks)
+            return gen_data, len(mel_chunks), None, template.fps, raw_data.audio_path, raw_data.improve_video
+
+        if self.stream_mode:
+            fps = self._get_video_fps(raw_data)
+            mel_chunks = self.generate_audio_feature_chunks(mel, fps)
+            self._check_mel(mel)
+            gen_data = self.stream_datagen(raw_data, mel_chunks)
+            logger.debug("流式数据生成器创建完成")
+            return gen_data, len(mel_chunks), None, fps, raw_data.audio_path, raw_data.improve_video
+
+        # 非流式模式一次解码所有帧, 等待视频下载完成
+        if raw_data.video_stream is not None:
+            raw_data.video_stream.wait()
+        # 生成音频特征块, 先确定需要的帧数再解码视频
+        fps = self.get_video_fps(raw_data.video_path)
         mel_chunks = self.generate_audio_feature_chunks(mel, fps)
 
-        if np.isnan(mel.reshape(-1)).sum() > 0:
-            raise ValueError(
-                'Mel contains nan! Using a TTS voice? Add a small epsilon noise to the wav file and try again')
+        self._check_mel(mel)
 
-        full_frames = video[:len(mel_chunks)]
+        # 视频输入处理, 只解码音频需要的帧, 视频比音频短时在 datagen 中循环使用
+        full_frames, _ = self.decode_video_from_file(raw_data.video_path, raw_data.resize_factor, raw_data.rotate,
+                                                     self.crop, max_frames=len(mel_chunks))
+        if not full_frames:
+            raise ValueError('Video contains no frames!')
+        logger.debug("Video data processed successfully")
 
         logger.debug("数据处理完成")
 
-        gen_data = self.datagen(full_frames.copy(), mel_chunks)
+        gen_data = self.datagen(full_frames, mel_chunks, self._get_face_box_cache_key(raw_data))
 
         logger.debug("数据生成完成")
 
         return gen_data, len(mel_chunks), full_frames, fps, raw_data.audio_path, raw_data.improve_video
 
+    def _load_audio_features(self, audio_path):
+        """
+        读取音频并计算梅尔频谱, 内容相同的音频直接使用缓存的梅尔频谱
+        """
+        cache_key = None
+        if self.audio_feature_cache is not None:
+            cache_key = f"{file_sha256(audio_path)}-{self.mel_backend}"
+            mel = self.audio_feature_cache.get(cache_key)
+            if mel is not None:
+                logger.debug(f"音频特征缓存命中 {cache_key}")
+                return mel
+
+        wav = self.load_wav_from_file(audio_path)
+        mel = self._melspectrogram(wav)
+        if cache_key is not None:
+            # 缓存的梅尔频谱被多个任务共享, 设为只读
+            mel.setflags(write=False)
+            self.audio_feature_cache.put(cache_key, mel, mel.nbytes)
+        return mel
+
+    def _melspectrogram(self, wav):
+        """
+        计算梅尔频谱, torch 后端在模型所在的设备上计算
+        """
+        if self.mel_backend == "torch":
+            return audio.melspectrogram_torch(wav, self.device).cpu().numpy()
+        return audio.melspectrogram(wav)
+
+    @staticmethod
+    def _check_mel(mel):
+        if np.isnan(mel.reshape(-1)).sum() > 0:
+            raise ValueError(
+                'Mel contains nan! Using a TTS voice? Add a small epsilon noise to the wav file and try again')
+
     def inference(self, input_data):
         """
         执行推理
         """
-        temp_file_name = self.snowflake.generate_temp_dir()
-        temp_file_full_path = f'{self.temp_dir}/{temp_file_name}.avi'
-
         output_file_full_path = f'{self.temp_dir}/{self.snowflake.generate_temp_dir()}.mp4'
 
         logger.debug("开始推理")
         logger.debug(self.device)
-        for i, (img_batch, mel_batch, frames, coords) in enumerate(tqdm(input_data[0],
-                                                                        total=int(
-                                                                            np.ceil(float(input_data[
-                                                                                              1])) / self.wav2lip_batch_size))):
-            if i == 0:
-                frame_h, frame_w = input_data[2][0].shape[:-1]
-                if input_data[5]:
-                    frame_h, frame_w = frame_h * 2, frame_w * 2
-                out = cv2.VideoWriter(temp_file_full_path,
-                                      cv2.VideoWriter_fourcc(*'DIVX'), input_data[3], (frame_w, frame_h))
-
-            img_batch = torch.FloatTensor(np.transpose(img_batch, (0, 3, 1, 2))).to(self.device)
-            mel_batch = torch.FloatTensor(np.transpose(mel_batch, (0, 3, 1, 2))).to(self.device)
-
-            with torch.no_grad():
-                pred = self.model(mel_batch, img_batch)
-
-            pred = pred.cpu().numpy().transpose(0, 2, 3, 1) * 255.
-
-            for p, f, c in zip(pred, frames, coords):
-                y1, y2, x1, x2 = c
-                p = cv2.resize(p.astype(np.uint8), (x2 - x1, y2 - y1))
+        out = None
+        compositor = None
+        pinned_buffers = PinnedBuffers()
+        # 批次在后台线程中生成, 贴回和编码在另一个后台线程中进行, 主线程只负责模型前向
+        batches = BackgroundGenerator(input_data[0], self.pipeline_queue_size)
+        try:
+            for i, (img_batch, mel_batch, frames, coords) in enumerate(tqdm(batches,
+                                                                            total=int(
+                                                                                np.ceil(float(input_data[
+                                                                                                  1])) / self.wav2lip_batch_size))):
+                if i == 0:
+                    frame_h, frame_w = frames[0].shape[:-1]
+                    if input_data[5]:
+                        frame_h, frame_w = frame_h * 2, frame_w * 2
+                    # 原始帧通过管道直接交给 ffmpeg, 一次编码并混入音频
+                    out = FFmpegVideoWriter(output_file_full_path, input_data[3], (frame_w, frame_h), input_data[4],
+                                            codec=self.ffmpeg_codec, preset=self.ffmpeg_preset, crf=self.ffmpeg_crf)
+                    compositor = BackgroundWorker(self._composite_batch, self.pipeline_queue_size)
+                    paster = FacePaster() if self.batch_paste else None
+
+                pred = self._predict(mel_batch, img_batch, pinned_buffers)
+                compositor.submit(pred, frames, coords, out, input_data[5], paster)
+
+            if compositor is not None:
+                compositor.join()
+        except BaseException:
+            batches.close()
+            if compositor is not None:
+                compositor.close()
+            if out is not None:
+                out.abort()
+            raise
+
+        out.close()
+        logger.debug("推理及合成完成")
+        return output_file_full_path
+
+    def _predict(self, mel_batch, img_batch, pinned_buffers=None):
+        """
+        执行一次推理, 开启动态批处理时交给调度器与其他任务的批次合并执行
+        """
+        if self.scheduler is not None:
+            return self.scheduler.submit(mel_batch, img_batch).result()
+        return self._forward(mel_batch, img_batch, pinned_buffers)
+
+    def _forward(self, mel_batch, img_batch, pinned_buffers=None):
+        """
+        执行一次模型前向, 输入为 NHWC 的 numpy 批次, 返回 NHWC 的 0~255 预测结果
+        """
+        batch_size = len(mel_batch)
+        bucket = self._get_batch_bucket(batch_size)
+        if bucket > batch_size:
+            # 补齐到导出时的批次档位, 保持输入形状固定
+            mel_batch = np.pad(mel_batch, [(0, bucket - batch_size)] + [(0, 0)] * (mel_batch.ndim - 1))
+            img_batch = np.pad(img_batch, [(0, bucket - batch_size)] + [(0, 0)] * (img_batch.ndim - 1))
+        mel_batch = torch.from_numpy(mel_batch).permute(0, 3, 1, 2)
+        img_batch = torch.from_numpy(img_batch).permute(0, 3, 1, 2)
+        if pinned_buffers is not None and self.device.type == 'cuda':
+            mel_batch = pinned_buffers.to_device("mel", mel_batch, self.device)
+            img_batch = pinned_buffers.to_device("img", img_batch, self.device)
+        else:
+            mel_batch = mel_batch.to(self.device, torch.float32, memory_format=torch.contiguous_format)
+            img_batch = img_batch.to(self.device, torch.float32, memory_format=torch.contiguous_format)
 
+        pred = run_model(self.model, mel_batch, img_batch, self.precision, self.channels_last)[:batch_size]
 
-                f[y1:y2, x1:x2] = p
+        return pred.cpu().numpy().transpose(0, 2, 3, 1) * 255.
 
-                # GFP-GAN 提高视频质量
-                if input_data[5]:
-                    f = self.GFPGanHandle.handle_frame(f)
-                out.write(f)
+    def _get_batch_bucket(self, batch_size):
+        """不小于 batch_size 的最小批次档位, 没有档位或超过最大档位时不补齐"""
+        for bucket in self.batch_buckets:
+            if bucket >= batch_size:
+                return bucket
+        return batch_size
 
-        out.release()
-        logger.debug("推理完成")
+    def _composite_batch(self, pred, frames, coords, out, improve_video, paster=None):
+        """
+        把预测结果贴回原始帧并写入视频
+        :param paster: FacePaster, 按人脸框尺寸分组批量缩放贴回, None 时逐帧处理
+        """
+        if paster is not None:
+            paster.paste(pred, frames, coords)
+        for p, f, c in zip(pred, frames, coords):
+            if paster is None:
+                y1, y2, x1, x2 = c
+                f[y1:y2, x1:x2] = cv2.resize(p.astype(np.uint8), (x2 - x1, y2 - y1))
 
-        command = 'ffmpeg -y -loglevel warning -i {} -i {} -strict -2 -q:v 1 {} '.format(input_data[4], temp_file_full_path,
-                                                                      output_file_full_path)
-        subprocess.call(command, shell=platform.system() != 'Windows')
-        logger.debug("合成完成")
-        return output_file_full_path, temp_file_full_path
+            # GFP-GAN 提高视频质量
+            if improve_video:
+                f = self.GFPGanHandle.handle_frame(f)
+            out.write(f)
 
     def postprocess(self, output_data):
         """
         后处理输出数据,处理为可以返回的格式
         """
         # 读取视频文件为字节
-        with open(output_data[0], "rb") as f:
+        with open(output_data, "rb") as f:
             video_bytes = f.read()
 
         # 删除临时文件
-        os.remove(output_data[0])
-        os.remove(output_data[1])
+        os.remove(output_data)
         return video_bytes
 
     def handle(self, raw_data: Wav2LipInputModel):
         """
         pipeline
         """
+        return self.postprocess(self.handle_to_file(raw_data))
+
+    def handle_to_file(self, raw_data: Wav2LipInputModel):
+        """
+        pipeline, 返回编码完成的视频文件路径, 不把视频读入内存, 调用方负责删除文件
+        """
         input_data = self.preprocess(raw_data)
-        output_data = self.inference(input_data)
-        return self.postprocess(output_data)
+        return self.inference(input_data)
 
     def generate_audio_feature_chunks(self, mel, fps):
         """
         生成音频特征块
         """
-        # 生成音频特征块
-        mel_idx_multiplier = 80. / fps
-        i = 0
-        mel_step_size = 16
-        mel_chunks = []
-        # 为了保证 mel_step_size 个时间步长的音频特征对应的梅尔频谱图是连续的，需要对音频特征进行分块处理
-        while 1:
-            start_idx = int(i * mel_idx_multiplier)
-            if start_idx + mel_step_size > len(mel[0]):
-                mel_chunks.append(mel[:, len(mel[0]) - mel_step_size:])
-                break
-            mel_chunks.append(mel[:, start_idx: start_idx + mel_step_size])
-            i += 1
-        return mel_chunks
+        return split_mel_chunks(mel, fps)
 
-    def datagen(self, frames, mels):
-        img_batch, mel_batch, frame_batch, coords_batch = [], [], [], []
+    def datagen(self, frames, mels, cache_key=None):
+        img_batch, frame_batch, coords_batch = [], [], []
 
         if self.box[0] == -1:
             if not self.static:
-                face_det_results = self.face_detect(frames)  # BGR2RGB for CNN face detection
+                face_det_results = self.face_detect(frames, cache_key)  # BGR2RGB for CNN face detection
             else:
                 # 结果为每个视频帧的人脸和坐标，为检测出来的实际人脸和坐标
                 face_det_results = self.face_detect([frames[0]])
@@ -197,7 +416,7 @@ class Wav2LipHandle(BaseHandle):
             y1, y2, x1, x2 = self.box
             face_det_results = [[f[y1: y2, x1:x2], (y1, y2, x1, x2)] for f in frames]
 
-        for i, m in enumerate(mels):
+        for i in range(len(mels)):
             idx = 0 if self.static else i % len(frames)
             frame_to_save = frames[idx].copy()
             face, coords = face_det_results[idx].copy()
@@ -207,7 +426,6 @@ class Wav2LipHandle(BaseHandle):
             
             # 保存图片，此为resize后的图片
             img_batch.append(face)
-            mel_batch.append(m)
             # 保存原始图片
             frame_batch.append(frame_to_save)
 
@@ -215,38 +433,230 @@ class Wav2LipHandle(BaseHandle):
             coords_batch.append(coords)
 
             if len(img_batch) >= self.wav2lip_batch_size:
-                img_batch, mel_batch = np.asarray(img_batch), np.asarray(mel_batch)
+                yield self._make_batch(img_batch, mels[i + 1 - len(img_batch):i + 1], frame_batch, coords_batch)
+                img_batch, frame_batch, coords_batch = [], [], []
+
+        if len(img_batch) > 0:
+            yield self._make_batch(img_batch, mels[len(mels) - len(img_batch):], frame_batch, coords_batch)
+
+    def stream_datagen(self, raw_data: Wav2LipInputModel, mels):
+        """
+        流式生成推理批次, 逐帧解码视频并检测人脸, 同一时刻只保留一个批次的视频帧
+        """
+        img_batch, frame_batch, coords_batch = [], [], []
+
+        if self.static:
+            face_frames = self._iter_static_face_frames(raw_data)
+        else:
+            face_frames = self._iter_looped_face_frames(raw_data, len(mels))
 
-                img_masked = img_batch.copy()
-                img_masked[:, self.img_size // 2:] = 0
+        # 帧序号在前, 音频特征用完后不会再多解码一帧
+        end = 0
+        for end, (frame, coords) in zip(range(1, len(mels) + 1), face_frames):
+            y1, y2, x1, x2 = coords
+            face = cv2.resize(frame[y1:y2, x1:x2], (self.img_size, self.img_size))
 
-                img_batch = np.concatenate((img_masked, img_batch), axis=3) / 255.
-                mel_batch = np.reshape(mel_batch, [len(mel_batch), mel_batch.shape[1], mel_batch.shape[2], 1])
+            img_batch.append(face)
+            frame_batch.append(frame)
+            coords_batch.append(coords)
 
-                yield img_batch, mel_batch, frame_batch, coords_batch
-                img_batch, mel_batch, frame_batch, coords_batch = [], [], [], []
+            if len(img_batch) >= self.wav2lip_batch_size:
+                yield self._make_batch(img_batch, mels[end - len(img_batch):end], frame_batch, coords_batch)
+                img_batch, frame_batch, coords_batch = [], [], []
 
         if len(img_batch) > 0:
-            img_batch, mel_batch = np.asarray(img_batch), np.asarray(mel_batch)
+            yield self._make_batch(img_batch, mels[end - len(img_batch):end], frame_batch, coords_batch)
 
-            img_masked = img_batch.copy()
-            img_masked[:, self.img_size // 2:] = 0
+    def template_datagen(self, template: AvatarTemplateBundle, mels):
+        """
+        使用预处理好的模板生成推理批次, 跳过视频解码和人脸检测, 音频比模板长时循环使用模板
+        """
+        for start in range(0, len(mels), self.wav2lip_batch_size):
+            end = min(start + self.wav2lip_batch_size, len(mels))
+            idx = np.arange(start, end) % template.frame_count
+            frame_batch = template.read_frames(idx)
+            coords_batch = [tuple(c) for c in template.coords[idx]]
+            yield self._make_batch(template.faces[idx], mels[start:end], frame_batch, coords_batch)
+
+    def build_avatar_template(self, template_id, raw_data: Wav2LipInputModel) -> AvatarTemplateBundle:
+        """
+        预处理模板视频: 解码所有帧、检测人脸并保存 96x96 人脸和坐标
+        """
+        def face_frames():
+            for frame, coords in self._iter_face_frames(raw_data, None):
+                y1, y2, x1, x2 = coords
+                yield frame, cv2.resize(frame[y1:y2, x1:x2], (self.img_size, self.img_size)), coords
+
+        fps = self.get_video_fps(raw_data.video_path)
+        return self.avatar_templates.build(template_id, fps, face_frames(), self.img_size)
+
+    def _make_batch(self, img_batch, mel_batch, frame_batch, coords_batch):
+        """
+        将一个批次的人脸和音频特征整理为模型输入格式
+        """
+        img_batch, mel_batch = np.asarray(img_batch), np.asarray(mel_batch)
+
+        img_masked = img_batch.copy()
+        img_masked[:, self.img_size // 2:] = 0
+
+        img_batch = np.concatenate((img_masked, img_batch), axis=3) / 255.
+        mel_batch = np.reshape(mel_batch, [len(mel_batch), mel_batch.shape[1], mel_batch.shape[2], 1])
+
+        return img_batch, mel_batch, frame_batch, coords_batch
+
+    def _get_video_fps(self, raw_data: Wav2LipInputModel):
+        if raw_data.video_stream is None:
+            return self.get_video_fps(raw_data.video_path)
+        with raw_data.video_stream.open() as reader:
+            return get_pyav_fps(reader)
+
+    def _iter_video_frames(self, raw_data: Wav2LipInputModel, max_frames=None):
+        if raw_data.video_stream is None:
+            return self.iter_video_frames_from_file(raw_data.video_path, raw_data.resize_factor, raw_data.rotate,
+                                                    self.crop, max_frames)
+        return self._iter_growing_video_frames(raw_data, max_frames)
+
+    def _iter_growing_video_frames(self, raw_data: Wav2LipInputModel, max_frames):
+        """
+        边下载边解码, 只有 pyav 后端支持从文件对象读取, 读到未下载的部分时等待.
+        pyav 后端与 opencv 后端的旋转和缩放方式相同, 配置为 opencv 时输出的帧也一致
+        """
+        with raw_data.video_stream.open() as reader:
+            yield from self.iter_video_frames_from_file(reader, raw_data.resize_factor, raw_data.rotate, self.crop,
+                                                        max_frames, backend="pyav")
+
+    def _iter_static_face_frames(self, raw_data: Wav2LipInputModel):
+        """
+        static 模式只使用视频第一帧, 每次输出第一帧的副本
+        """
+        frames = self._iter_video_frames(raw_data, 1)
+        first_frame = next(frames, None)
+        frames.close()
+        if first_frame is None:
+            raise ValueError('Video contains no frames!')
+        if self.box[0] == -1:
+            _, coords = self.face_detect([first_frame])[0]
+        else:
+            coords = tuple(self.box)
+        while True:
+            yield first_frame.copy(), coords
+
+    def _iter_face_frames(self, raw_data: Wav2LipInputModel, max_frames):
+        """
+        逐帧输出前 max_frames 帧视频帧和人脸坐标, max_frames 为 None 时输出所有帧
+        """
+        # 与非流式模式一致, 只对前 max_frames 帧做人脸检测和平滑, 解码器读够帧数后即停止
+        frames = self._iter_video_frames(raw_data, max_frames)
+        if self.box[0] != -1:
+            print('Using the specified bounding box instead of face detection...')
+            coords = tuple(self.box)
+            return ((frame, coords) for frame in frames)
+
+        cache_key = self._get_face_box_cache_key(raw_data)
+        if cache_key is None:
+            return self.stream_face_detect(frames)
+
+        raw_boxes = self.face_box_cache.get(cache_key, max_frames)
+        if raw_boxes is not None:
+            logger.debug("命中人脸框缓存, 跳过人脸检测")
+            return zip(frames, self._boxes_to_coords(raw_boxes))
+
+        def on_complete(boxes):
+            # 检测到的帧数少于 max_frames 说明已经读完整个视频
+            self.face_box_cache.put(cache_key, boxes, complete=max_frames is None or len(boxes) < max_frames)
+
+        return self.stream_face_detect(frames, on_complete)
+
+    def _iter_looped_face_frames(self, raw_data: Wav2LipInputModel, max_frames):
+        """
+        音频比视频长时循环使用视频, 第二遍开始重新解码视频并复用第一遍的人脸坐标
+        """
+        coords_history = []
+        for frame, coords in self._iter_face_frames(raw_data, max_frames):
+            coords_history.append(coords)
+            yield frame, coords
+
+        if not coords_history:
+            raise ValueError('Video contains no frames!')
 
-            img_batch = np.concatenate((img_masked, img_batch), axis=3) / 255.
-            mel_batch = np.reshape(mel_batch, [len(mel_batch), mel_batch.shape[1], mel_batch.shape[2], 1])
+        while True:
+            for frame, coords in zip(self._iter_video_frames(raw_data, len(coords_history)), coords_history):
+                yield frame, coords
 
-            yield img_batch, mel_batch, frame_batch, coords_batch
+    def face_detect(self, images, cache_key=None):
+        boxes = None
+        if cache_key is not None:
+            boxes = self.face_box_cache.get(cache_key, len(images))
 
-    def face_detect(self, images):
-        detector = FaceAlignment(LandmarksType._2D, flip_input=False)
+        if boxes is None:
+            predictions = self._detect_faces(images)
+            boxes = np.array([self._pad_face_rect(rect, image) for rect, image in zip(predictions, images)])
+            if cache_key is not None:
+                self.face_box_cache.put(cache_key, boxes)
+
+        results = [[image[y1: y2, x1:x2], (y1, y2, x1, x2)]
+                   for image, (y1, y2, x1, x2) in zip(images, self._boxes_to_coords(boxes))]
+
+        return results
 
+    def stream_face_detect(self, frames, on_complete=None):
+        """
+        face_detect 的流式版本, 按 face_det_batch_size 分批检测, 输出 (视频帧, 人脸坐标),
+        只缓存检测批次和平滑窗口内的视频帧. 所有帧检测完成后以未平滑的人脸框调用 on_complete
+        """
+        pending_frames = deque()
+
+        def next_images():
+            return list(itertools.islice(frames, self.face_det_batch_size))
+
+        def raw_boxes():
+            detected = []
+            images = next_images()
+            while images:
+                pending_frames.extend(images)
+                boxes = [self._pad_face_rect(rect, image) for rect, image in zip(self._detect_faces(images), images)]
+                detected.extend(boxes)
+                # 提前读取下一批, 在输出最后一批结果前就能确认所有帧都已检测
+                images = next_images()
+                if not images and on_complete is not None:
+                    on_complete(np.array(detected))
+                yield from boxes
+
+        boxes = raw_boxes() if self.nosmooth else iter_smoothened_boxes(raw_boxes(), T=5)
+        for x1, y1, x2, y2 in boxes:
+            yield pending_frames.popleft(), (y1, y2, x1, x2)
+
+    def _boxes_to_coords(self, boxes):
+        """
+        对未平滑的人脸框 [x1, y1, x2, y2] 做平滑, 返回逐帧的 (y1, y2, x1, x2)
+        """
+        boxes = np.array(boxes)
+        if not self.nosmooth: boxes = get_smoothened_boxes(boxes, T=5)
+        return [(y1, y2, x1, x2) for x1, y1, x2, y2 in boxes]
+
+    def _get_face_box_cache_key(self, raw_data: Wav2LipInputModel):
+        if self.face_box_cache is None or self.box[0] != -1 or self.static:
+            return None
+        content_id = None
+        if raw_data.video_stream is not None:
+            # 下载完成前无法计算内容哈希, 以 ETag 代替; 没有 ETag 时 (命中本地缓存) 文件很快就会完整
+            raw_data.video_stream.wait_started()
+            content_id = raw_data.video_stream.content_id
+            if content_id is None:
+                raw_data.video_stream.wait()
+        # 边下载边解码时固定使用 pyav 后端
+        backend = "pyav" if raw_data.video_stream is not None else self.video_decoder_backend
+        return self.face_box_cache.make_key(raw_data.video_path, raw_data.resize_factor, raw_data.rotate,
+                                            self.crop, self.pad, content_id, backend)
+
+    def _detect_faces(self, images):
         batch_size = self.face_det_batch_size
 
         while 1:
             predictions = []
             try:
                 for i in tqdm(range(0, len(images), batch_size)):
-                    predictions.extend(detector.get_detections_for_batch(np.array(images[i:i + batch_size])))
+                    predictions.extend(self.detector.get_detections_for_batch(np.array(images[i:i + batch_size])))
             except RuntimeError:
                 if batch_size == 1:
                     raise RuntimeError(
@@ -256,26 +666,23 @@ class Wav2LipHandle(BaseHandle):
                 continue
             break
 
-        results = []
-        pady1, pady2, padx1, padx2 = self.pad
-        for rect, image in zip(predictions, images):
-            if rect is None:
-                cv2.imwrite('temp/faulty_frame.jpg', image)  # check this frame where the face was not detected.
-                raise ValueError('Face not detected! Ensure the video contains a face in all the frames.')
-
-            y1 = max(0, rect[1] - pady1)
-            y2 = min(image.shape[0], rect[3] + pady2)
-            x1 = max(0, rect[0] - padx1)
-            x2 = min(image.shape[1], rect[2] + padx2)
+        return predictions
 
-            results.append([x1, y1, x2, y2])
+    def _pad_face_rect(self, rect, image):
+        """
+        按 pad 扩展检测到的人脸框, 返回 [x1, y1, x2, y2]
+        """
+        if rect is None:
+            cv2.imwrite('temp/faulty_frame.jpg', image)  # check this frame where the face was not detected.
+            raise ValueError('Face not detected! Ensure the video contains a face in all the frames.')
 
-        boxes = np.array(results)
-        if not self.nosmooth: boxes = get_smoothened_boxes(boxes, T=5)
-        results = [[image[y1: y2, x1:x2], (y1, y2, x1, x2)] for image, (x1, y1, x2, y2) in zip(images, boxes)]
+        pady1, pady2, padx1, padx2 = self.pad
+        y1 = max(0, rect[1] - pady1)
+        y2 = min(image.shape[0], rect[3] + pady2)
+        x1 = max(0, rect[0] - padx1)
+        x2 = min(image.shape[1], rect[2] + padx2)
 
-        del detector
-        return results
+        return [x1, y1, x2, y2]
 
 
 # ------------------------------------------------------ 测试用例 ------------------------------------------------------
@@ -0,0 +1,67 @@
+"""
+ONNX Runtime 推理后端
+
+与 Wav2LipHandle 的预处理、批次生成、贴回和编码流程相同, 只把 Wav2Lip 和 S3FD 的前向替换为 ONNX Runtime 会话.
+模型由 python -m model.Wav2Lip.export --format onnx 导出, 通过配置 wav2lip_backend=onnx 启用.
+需要额外安装 onnxruntime (CPU) 或 onnxruntime-gpu (CUDA).
+"""
+import logging
+import os
+
+import numpy as np
+
+from model.Wav2Lip.export import EXPORT_DIR, get_onnx_paths
+from model.Wav2Lip.face_detection.api import FaceAlignment, LandmarksType
+from model.Wav2Lip.onnx_runtime import OnnxS3FD, create_session
+from model.Wav2Lip.wav2lip_handle import Wav2LipHandle
+from module.config.env_config import config
+
+logger = logging.getLogger(__name__)
+
+
+class Wav2LipOnnxHandle(Wav2LipHandle):
+    """
+    使用 ONNX Runtime 执行 Wav2Lip 和 S3FD 的处理类
+    """
+
+    def __init__(self, device=None, temp_dir=None, export_dir=None):
+        super().__init__(device=device, temp_dir=temp_dir)
+        self.wav2lip_onnx_path, self.s3fd_onnx_path = get_onnx_paths(export_dir or EXPORT_DIR)
+        self.intra_op_threads = config.get("onnx_intra_op_threads", 0, dtype=int)
+        self.session = None
+
+    def _load_models(self):
+        self.session = create_session(self.wav2lip_onnx_path, self.device, self.intra_op_threads)
+        # 导出的模型批次为动态维度, 不需要补齐到批次档位
+        self.batch_buckets = []
+        logger.info(f"加载 ONNX 模型 {self.wav2lip_onnx_path}, providers: {self.session.get_providers()}")
+        s3fd_session = create_session(self.s3fd_onnx_path, self.device, self.intra_op_threads)
+        self.detector = FaceAlignment(LandmarksType._2D, flip_input=False, device=str(self.device),
+                                      net=OnnxS3FD(s3fd_session))
+        logger.debug("Face detector loaded successfully")
+
+    def _forward(self, mel_batch, img_batch, pinned_buffers=None):
+        mel_batch = np.ascontiguousarray(mel_batch.transpose(0, 3, 1, 2), dtype=np.float32)
+        img_batch = np.ascontiguousarray(img_batch.transpose(0, 3, 1, 2), dtype=np.float32)
+        pred, = self.session.run(None, {"mel": mel_batch, "face": img_batch})
+        return pred.transpose(0, 2, 3, 1) * 255.
+
+
+if __name__ == '__main__':
+    # 吞吐对比: python -m model.Wav2Lip.wav2lip_onnx_handle [批次大小] [重复次数]
+    import sys
+    import time
+
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    os.environ.setdefault("wav2lip_warmup", "false")
+    mel = np.random.rand(batch_size, 80, 16, 1).astype(np.float32)
+    img = np.random.rand(batch_size, 96, 96, 6).astype(np.float32)
+    for handle in (Wav2LipHandle(), Wav2LipOnnxHandle()):
+        handle.initialize()
+        handle._forward(mel, img)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            handle._forward(mel, img)
+        elapsed = time.perf_counter() - start
+        print(f"{type(handle).__name__}: {batch_size * repeat / elapsed:.1f} 帧/秒")
@@ -22,6 +22,7 @@ class VideoAndAudioToVideoTaskModel(BaseModel):
     video_key: str
     audio_key: str
     improve_video: Optional[bool] = False
+    template_id: Optional[int] = None
     callback_url: Optional[str] = None
     result_id: Optional[int] = None
     status: int
@@ -31,3 +32,16 @@ class VideoAndAudioToVideoResultModel(BaseModel):
     result_id: Optional[int] = None
     video_key: str
     failed_reason: Optional[str] = None
+
+
+class CallbackModel(BaseModel):
+    callback_id: Optional[int] = None
+    task_id: int
+    url: str
+    payload: dict
+
+
+class AvatarTemplateModel(BaseModel):
+    template_id: Optional[int] = None
+    video_key: str
+    status: int
@@ -1,7 +1,9 @@
 from peewee import Model, CharField, DateTimeField, IntegerField, TextField, MySQLDatabase, SQL, BigIntegerField, \
-    AutoField, BooleanField
+    AutoField, BooleanField, FloatField
 from datetime import datetime
 
+from playhouse.migrate import MySQLMigrator, migrate
+
 from module.ORM.mysql_config import db
 
 
@@ -48,6 +50,9 @@ class VideoAndAudioToVideoTask(Model):
     video_key = CharField(max_length=255)  # 图片链接
     audio_key = CharField(max_length=255)  # 音频链接
     improve_video = BooleanField(default=False)  # 是否提升视频质量
+    template_id = BigIntegerField(null=True)  # 使用的预处理模板ID
+    owner = CharField(max_length=64, null=True)  # 领取任务的 worker
+    lease_expires_at = DateTimeField(null=True)  # 租约到期时间, 过期后任务可被其他 worker 重新领取
     callback_url = CharField(max_length=255, null=True)  # 回调地址
     result_id = BigIntegerField(null=True)  # 生成视频结果ID
     created_at = DateTimeField(default=datetime.now)  # 创建时间
@@ -80,6 +85,53 @@ class VideoAndAudioToVideoResult(Model):
 
 
 
+class AvatarTemplate(Model):
+    template_id = BigIntegerField(unique=True, primary_key=True)  # 模板ID
+    video_key = CharField(max_length=255)  # 模板视频链接
+    frame_count = IntegerField(null=True)  # 模板帧数
+    fps = FloatField(null=True)  # 模板帧率
+    owner = CharField(max_length=64, null=True)  # 领取预处理任务的 worker
+    lease_expires_at = DateTimeField(null=True)  # 租约到期时间, 过期后任务可被其他 worker 重新领取
+    failed_reason = TextField(null=True)  # 失败原因
+    created_at = DateTimeField(default=datetime.now)  # 创建时间
+    updated_at = DateTimeField(default=datetime.now, constraints=[SQL('ON UPDATE CURRENT_TIMESTAMP')])  # 更新时间
+    status = IntegerField(default=0)  # 状态 (0: 排队中, 1: 处理中, 2: 处理完成, 3: 处理失败)
+
+    def save(self, *args, **kwargs):
+        self.updated_at = datetime.now()
+        return super().save(*args, **kwargs)
+
+    class Meta:
+        database = db  # 使用之前定义的数据库连接
+        table_name = 'avatar_template'  # 表名
+
+
+class CallbackOutbox(Model):
+    callback_id = BigIntegerField(unique=True, primary_key=True)  # 回调ID
+    task_id = BigIntegerField(index=True)  # 任务ID
+    url = CharField(max_length=255)  # 回调地址
+    payload = TextField()  # 回调内容 (JSON)
+    attempts = IntegerField(default=0)  # 已投递次数
+    next_attempt_at = DateTimeField(default=datetime.now)  # 下次投递时间
+    owner = CharField(max_length=64, null=True)  # 正在投递的 dispatcher
+    lease_expires_at = DateTimeField(null=True)  # 租约到期时间, 过期后可被其他 dispatcher 重新投递
+    last_error = TextField(null=True)  # 最近一次投递失败的原因
+    created_at = DateTimeField(default=datetime.now)  # 创建时间
+    updated_at = DateTimeField(default=datetime.now, constraints=[SQL('ON UPDATE CURRENT_TIMESTAMP')])  # 更新时间
+    status = IntegerField(default=0)  # 状态 (0: 待投递, 1: 投递中, 2: 投递成功, 3: 放弃投递)
+
+    def save(self, *args, **kwargs):
+        self.updated_at = datetime.now()
+        return super().save(*args, **kwargs)
+
+    class Meta:
+        database = db
+        table_name = 'callback_outbox'
+        indexes = (
+            (('status', 'next_attempt_at'), False),
+        )
+
+
 class Authorizations(Model):
     id = AutoField()
     api_key = CharField(max_length=255)
@@ -115,3 +167,24 @@ if not VideoAndAudioToVideoTask.table_exists():
 
 if not VideoAndAudioToVideoResult.table_exists():
     db.create_tables([VideoAndAudioToVideoResult])
+
+if not AvatarTemplate.table_exists():
+    db.create_tables([AvatarTemplate])
+
+if not CallbackOutbox.table_exists():
+    db.create_tables([CallbackOutbox])
+
+
+def add_missing_columns(model):
+    """为已存在的表补充模型中新增的字段, 新增字段需要允许为空或有默认值"""
+    table_name = model._meta.table_name
+    existing_columns = {column.name for column in db.get_columns(table_name)}
+    migrator = MySQLMigrator(db)
+    operations = [migrator.add_column(table_name, field.column_name, field)
+                  for field in model._meta.sorted_fields if field.column_name not in existing_columns]
+    if operations:
+        migrate(*operations)
+
+
+add_missing_columns(VideoAndAudioToVideoTask)
+add_missing_columns(AvatarTemplate)
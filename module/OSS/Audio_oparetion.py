@@ -31,8 +31,7 @@ class OSSAudioService(OSSBase):
         :param key: 音频在 OSS 上的 key
         :param local_file_path: 本地文件路径
         """
-        self.bucket.get_object_to_file(key, local_file_path)
-        return local_file_path
+        return self.download_file_to_file(key, local_file_path)
 
     def download_audio_to_bytes(self, key) -> bytes:
         """下载音频
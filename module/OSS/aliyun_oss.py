@@ -1,9 +1,13 @@
 import datetime
 import logging
 import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 import oss2
+from module.cache.disk_lru_cache import remove_if_exists
 from module.config.env_config import config
+from utils.growing_file import GrowingFile
 
 access_key_id = config.get("oss_access_key_id", " ")
 access_key_secret = config.get("oss_access_key_secret", " ")
@@ -18,11 +22,27 @@ for param in (access_key_id, access_key_secret, bucket_name, endpoint):
 bucket = oss2.Bucket(oss2.Auth(access_key_id, access_key_secret), endpoint, bucket_name)
 logger = logging.getLogger(__name__)
 
+# 分片上传参数, 文件超过阈值时按分片并行上传, 断点信息保存在 resumable_store_dir 中
+multipart_threshold = config.get("oss_multipart_threshold", 10 * 1024 * 1024, int)
+multipart_part_size = config.get("oss_multipart_part_size", 5 * 1024 * 1024, int)
+multipart_num_threads = config.get("oss_multipart_num_threads", 4, int)
+resumable_store_dir = config.get("oss_resumable_store_dir", None)
+
+# 分段下载参数, 文件超过阈值时按 Range 分段并行下载
+download_threshold = config.get("oss_download_threshold", 16 * 1024 * 1024, int)
+download_part_size = config.get("oss_download_part_size", 8 * 1024 * 1024, int)
+download_num_threads = config.get("oss_download_num_threads", 4, int)
+
 
 class OSSBase:
-    def __init__(self, prefix):
+    def __init__(self, prefix, object_cache=None):
+        """
+        :param prefix: 上传文件的 key 前缀
+        :param object_cache: OSSObjectCache, 下载时优先使用本地缓存, None 表示不缓存
+        """
         self.bucket = bucket
         self.prefix = prefix
+        self.object_cache = object_cache
 
     def _get_full_key(self, key):
         """生成带前缀和月份的完整 key"""
@@ -50,14 +70,114 @@ class OSSBase:
         self.bucket.put_object(full_key, file)
         return full_key
 
+    def upload_file_resumable(self, local_file_path, key):
+        """断点续传上传文件, 大文件按分片并行上传, 不把文件读入内存, 并根据月份分类添加前缀
+        :param local_file_path: 本地文件路径
+        :param key: 上传到 OSS 的文件名称
+        """
+        full_key = self._get_full_key(key)
+        oss2.resumable_upload(self.bucket, full_key, local_file_path,
+                              store=oss2.ResumableStore(root=resumable_store_dir),
+                              multipart_threshold=multipart_threshold,
+                              part_size=multipart_part_size,
+                              num_threads=multipart_num_threads)
+        return full_key
+
     def download_file_to_file(self, key, local_file_path):
-        """下载文件
+        """下载文件, 设置了 object_cache 时优先使用本地缓存, 超过 download_threshold 的文件按 Range 分段并行下载
         :param key: 文件在 OSS 上的 key
         :param local_file_path: 本地文件路径
         """
-        self.bucket.get_object_to_file(key, local_file_path)
+        if self.object_cache is not None:
+            return self.object_cache.fetch(self, key, local_file_path)
+        self._download_object(key, local_file_path)
         return local_file_path
 
+    def _download_object(self, key, local_file_path):
+        """从 OSS 下载文件, 返回下载内容的 ETag
+        直接发起 GET, 从响应头得到大小和 ETag, 不单独 head_object; 小文件由这个响应一次写入,
+        超过 download_threshold 时这个响应只读取第一段, 其余分段按 Range 并行下载
+        """
+        result = self.bucket.get_object(key)
+        size = result.content_length
+        if size >= download_threshold and download_num_threads > 1:
+            self._download_ranges(key, local_file_path, size, result.etag, first_part=result)
+            return result.etag
+        # 本地路径可能是上次失败残留的缓存硬链接, 先删除再写入新文件
+        remove_if_exists(local_file_path)
+        with open(local_file_path, "wb") as f:
+            self._copy_part(result, f, size, key, 0)
+        oss2.utils.check_crc("get", result.client_crc, result.server_crc, result.request_id)
+        return result.etag
+
+    @staticmethod
+    def _copy_part(result, f, length, key, start):
+        """从响应中读取 length 字节写入 f, 响应提前结束时抛出 IOError"""
+        remaining = length
+        while remaining > 0:
+            chunk = result.read(min(remaining, 1024 * 1024))
+            if not chunk:
+                raise IOError(f"下载 {key} 的 {start}-{start + length - 1} 长度不一致: {length - remaining}")
+            f.write(chunk)
+            remaining -= len(chunk)
+
+    def _download_ranges(self, key, local_file_path, size, etag, first_part):
+        """分段并行下载, 先写入临时文件, 全部分段完成后再重命名为目标文件
+        第一段读取 first_part (不带 Range 的 GET 响应) 的开头后关闭连接, 其余分段以 If-Match 限定为同一个 ETag,
+        下载过程中对象被覆盖时失败, 不会拼接出不同版本的内容
+        """
+        temp_file_path = local_file_path + ".download"
+        with open(temp_file_path, "wb") as f:
+            f.truncate(size)
+
+        def download_range(start):
+            end = min(start + download_part_size, size) - 1
+            if start == 0:
+                result = first_part
+            else:
+                # byte_range 两端都包含
+                result = self.bucket.get_object(key, byte_range=(start, end), headers={"If-Match": f'"{etag}"'})
+            with open(temp_file_path, "r+b") as f:
+                f.seek(start)
+                self._copy_part(result, f, end + 1 - start, key, start)
+
+        try:
+            with ThreadPoolExecutor(max_workers=download_num_threads) as executor:
+                # list 取出每个分段的结果, 任一分段失败时抛出异常
+                list(executor.map(download_range, range(0, size, download_part_size)))
+            os.replace(temp_file_path, local_file_path)
+        except BaseException:
+            if os.path.exists(temp_file_path):
+                os.remove(temp_file_path)
+            raise
+        finally:
+            # 第一段之后的内容不再读取, 关闭连接
+            first_part.close()
+        logger.debug(f"分段下载 {key} 完成, 大小: {size}, 分段数: {-(-size // download_part_size)}")
+
+    def download_to_growing_file(self, key, growing_file: GrowingFile):
+        """顺序下载到 GrowingFile, 读取方可以在下载完成前读取已写入的部分
+        本地有缓存时仍通过 object_cache 校验并硬链接, 完成后一次性可读; 否则单个 GET 顺序写入,
+        不使用分段并行下载, 让文件开头尽早可读. 下载失败时通知读取方, 被 cancel 时返回 False, 不写入缓存
+        :param key: 文件在 OSS 上的 key
+        :param growing_file: 写入的 GrowingFile
+        """
+        try:
+            if self.object_cache is not None and self.object_cache.contains(key):
+                self.object_cache.fetch(self, key, growing_file.path)
+                growing_file.finish()
+                return True
+            result = self.bucket.get_object(key)
+            if not growing_file.write_from(result, result.content_length, f"etag:{result.etag}"):
+                logger.debug(f"边下边读 {key} 已取消, 已下载: {growing_file.written}/{growing_file.size}")
+                return False
+        except BaseException as e:
+            growing_file.fail(e)
+            raise
+        if self.object_cache is not None:
+            self.object_cache.add(key, result.etag, growing_file.path)
+        return True
+
     def download_file_to_bytes(self, key):
         """下载文件
         :param key: 文件在 OSS 上的 key
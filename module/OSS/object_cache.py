@@ -0,0 +1,135 @@
+"""
+OSS 输入对象的本地磁盘缓存
+
+缓存文件名为 sha256(对象 key)-ETag, 同一对象更新后 ETag 变化, 旧版本不会被误用. 命中本地缓存时
+以 If-None-Match 条件 GET 向 OSS 确认对象未更新 (304), 再把缓存文件硬链接到调用方指定的路径,
+调用方删除该路径不影响缓存. 容量由 DiskLRUCache 按字节数淘汰最久未使用的文件, 多个进程可以共享缓存目录.
+"""
+import glob
+import hashlib
+import logging
+import os
+import re
+import shutil
+from threading import Lock
+
+import oss2
+
+from module.cache.disk_lru_cache import DiskLRUCache, link_or_copy, remove_if_exists
+from module.config.env_config import config
+
+logger = logging.getLogger(__name__)
+
+
+class OSSObjectCache:
+    def __init__(self, cache_dir, max_bytes):
+        self.store = DiskLRUCache(cache_dir, max_bytes)
+        self.lock = Lock()
+        # 条件 GET 返回 304, 直接使用本地缓存
+        self.revalidated = 0
+        # 条件 GET 返回新内容, 对象已更新
+        self.refreshed = 0
+        # 本地没有缓存, 从 OSS 完整下载
+        self.downloaded = 0
+
+    @staticmethod
+    def _key_prefix(key):
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _entry_name(self, key, etag):
+        # 分片上传的对象 ETag 形如 <md5>-<分片数>, 保留连字符
+        return f"{self._key_prefix(key)}-{re.sub(r'[^0-9A-Za-z-]', '', etag)}"
+
+    def _find_entries(self, key):
+        """返回该对象在缓存中的所有版本, 最近使用的在前"""
+        paths = glob.glob(os.path.join(self.store.cache_dir, glob.escape(self._key_prefix(key)) + "-*"))
+        entries = []
+        for path in paths:
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                continue
+        return [path for _, path in sorted(entries, reverse=True)]
+
+    def _remove_other_versions(self, key, name):
+        for path in self._find_entries(key):
+            if os.path.basename(path) != name:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def _count(self, field):
+        with self.lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def fetch(self, service, key, local_file_path):
+        """
+        获取对象到本地文件, 优先使用缓存
+        :param service: OSSBase, 未命中时使用其 _download_object 下载
+        :param key: 对象在 OSS 上的 key
+        :param local_file_path: 本地文件路径
+        """
+        etag = None
+        entries = self._find_entries(key)
+        if entries:
+            name = os.path.basename(entries[0])
+            # 文件名中 key 的哈希不含连字符, 第一个连字符之后为 ETag
+            try:
+                result = service.bucket.get_object(key, headers={"If-None-Match": f'"{name.split("-", 1)[1]}"'})
+            except oss2.exceptions.NotModified:
+                path = self.store.get_path(name)
+                # 条件 GET 之后缓存文件可能已被其他进程淘汰, 此时重新下载
+                if path is not None:
+                    link_or_copy(path, local_file_path)
+                    self._count("revalidated")
+                    return local_file_path
+            else:
+                # 本地路径可能是上次失败残留的缓存硬链接, 先删除再写入新文件
+                remove_if_exists(local_file_path)
+                with open(local_file_path, "wb") as f:
+                    shutil.copyfileobj(result, f, 1024 * 1024)
+                etag = result.etag
+                self._count("refreshed")
+                logger.info(f"OSS 对象 {key} 已更新, 刷新本地缓存")
+
+        if etag is None:
+            etag = service._download_object(key, local_file_path)
+            self._count("downloaded")
+        self._store(key, etag, local_file_path)
+        return local_file_path
+
+    def contains(self, key):
+        """本地是否有该对象的缓存, 不校验是否为最新版本"""
+        return bool(self._find_entries(key))
+
+    def add(self, key, etag, local_file_path):
+        """把不经 fetch 完整下载的对象加入缓存"""
+        self._count("downloaded")
+        self._store(key, etag, local_file_path)
+
+    def _store(self, key, etag, local_file_path):
+        name = self._entry_name(key, etag)
+        self.store.put_file(name, local_file_path)
+        self._remove_other_versions(key, name)
+
+    def stats(self):
+        stats = self.store.stats()
+        stats.update(revalidated=self.revalidated, refreshed=self.refreshed, downloaded=self.downloaded)
+        return stats
+
+
+_object_cache = None
+_object_cache_lock = Lock()
+
+
+def get_object_cache():
+    """进程内共享的 OSS 对象缓存, 配置 oss_object_cache_enabled=false 时返回 None"""
+    global _object_cache
+    if not config.get("oss_object_cache_enabled", True, dtype=bool):
+        return None
+    with _object_cache_lock:
+        if _object_cache is None:
+            _object_cache = OSSObjectCache(config.get("oss_object_cache_dir", "model/Wav2Lip/temp/oss_object_cache"),
+                                           config.get("oss_object_cache_max_bytes", 2 * 1024 * 1024 * 1024, int))
+    return _object_cache
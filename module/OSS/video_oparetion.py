@@ -7,11 +7,13 @@ import cv2
 import numpy as np
 
 from module.OSS.aliyun_oss import bucket, OSSBase
+from module.OSS.object_cache import get_object_cache
 
 
 class OSSVideoService(OSSBase):
     def __init__(self, prefix="video"):
-        super(OSSVideoService, self).__init__(prefix)
+        # 模板视频会被多个任务重复下载, 使用本地缓存
+        super(OSSVideoService, self).__init__(prefix, get_object_cache())
 
     def upload_video_from_file(self, file_path, object_name):
         """
@@ -33,6 +35,15 @@ class OSSVideoService(OSSBase):
         full_key = self.upload_file_from_bytes(object_name, file)
         return full_key
 
+    def upload_video_resumable(self, object_name, file_path):
+        """
+        Upload video from file with resumable multipart upload, parts are uploaded in parallel
+        :param object_name: str, object name
+        :param file_path: str, path to the file
+        :return: str, full key
+        """
+        return self.upload_file_resumable(file_path, object_name)
+
     def download_video_to_bytes(self, object_name):
         """
         Download video to bytes
@@ -0,0 +1,136 @@
+"""
+本地磁盘 LRU 缓存
+
+缓存项以文件形式保存在同一目录下, 以文件修改时间作为最近使用时间, 总字节数超过上限时
+淘汰最久未使用的文件. 不维护内存索引, 多个进程可以共享同一个缓存目录.
+"""
+import logging
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from threading import Lock
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def remove_if_exists(path):
+    """删除文件, 不存在时忽略. 覆盖写入前先删除, 旧文件是缓存文件的硬链接时不会改写缓存内容"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def link_or_copy(src, dst):
+    """创建硬链接, 跨文件系统时退化为复制, dst 已存在时覆盖"""
+    remove_if_exists(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class DiskLRUCache:
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _get_path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get_path(self, key) -> Optional[str]:
+        """获取缓存文件路径并刷新最近使用时间, 未命中返回 None
+        :param key: 缓存 key, 需要是合法的文件名
+        """
+        path = self._get_path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return path
+
+    @contextmanager
+    def open_for_write(self, key):
+        """写入缓存项, 先写入临时文件, 成功后原子替换, 避免其他进程读到不完整的文件
+        :param key: 缓存 key, 需要是合法的文件名
+        """
+        fd, temp_path = tempfile.mkstemp(prefix=".tmp-", dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                yield f
+            os.replace(temp_path, self._get_path(key))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self.evict()
+
+    def put_file(self, key, file_path):
+        """把已有的本地文件加入缓存, 同一文件系统上使用硬链接, 否则复制
+        :param key: 缓存 key, 需要是合法的文件名
+        :param file_path: 本地文件路径, 加入缓存后调用方仍可继续使用或删除
+        """
+        fd, temp_path = tempfile.mkstemp(prefix=".tmp-", dir=self.cache_dir)
+        os.close(fd)
+        try:
+            link_or_copy(file_path, temp_path)
+            os.replace(temp_path, self._get_path(key))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self.evict()
+
+    def _scan(self):
+        """返回 [(修改时间, 大小, 路径)], 忽略正在写入的临时文件"""
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        """淘汰最久未使用的缓存项, 直到总大小不超过 max_bytes"""
+        entries = self._scan()
+        total_bytes = sum(size for _, size, _ in entries)
+        if total_bytes <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total_bytes -= size
+            with self.lock:
+                self.evictions += 1
+            logger.debug(f"淘汰缓存文件 {path}")
+
+    def stats(self):
+        entries = self._scan()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+        }
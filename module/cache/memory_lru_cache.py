@@ -0,0 +1,62 @@
+"""
+内存 LRU 缓存
+
+按调用方给出的字节数限制容量, 超过上限时淘汰最久未使用的缓存项. 只在单个进程内有效.
+"""
+import logging
+from collections import OrderedDict
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryLRUCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.items = OrderedDict()
+        self.lock = Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """获取缓存项并标记为最近使用, 未命中返回 None"""
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self.items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value, nbytes):
+        """
+        :param key: 缓存 key
+        :param value: 缓存值
+        :param nbytes: 缓存值占用的字节数, 超过上限的缓存项不会被保存
+        """
+        if nbytes > self.max_bytes:
+            return
+        with self.lock:
+            old = self.items.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            self.items[key] = (value, nbytes)
+            self.total_bytes += nbytes
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self.items.popitem(last=False)
+                self.total_bytes -= evicted_bytes
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.items),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+            }
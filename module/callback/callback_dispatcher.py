@@ -0,0 +1,130 @@
+"""
+异步回调投递
+
+CallbackDispatcher 在独立线程的 asyncio 事件循环中, 从 CallbackOutbox 领取到期的回调并用共享连接池的
+httpx.AsyncClient 并发投递, 任务线程只需在标记任务结束时把回调写入发件箱, 不会被客户的回调接口阻塞.
+投递失败 (超时、连接错误、5xx、408、429) 时按指数退避加随机抖动重新投递, 其他 4xx 视为不可恢复, 不再重试.
+投递结果写回数据库之前进程宕机时回调会被重新投递, 即回调至少投递一次.
+"""
+import asyncio
+import logging
+import random
+import threading
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# 这些 4xx 状态码表示稍后重试可能成功
+RETRYABLE_STATUS_CODES = {408, 429}
+
+
+class CallbackDispatcher:
+    def __init__(self, outbox, max_connections=20, timeout=10.0, max_attempts=8, base_delay=2.0, max_delay=600.0,
+                 poll_interval=5.0, transport=None):
+        """
+        :param outbox: CallbackOutbox
+        :param max_connections: 连接池大小, 也是同时投递的回调数上限
+        :param timeout: 单次投递的超时秒数, 需要小于 outbox 的租约时长
+        :param max_attempts: 最多投递次数, 超过后放弃
+        :param base_delay: 第一次重试前等待的秒数, 之后每次翻倍, 不超过 max_delay
+        :param poll_interval: 没有新回调通知时轮询发件箱的间隔秒数, 其他进程写入的回调通过轮询领取
+        :param transport: httpx 传输层, 测试时替换为 MockTransport
+        """
+        self.outbox = outbox
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.transport = transport
+        self.loop = None
+        self.wakeup = None
+        self.stopping = False
+        self.started = threading.Event()
+        self.thread = threading.Thread(target=self._run_loop, daemon=True, name="callback-dispatcher")
+
+    def start(self):
+        self.thread.start()
+        self.started.wait()
+
+    def stop(self, timeout=None):
+        """停止领取新的回调, 等待投递中的回调完成"""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._stop)
+            self.thread.join(timeout)
+
+    def notify(self):
+        """有新的回调写入发件箱, 立即领取, 不等待下一次轮询. 事件循环不在当前进程时不做任何事"""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    def _stop(self):
+        self.stopping = True
+        self.wakeup.set()
+
+    def retry_delay(self, attempts):
+        """第 attempts 次投递失败后的等待秒数, 抖动避免大量回调在同一时刻重试"""
+        delay = min(self.base_delay * 2 ** (attempts - 1), self.max_delay)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _run_loop(self):
+        self.loop = asyncio.new_event_loop()
+        self.wakeup = asyncio.Event()
+        self.started.set()
+        try:
+            self.loop.run_until_complete(self._run())
+        finally:
+            self.loop.close()
+
+    async def _run(self):
+        limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+        in_flight = set()
+        async with httpx.AsyncClient(timeout=self.timeout, limits=limits, transport=self.transport) as client:
+            while not self.stopping:
+                self.wakeup.clear()
+                # 只领取有空闲连接的数量, 领取的回调都能立即投递, 不会在本地排队到租约过期
+                limit = self.max_connections - len(in_flight)
+                if limit > 0:
+                    for callback in await self._claim(limit):
+                        task = asyncio.create_task(self._deliver(client, callback))
+                        in_flight.add(task)
+                        task.add_done_callback(in_flight.discard)
+                # 新回调通知、投递完成腾出连接或轮询间隔到达时继续领取
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+            if in_flight:
+                await asyncio.wait(in_flight)
+
+    async def _claim(self, limit):
+        try:
+            # 数据库操作是阻塞调用, 在线程池中执行; 数据库连接失败时返回 None
+            return await asyncio.to_thread(self.outbox.claim_due, limit) or []
+        except Exception as e:
+            logger.error(f"领取回调失败: {e}")
+            return []
+
+    async def _deliver(self, client: httpx.AsyncClient, callback):
+        callback_id, attempts = callback["callback_id"], callback["attempts"] + 1
+        try:
+            response = await client.post(callback["url"], json=callback["payload"])
+            response.raise_for_status()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            retryable = not isinstance(e, httpx.HTTPStatusError) or (
+                    e.response.status_code >= 500 or e.response.status_code in RETRYABLE_STATUS_CODES)
+            if retryable and attempts < self.max_attempts:
+                delay = self.retry_delay(attempts)
+                logger.warning(f"任务 {callback['task_id']} 第 {attempts} 次回调失败, {delay:.0f}s 后重试: {error}")
+                await asyncio.to_thread(self.outbox.schedule_retry, callback_id, attempts, delay, error)
+            else:
+                logger.error(f"任务 {callback['task_id']} 回调失败, 不再重试: {error}")
+                await asyncio.to_thread(self.outbox.mark_abandoned, callback_id, attempts, error)
+        else:
+            logger.debug(f"任务 {callback['task_id']} 回调成功")
+            await asyncio.to_thread(self.outbox.mark_delivered, callback_id, attempts)
+        finally:
+            self.wakeup.set()
@@ -19,6 +19,11 @@ class Config:
             return int(os.getenv(key, default))
         if dtype == float:
             return float(os.getenv(key, default))
+        if dtype == bool:
+            value = os.getenv(key)
+            if value is None:
+                return default
+            return value.strip().lower() in ("1", "true", "yes", "on")
         return os.getenv(key, default)
 
     def get_logging_level(self):
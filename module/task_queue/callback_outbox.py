@@ -0,0 +1,103 @@
+"""
+回调发件箱
+
+任务完成或失败时, 回调与任务状态在同一个事务中写入 callback_outbox 表, 由 CallbackDispatcher 在后台投递,
+服务重启后未投递的回调不会丢失. 领取回调的方式与 VideoAndAudioToVideoTaskTaskQueue 领取任务相同: 带条件的
+UPDATE 写入 owner 和租约到期时间, 多个副本不会同时投递同一条回调, 投递进程宕机后租约过期, 回调会被重新投递.
+"""
+import json
+import logging
+import os
+import socket
+import uuid
+
+from peewee import SQL, fn
+
+from constants.ImageToVideoTaskConstants import TaskStatus
+from module.ORM.model import CallbackModel
+from module.ORM.mysql_config import with_db_connection
+from module.ORM.table_config import CallbackOutbox as CallbackOutboxTable
+from utils.snowflake import process_snowflake
+
+logger = logging.getLogger(__name__)
+
+
+def _seconds_from_now(seconds):
+    # 使用数据库时间, 避免不同节点之间的时钟偏差
+    return fn.DATE_ADD(fn.NOW(), SQL(f"INTERVAL {int(seconds)} SECOND"))
+
+
+class CallbackOutbox:
+    def __init__(self, lease_seconds=60):
+        """
+        :param lease_seconds: 领取后的租约时长, 需要大于单次投递的超时时间
+        """
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        # 每个子进程都会创建发件箱, 使用进程专用的 Snowflake, 避免重复的 callback_id 使任务完成的事务回滚
+        self.Snowflake = process_snowflake()
+
+    @staticmethod
+    def _claimable():
+        """到达投递时间的待投递回调, 或者租约已经过期的投递中回调"""
+        return ((CallbackOutboxTable.status == TaskStatus.PENDING.value) &
+                (CallbackOutboxTable.next_attempt_at <= fn.NOW())) | (
+                (CallbackOutboxTable.status == TaskStatus.PROCESSING.value) &
+                (CallbackOutboxTable.lease_expires_at < fn.NOW()))
+
+    def add(self, callback: CallbackModel):
+        """写入一条待投递的回调, 在调用方的事务中执行时与任务状态一同提交"""
+        if callback.callback_id is None:
+            callback.callback_id = self.Snowflake.generate()
+        CallbackOutboxTable.create(callback_id=callback.callback_id, task_id=callback.task_id, url=callback.url,
+                                   payload=json.dumps(callback.payload, ensure_ascii=False),
+                                   next_attempt_at=fn.NOW())
+        return callback.callback_id
+
+    @with_db_connection
+    def claim_due(self, limit=20):
+        """领取最多 limit 条到达投递时间的回调, 返回 dict 列表, payload 已解析"""
+        candidates = (CallbackOutboxTable
+                      .select(CallbackOutboxTable.callback_id)
+                      .where(self._claimable())
+                      .order_by(CallbackOutboxTable.next_attempt_at)
+                      .limit(limit))
+        claimed = []
+        for candidate in candidates:
+            # 条件更新保证同一条回调只会被一个 dispatcher 领取成功
+            rows = CallbackOutboxTable.update(
+                status=TaskStatus.PROCESSING.value,
+                owner=self.owner,
+                lease_expires_at=_seconds_from_now(self.lease_seconds)
+            ).where((CallbackOutboxTable.callback_id == candidate.callback_id) & self._claimable()).execute()
+            if rows == 1:
+                claimed.append(candidate.callback_id)
+        if not claimed:
+            return []
+        callbacks = []
+        for row in CallbackOutboxTable.select().where(CallbackOutboxTable.callback_id.in_(claimed)):
+            callback = row.__data__
+            callback["payload"] = json.loads(callback["payload"])
+            callbacks.append(callback)
+        return callbacks
+
+    def _owned(self, callback_id):
+        return (CallbackOutboxTable.callback_id == callback_id) & (CallbackOutboxTable.owner == self.owner)
+
+    @with_db_connection
+    def mark_delivered(self, callback_id, attempts):
+        CallbackOutboxTable.update(status=TaskStatus.COMPLETED.value, attempts=attempts, lease_expires_at=None,
+                                   last_error=None).where(self._owned(callback_id)).execute()
+
+    @with_db_connection
+    def schedule_retry(self, callback_id, attempts, delay, error):
+        """投递失败, delay 秒后重新投递"""
+        CallbackOutboxTable.update(status=TaskStatus.PENDING.value, attempts=attempts, lease_expires_at=None,
+                                   next_attempt_at=_seconds_from_now(delay),
+                                   last_error=error).where(self._owned(callback_id)).execute()
+
+    @with_db_connection
+    def mark_abandoned(self, callback_id, attempts, error):
+        """超过最大投递次数, 不再投递"""
+        CallbackOutboxTable.update(status=TaskStatus.FAILED.value, attempts=attempts, lease_expires_at=None,
+                                   last_error=error).where(self._owned(callback_id)).execute()
@@ -0,0 +1,148 @@
+"""
+基于数据库租约的任务队列基类
+
+VideoAndAudioToVideoTaskTaskQueue 和 AvatarTemplateTaskQueue 共用领取、续约和释放任务的逻辑,
+本模块不导入具体的表定义, 导入时不会连接数据库.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+from peewee import SQL, fn
+
+from constants.ImageToVideoTaskConstants import TaskStatus
+from module.ORM.mysql_config import with_db_connection
+from utils.snowflake import process_snowflake
+
+logger = logging.getLogger(__name__)
+
+
+class LeasedTaskQueue:
+    """
+    基于数据库租约的任务队列, 多个副本从同一张表中领取任务
+
+    领取任务时通过带条件的 UPDATE 原子地把任务改为处理中并写入 owner 和租约到期时间, 只有更新行数为 1 的
+    worker 领取成功. 处理期间心跳线程定期续约, 进程宕机后租约过期, 任务会被其他 worker 重新领取.
+    子类指定任务表 table 和主键字段名 id_name, 表中需要有 status、owner、lease_expires_at 和 created_at 字段.
+    数据库暂时不可用时, 领取任务和心跳续约只记录错误并稍后重试, 不会结束任务线程或心跳线程.
+    """
+    table = None
+    id_name = None
+
+    def __init__(self, max_size=100, lease_seconds=120, poll_interval=1.0, max_retry_interval=30.0,
+                 heartbeat_interval=None):
+        """
+        :param max_size: 排队中的任务数上限
+        :param lease_seconds: 租约时长, 心跳线程在租约过期前续约
+        :param poll_interval: 没有可领取的任务时轮询数据库的间隔秒数
+        :param max_retry_interval: 数据库出错时重试间隔从 poll_interval 开始翻倍, 不超过该值
+        :param heartbeat_interval: 续约间隔秒数, 默认为租约时长的 1/3
+        """
+        self.max_size = max_size
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.max_retry_interval = max_retry_interval
+        self.heartbeat_interval = heartbeat_interval or max(lease_seconds / 3, 1)
+        # worker 标识, 同一台机器上的多个进程也不会重复
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        # 当前 worker 正在处理的任务, 由心跳线程续约
+        self.held_tasks = set()
+        self.held_tasks_lock = threading.Lock()
+
+        # 每个进程各自创建队列, ID 由进程专用的 Snowflake 生成, 避免多进程同一毫秒生成相同的 ID
+        self.Snowflake = process_snowflake()
+
+        self.heartbeat_thread = threading.Thread(target=self._heartbeat, daemon=True)
+        self.heartbeat_thread.start()
+
+    @property
+    def id_field(self):
+        return getattr(self.table, self.id_name)
+
+    def _lease_expires_at(self):
+        # 使用数据库时间, 避免不同节点之间的时钟偏差
+        return fn.DATE_ADD(fn.NOW(), SQL(f"INTERVAL {int(self.lease_seconds)} SECOND"))
+
+    def _claimable(self):
+        """排队中的任务, 或者租约已经过期的处理中任务"""
+        return (self.table.status == TaskStatus.PENDING.value) | (
+                (self.table.status == TaskStatus.PROCESSING.value) & (
+                self.table.lease_expires_at.is_null() | (self.table.lease_expires_at < fn.NOW())))
+
+    def _is_full(self):
+        pending_count = self.table.select().where(self.table.status == TaskStatus.PENDING.value).count()
+        return pending_count >= self.max_size
+
+    def get_task(self):
+        """领取一个任务, 没有可领取的任务时轮询等待, 数据库出错时退避重试."""
+        retry_interval = self.poll_interval
+        while True:
+            try:
+                task = self._claim_task()
+            except Exception:
+                # peewee 把驱动的异常包装为 peewee.OperationalError/InterfaceError, with_db_connection 不会捕获
+                logger.exception(f"领取任务失败, {retry_interval:.1f}s 后重试")
+                time.sleep(retry_interval)
+                retry_interval = min(retry_interval * 2, self.max_retry_interval)
+                continue
+            if task is not None:
+                return task
+            retry_interval = self.poll_interval
+            time.sleep(self.poll_interval)
+
+    @with_db_connection
+    def _claim_task(self):
+        candidates = (self.table
+                      .select(self.id_field)
+                      .where(self._claimable())
+                      .order_by(self.table.created_at)
+                      .limit(10))
+        for candidate in candidates:
+            task_id = getattr(candidate, self.id_name)
+            # 条件更新保证同一个任务只会被一个 worker 领取成功
+            rows = self.table.update(
+                status=TaskStatus.PROCESSING.value,
+                owner=self.owner,
+                lease_expires_at=self._lease_expires_at()
+            ).where((self.id_field == task_id) & self._claimable()).execute()
+            if rows != 1:
+                continue
+            with self.held_tasks_lock:
+                self.held_tasks.add(task_id)
+            task = self.table.get(self.id_field == task_id)
+            logger.debug(f"获取任务 {task_id} 成功")
+            return task.__data__
+        return None
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(self.heartbeat_interval)
+            with self.held_tasks_lock:
+                task_ids = list(self.held_tasks)
+            if not task_ids:
+                continue
+            try:
+                self._renew_leases(task_ids)
+            except Exception:
+                # 心跳线程退出后租约全部过期, 任务会被其他 worker 重复处理, 出错时只记录并在下一次心跳重试
+                logger.exception(f"任务续约失败: {task_ids}")
+
+    @with_db_connection
+    def _renew_leases(self, task_ids):
+        """为正在处理的任务续约."""
+        rows = self.table.update(lease_expires_at=self._lease_expires_at()).where(
+            self.id_field.in_(task_ids) &
+            (self.table.owner == self.owner) &
+            (self.table.status == TaskStatus.PROCESSING.value)).execute()
+        if rows != len(task_ids):
+            logger.warning(f"部分任务续约失败, 可能已被其他 worker 领取: {task_ids}")
+
+    def _release(self, task_id):
+        with self.held_tasks_lock:
+            self.held_tasks.discard(task_id)
+
+    def _owned(self, task_id):
+        return (self.id_field == task_id) & (self.table.owner == self.owner)
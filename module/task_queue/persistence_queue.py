@@ -2,12 +2,13 @@ import queue
 from module.ORM.mysql_config import db, with_db_connection
 from constants.ImageToVideoTaskConstants import TaskStatus
 from module.ORM.model import ImageToVideoTaskModel, ImageToVideoResultModel, VideoAndAudioToVideoTaskModel, \
-    VideoAndAudioToVideoResultModel
+    VideoAndAudioToVideoResultModel, AvatarTemplateModel, CallbackModel
 from module.ORM.table_config import ImageToVideoTask, ImageToVideoResult, VideoAndAudioToVideoTask, \
-    VideoAndAudioToVideoResult
+    VideoAndAudioToVideoResult, AvatarTemplate
 from peewee import DoesNotExist
 import logging
 
+from module.task_queue.leased_task_queue import LeasedTaskQueue
 from utils.snowflake import Snowflake
 
 logger = logging.getLogger(__name__)
@@ -102,33 +103,25 @@ class ImageToVideoTaskTaskQueue:
         return None
 
 
-class VideoAndAudioToVideoTaskTaskQueue:
-    def __init__(self, max_size=100):
-        # 初始化队列
-        self.queue = queue.Queue(max_size)
-        self.list = []
-
-        self.Snowflake = Snowflake(3, 1)
-
-        # 启动时加载未完成的任务到队列中
-        self._load_pending_tasks()
-
-    @with_db_connection
-    def _load_pending_tasks(self):
-        """从数据库加载状态为排队中或处理中（status = 0 或 1）的任务."""
-        pending_tasks = VideoAndAudioToVideoTask.select().where(
-            (VideoAndAudioToVideoTask.status == TaskStatus.PENDING.value) | (
-                    VideoAndAudioToVideoTask.status == TaskStatus.PROCESSING.value)
-        )
-        logger.info(f"加载 {pending_tasks.count()} 个未完成任务到队列中")
+class VideoAndAudioToVideoTaskTaskQueue(LeasedTaskQueue):
+    """
+    视频 + 音频生成视频的任务队列.
+    任务结束时的回调与任务状态在同一个事务中写入 callback_outbox, 由 CallbackDispatcher 投递.
+    """
+    table = VideoAndAudioToVideoTask
+    id_name = "task_id"
 
-        for task in pending_tasks:
-            self.queue.put(task.__data__)
+    def __init__(self, max_size=100, lease_seconds=120, poll_interval=1.0, callback_outbox=None):
+        """
+        :param callback_outbox: CallbackOutbox, 标记任务完成或失败时传入的回调写入其中
+        """
+        super().__init__(max_size, lease_seconds, poll_interval)
+        self.callback_outbox = callback_outbox
 
     @with_db_connection
     def add_task(self, data: VideoAndAudioToVideoTaskModel):
-        """添加新任务到队列和数据库."""
-        if self.queue.full():
+        """添加新任务到数据库."""
+        if self._is_full():
             logger.info("任务队列已满")
             return None
         # 如果外面提供了id 则使用外面的id
@@ -138,45 +131,45 @@ class VideoAndAudioToVideoTaskTaskQueue:
 
         # 创建新任务记录
         new_task = VideoAndAudioToVideoTask.create(**data.model_dump())
-        # 添加任务到队列
-        self.queue.put(data.model_dump())
         logger.debug(f"添加任务 {new_task.task_id} 成功")
         return data.task_id
 
     @with_db_connection
-    def get_task(self):
-        """从队列中获取一个任务."""
-        task = self.queue.get()
-        # 设置状态为处理中
-        task_id = task.get('task_id')
-
-        VideoAndAudioToVideoTask.update(status=TaskStatus.PROCESSING.value).where(
-            VideoAndAudioToVideoTask.task_id == task_id).execute()
-
-        logger.debug(f"获取任务 {task_id} 成功")
-        return task
-
-    @with_db_connection
-    def mark_task_as_done(self, task_id: int, result: VideoAndAudioToVideoResultModel):
-        """标记任务为完成并更新数据库中的状态, 同时将结果保存到结果表."""
+    def mark_task_as_done(self, task_id: int, result: VideoAndAudioToVideoResultModel,
+                          callback: CallbackModel = None):
+        """标记任务为完成并更新数据库中的状态, 同时将结果保存到结果表, 回调写入发件箱."""
+        self._release(task_id)
         if result.result_id is None:
             result.result_id = self.Snowflake.generate()
         # 创建新结果记录
-        with db.atomic():
+        with db.atomic() as transaction:
             VideoAndAudioToVideoResult.create(**result.model_dump())
-            # 更新任务状态
-            VideoAndAudioToVideoTask.update(status=TaskStatus.COMPLETED.value, result_id=result.result_id).where(
-                VideoAndAudioToVideoTask.task_id == task_id).execute()
+            # 更新任务状态, 租约已经被其他 worker 接管时放弃本次结果
+            rows = VideoAndAudioToVideoTask.update(status=TaskStatus.COMPLETED.value, result_id=result.result_id,
+                                                   lease_expires_at=None).where(self._owned(task_id)).execute()
+            if rows != 1:
+                transaction.rollback()
+                logger.warning(f"任务 {task_id} 已不属于当前 worker, 放弃结果")
+                return
+            if callback is not None:
+                self.callback_outbox.add(callback)
         logger.info(f"任务 {task_id} 处理完成")
 
     @with_db_connection
-    def mark_task_as_failed(self, task_id: int, failed_reason: str):
-        """标记任务为失败并更新数据库中的状态."""
+    def mark_task_as_failed(self, task_id: int, failed_reason: str, callback: CallbackModel = None):
+        """标记任务为失败并更新数据库中的状态, 回调写入发件箱."""
+        self._release(task_id)
         result_id = self.Snowflake.generate()
-        with db.atomic():
-            VideoAndAudioToVideoTask.update(status=TaskStatus.FAILED.value, result_id=result_id).where(
-                VideoAndAudioToVideoTask.task_id == task_id).execute()
+        with db.atomic() as transaction:
+            rows = VideoAndAudioToVideoTask.update(status=TaskStatus.FAILED.value, result_id=result_id,
+                                                   lease_expires_at=None).where(self._owned(task_id)).execute()
+            if rows != 1:
+                transaction.rollback()
+                logger.warning(f"任务 {task_id} 已不属于当前 worker, 不标记失败")
+                return
             VideoAndAudioToVideoResult.create(result_id=result_id, failed_reason=failed_reason)
+            if callback is not None:
+                self.callback_outbox.add(callback)
         logger.error(f"任务 {task_id} 处理失败")
 
     @with_db_connection
@@ -192,3 +185,57 @@ class VideoAndAudioToVideoTaskTaskQueue:
             result = VideoAndAudioToVideoResult.get(VideoAndAudioToVideoResult.result_id == task.result_id)
             return result.__data__
         return None
+
+
+class AvatarTemplateTaskQueue(LeasedTaskQueue):
+    """
+    模板预处理任务队列, 与 VideoAndAudioToVideoTaskTaskQueue 一样通过租约领取,
+    多个副本和子进程共享同一张表, 同一个模板只会被一个 worker 预处理.
+    """
+    table = AvatarTemplate
+    id_name = "template_id"
+
+    @with_db_connection
+    def add_task(self, data: AvatarTemplateModel):
+        """添加新的模板预处理任务到数据库."""
+        if self._is_full():
+            logger.info("模板预处理队列已满")
+            return None
+        if data.template_id is None:
+            data.template_id = self.Snowflake.generate()
+
+        AvatarTemplate.create(**data.model_dump())
+        logger.debug(f"添加模板预处理任务 {data.template_id} 成功")
+        return data.template_id
+
+    @with_db_connection
+    def mark_task_as_done(self, template_id: int, frame_count: int, fps: float):
+        """标记模板预处理完成, 同时记录模板帧数和帧率."""
+        self._release(template_id)
+        rows = AvatarTemplate.update(status=TaskStatus.COMPLETED.value, frame_count=frame_count, fps=fps,
+                                     lease_expires_at=None).where(self._owned(template_id)).execute()
+        if rows != 1:
+            logger.warning(f"模板 {template_id} 已不属于当前 worker, 不更新状态")
+            return
+        logger.info(f"模板 {template_id} 预处理完成")
+
+    @with_db_connection
+    def mark_task_as_failed(self, template_id: int, failed_reason: str):
+        """标记模板预处理失败."""
+        self._release(template_id)
+        rows = AvatarTemplate.update(status=TaskStatus.FAILED.value, failed_reason=failed_reason,
+                                     lease_expires_at=None).where(self._owned(template_id)).execute()
+        if rows != 1:
+            logger.warning(f"模板 {template_id} 已不属于当前 worker, 不标记失败")
+            return
+        logger.error(f"模板 {template_id} 预处理失败")
+
+    @with_db_connection
+    def get_result(self, template_id: int):
+        """获取模板记录."""
+        try:
+            template = AvatarTemplate.get(AvatarTemplate.template_id == template_id)
+        except DoesNotExist:
+            logger.error(f"模板 {template_id} 不存在")
+            return None
+        return template.__data__
@@ -0,0 +1,87 @@
+import logging
+import os
+import uuid
+from threading import Thread, Lock
+
+from constants.ImageToVideoTaskConstants import TaskStatus
+from model.Wav2Lip.avatar_template import AvatarTemplateBundle
+from model.Wav2Lip.wav2lip_handle import Wav2LipHandle, Wav2LipInputModel
+from module.OSS.video_oparetion import OSSVideoService
+from module.config.env_config import config
+from module.task_queue.persistence_queue import AvatarTemplateTaskQueue
+
+logger = logging.getLogger(__name__)
+
+# 模板预处理任务队列
+avatar_template_queue = AvatarTemplateTaskQueue(config.get("avatar_template_queue_size", 100, int))
+
+
+class AvatarTemplateService:
+    """
+    模板视频预处理服务, 预处理结果保存在本地, 任务引用模板时直接使用
+    """
+
+    def __init__(self, get_face_handle, temp_path="model/Wav2Lip/temp"):
+        """
+        :param get_face_handle: 返回 Wav2LipHandle 的函数, 多进程模式下主进程的模型在第一次使用时才加载
+        :param temp_path: 模板视频的下载目录, 多进程模式下每个子进程使用独立的目录
+        """
+        self.get_face_handle = get_face_handle
+        self.OSSVideoService = OSSVideoService()
+        self.temp_path = temp_path
+        # 进程内同一时刻只预处理一个模板, 跨进程由模板的文件锁保证同一模板不会被重复预处理
+        self.build_lock = Lock()
+        self.thread = Thread(target=self.run, daemon=True)
+
+    @property
+    def face_handle(self) -> Wav2LipHandle:
+        return self.get_face_handle()
+
+    def start(self):
+        self.thread.start()
+        logger.info("模板预处理服务已启动")
+
+    def build_template(self, template_id, video_key) -> AvatarTemplateBundle:
+        avatar_templates = self.face_handle.avatar_templates
+        with self.build_lock, avatar_templates.lock(template_id):
+            # 等待锁期间其他进程可能已经完成预处理
+            if avatar_templates.exists(template_id):
+                return avatar_templates.load(template_id)
+
+            video_file_path = os.path.join(self.temp_path, f"template_{template_id}_{uuid.uuid4().hex[:8]}.mp4")
+            self.OSSVideoService.download_file_to_file(video_key, video_file_path)
+            logger.debug(f"模板 {template_id} 视频下载完成, 地址: {video_file_path}")
+            try:
+                return self.face_handle.build_avatar_template(template_id, Wav2LipInputModel.parse_obj({
+                    "video_path": video_file_path,
+                    "audio_path": ""
+                }))
+            finally:
+                os.remove(video_file_path)
+
+    def ensure_template(self, template_id):
+        """
+        确保模板在本地可用, 本地不存在时 (其他节点预处理或本地文件被清理) 根据数据库记录重新预处理
+        """
+        if self.face_handle.avatar_templates.exists(template_id):
+            return
+        template = avatar_template_queue.get_result(template_id)
+        if template is None or template.get("status") != TaskStatus.COMPLETED.value:
+            raise ValueError(f"模板 {template_id} 不存在或未完成预处理")
+        logger.info(f"模板 {template_id} 本地不存在, 重新预处理")
+        self.build_template(template_id, template.get("video_key"))
+
+    def run(self):
+        while True:
+            task = avatar_template_queue.get_task()
+            template_id = task.get("template_id")
+            try:
+                template = self.build_template(template_id, task.get("video_key"))
+                avatar_template_queue.mark_task_as_done(template_id, template.frame_count, template.fps)
+            except Exception as e:
+                logger.error(f"模板 {template_id} 预处理失败: {e}")
+                try:
+                    avatar_template_queue.mark_task_as_failed(template_id, str(e))
+                except Exception:
+                    # 数据库出错时预处理线程继续领取任务, 该模板的租约过期后由其他 worker 重新处理
+                    logger.exception(f"模板 {template_id} 标记失败时出错")
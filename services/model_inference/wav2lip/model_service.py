@@ -1,103 +1,257 @@
 import os.path
-from threading import Thread
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Thread, Lock
 import logging
 from typing import Dict
 
-import requests
+import oss2
 
 from model.Wav2Lip.wav2lip_handle import Wav2LipHandle, Wav2LipInputModel
 from module.ORM.model import ImageToVideoTaskModel, ImageToVideoResultModel, VideoAndAudioToVideoTaskModel, \
-    VideoAndAudioToVideoResultModel
+    VideoAndAudioToVideoResultModel, CallbackModel
 from module.OSS.Audio_oparetion import OSSAudioService
 from module.OSS.video_oparetion import OSSVideoService
+from module.callback.callback_dispatcher import CallbackDispatcher
 from module.config.env_config import config
 from module.retry.simple_retry import retry_with_timeout
+from module.task_queue.callback_outbox import CallbackOutbox
 from module.task_queue.persistence_queue import ImageToVideoTaskTaskQueue, VideoAndAudioToVideoTaskTaskQueue
+from services.model_inference.wav2lip.avatar_template_service import AvatarTemplateService
+from services.model_inference.wav2lip.process_worker import ProcessWorkerSupervisor
+from utils.growing_file import GrowingFile
 
 logger = logging.getLogger(__name__)
 
+# 回调发件箱, 任务结束时回调与任务状态一同写入数据库
+callback_outbox = CallbackOutbox(config.get("callback_lease_seconds", 60, int))
+
 # 任务队列
 video_with_audio_task_queue = VideoAndAudioToVideoTaskTaskQueue(
-    config.get("video_with_audio_task_service_queue_size", 100, int))
+    config.get("video_with_audio_task_service_queue_size", 100, int),
+    lease_seconds=config.get("video_with_audio_task_lease_seconds", 120, int),
+    poll_interval=config.get("video_with_audio_task_poll_interval", 1, float),
+    callback_outbox=callback_outbox)
 
 
 def callback():
     print("任务失败")
 
 
+def create_face_handle(device=None, temp_dir=None) -> Wav2LipHandle:
+    """按 wav2lip_backend 配置创建处理类, torch 或 onnx"""
+    backend = config.get("wav2lip_backend", "torch")
+    if backend == "onnx":
+        # onnxruntime 为可选依赖, 只在启用时导入
+        from model.Wav2Lip.wav2lip_onnx_handle import Wav2LipOnnxHandle
+        return Wav2LipOnnxHandle(device=device, temp_dir=temp_dir)
+    if backend != "torch":
+        raise ValueError(f"不支持的 wav2lip 推理后端: {backend}, 可选: torch, onnx")
+    return Wav2LipHandle(device=device, temp_dir=temp_dir)
+
+
+def get_worker_devices():
+    """多进程模式下每个子进程使用的设备, 未配置设备时由子进程自动选择"""
+    devices = [device.strip() for device in config.get("video_with_audio_worker_devices", "").split(",")
+               if device.strip()]
+    process_num = config.get("video_with_audio_worker_process_num", len(devices) or 1, int)
+    return [devices[i % len(devices)] if devices else None for i in range(process_num)]
+
+
 class VideoAndAudioToVideoService:
-    def __init__(self, work_num=1):
-        self.face_handle = Wav2LipHandle()
-        self.face_handle.initialize()
+    def __init__(self, work_num=1, worker_mode=None, device=None, temp_path=None):
+        """
+        :param work_num: 任务线程数, 多进程模式下为每个子进程中的线程数
+        :param worker_mode: thread 在当前进程中启动任务线程, process 启动多个独立的 worker 子进程
+        :param device: 推理设备, 默认有 GPU 时使用 cuda
+        :param temp_path: 临时文件目录, 多进程模式下每个子进程使用独立的目录
+        """
+        self.worker_mode = worker_mode or config.get("video_with_audio_worker_mode", "thread")
+        self.device = device
+        self.handle_temp_dir = temp_path
+        self._face_handle = None
+        self.face_handle_lock = Lock()
         self.ThreadPool = []
+        # 每个任务线程最多同时提交一个视频下载或模板准备
+        self.download_executor = ThreadPoolExecutor(max_workers=work_num, thread_name_prefix="wav2lip-download")
+        # 边下载边推理, 视频开头下载完成后即开始解码和人脸检测
+        self.stream_input = config.get("video_stream_input_enabled", True, dtype=bool)
+        self.supervisor = None
+        # 回调在主进程的独立线程中异步投递, 多进程模式下子进程写入的回调通过轮询发件箱领取
+        self.callback_dispatcher = CallbackDispatcher(
+            callback_outbox,
+            max_connections=config.get("callback_max_connections", 20, int),
+            timeout=config.get("callback_timeout_seconds", 10, float),
+            max_attempts=config.get("callback_max_attempts", 8, int),
+            base_delay=config.get("callback_retry_base_delay", 2, float),
+            max_delay=config.get("callback_retry_max_delay", 600, float),
+            poll_interval=config.get("callback_poll_interval", 5, float))
         self.OSSAudioService = OSSAudioService()
         self.OSSVideoService = OSSVideoService()
-        self.temp_path = "model/Wav2Lip/temp"
+        # 结果上传失败时只重试上传, 间隔按指数退避
+        self.upload_max_attempts = config.get("oss_upload_max_attempts", 3, int)
+        self.upload_retry_base_delay = config.get("oss_upload_retry_base_delay", 2, float)
+        self.temp_path = temp_path or "model/Wav2Lip/temp"
+        self.avatar_template_service = AvatarTemplateService(lambda: self.face_handle, self.temp_path)
+        if self.worker_mode == "process":
+            devices = get_worker_devices()
+            self.supervisor = ProcessWorkerSupervisor(devices, work_num, self.temp_path)
+            logger.info(f"初始化wav2lip服务成功, 进程数: {len(devices)}, 每个进程线程数: {work_num}")
+            return
+        # 启动时加载模型
+        self.face_handle
         for i in range(work_num):
             self.ThreadPool.append(Thread(target=self.run, daemon=True))
         logger.info(f"初始化wav2lip服务成功, 线程数: {work_num}")
 
+    @property
+    def face_handle(self) -> Wav2LipHandle:
+        """多进程模式下主进程只在 gradio 或模板预处理用到时才加载模型"""
+        if self._face_handle is None:
+            with self.face_handle_lock:
+                if self._face_handle is None:
+                    face_handle = create_face_handle(self.device, self.handle_temp_dir)
+                    face_handle.initialize()
+                    self._face_handle = face_handle
+        return self._face_handle
+
     def start(self):
-        for thd in self.ThreadPool:
-            thd.start()
+        self.callback_dispatcher.start()
+        if self.supervisor is not None:
+            self.supervisor.start()
+        else:
+            self.start_threads()
+        self.avatar_template_service.start()
 
         logger.info("wav2lip服务已启动")
 
+    def start_threads(self):
+        for thd in self.ThreadPool:
+            thd.start()
+
     @retry_with_timeout(max_attempts=3, delay=5, timeout_seconds=300, fail_callback=callback)
     def process_task(self, task: Dict):
+        """下载输入并生成视频, 返回编码输出文件路径, 上传由 upload_result 单独重试"""
         logger.debug(f"开始处理任务 {task.get('task_id')}")
         task_id = task.get("task_id")
         video_key = task.get("video_key")
         audio_key = task.get("audio_key")
         improve_video = task.get("improve_video")
+        template_id = task.get("template_id")
 
-        # 下载视频到临时文件
-        # todo 支持更多格式文件
-        video_file_path = os.path.join(self.temp_path, f"{task_id}.mp4")
-        self.OSSVideoService.download_file_to_file(video_key, video_file_path)
-        logger.debug(f"任务 {task_id} 视频下载完成, 地址: {video_file_path}")
+        video_file_path = None
+        video_stream = None
+        if template_id is not None:
+            # 使用预处理好的模板, 不需要下载视频
+            video_future = self.download_executor.submit(self.avatar_template_service.ensure_template, template_id)
+        elif self.stream_input:
+            video_file_path = os.path.join(self.temp_path, f"{task_id}.mp4")
+            video_stream = GrowingFile(video_file_path)
+            video_future = self.download_executor.submit(self.OSSVideoService.download_to_growing_file, video_key,
+                                                         video_stream)
+        else:
+            # 下载视频到临时文件, 与音频下载同时进行
+            # todo 支持更多格式文件
+            video_file_path = os.path.join(self.temp_path, f"{task_id}.mp4")
+            video_future = self.download_executor.submit(self.OSSVideoService.download_file_to_file, video_key,
+                                                         video_file_path)
         # 下载音频到临时文件
         # todo 支持更多格式文件
         audio_file_path = os.path.join(self.temp_path, f"{task_id}.wav")
-        self.OSSAudioService.download_audio_to_file(audio_key, audio_file_path)
-        logger.debug(f"任务 {task_id} 音频下载完成, 地址: {audio_file_path}")
-        result = self.face_handle.handle(Wav2LipInputModel.parse_obj({
-            "video_path": video_file_path,
-            "audio_path": audio_file_path,
-            "improve_video":improve_video
-        }))
-        # 上传到 OSS
-        result_object_key = str(task_id) + ".mp4"
-        full_key = self.OSSVideoService.upload_video_from_bytes(result_object_key, result)
-        logger.debug(f"任务 {task_id} 结果上传完成, 地址: {result_object_key}")
+        try:
+            self.OSSAudioService.download_audio_to_file(audio_key, audio_file_path)
+            logger.debug(f"任务 {task_id} 音频下载完成, 地址: {audio_file_path}")
+            if video_stream is None:
+                video_future.result()
+                if video_file_path is not None:
+                    logger.debug(f"任务 {task_id} 视频下载完成, 地址: {video_file_path}")
+            result_file_path = self.face_handle.handle_to_file(Wav2LipInputModel.parse_obj({
+                "video_path": video_file_path,
+                "video_stream": video_stream,
+                "audio_path": audio_file_path,
+                "template_id": template_id,
+                "improve_video":improve_video
+            }))
+        finally:
+            # 音频比视频短时不需要剩余的视频内容; 失败时也等待视频下载结束, 避免重试时两次下载写同一个文件
+            if video_stream is not None:
+                video_stream.cancel()
+            wait([video_future])
         # 删除临时文件
-        os.remove(video_file_path)
+        if video_file_path is not None and os.path.exists(video_file_path):
+            os.remove(video_file_path)
         os.remove(audio_file_path)
-        logger.debug(f"任务 {task_id} 处理完成")
+        logger.debug(f"任务 {task_id} 生成完成, 结果文件: {result_file_path}")
+        return result_file_path
+
+    def upload_result(self, task_id, result_file_path):
+        """
+        直接从编码输出文件分片上传到 OSS, 不把视频读入内存.
+        上传失败时只重试上传, 结果文件保留到重试结束, 断点续传从已上传的分片继续, 不重新推理.
+        不设超时: 超时无法取消正在进行的分片上传, 重试会与未结束的上传同时进行
+        """
+        result_object_key = str(task_id) + ".mp4"
+        attempt = 1
+        while True:
+            try:
+                full_key = self.OSSVideoService.upload_video_resumable(result_object_key, result_file_path)
+                break
+            except oss2.exceptions.OssError as e:
+                # RequestError (网络错误) 也是 OssError 的子类
+                if attempt >= self.upload_max_attempts:
+                    raise
+                delay = self.upload_retry_base_delay * 2 ** (attempt - 1)
+                logger.warning(f"任务 {task_id} 结果上传失败 (第 {attempt} 次), {delay:.0f} 秒后重试: {e}")
+                time.sleep(delay)
+                attempt += 1
+        logger.debug(f"任务 {task_id} 结果上传完成, 地址: {result_object_key}")
         return full_key
 
+    def generate_and_upload(self, task: Dict):
+        """生成视频并上传, 返回结果在 OSS 上的 key"""
+        result_file_path = self.process_task(task)
+        try:
+            return self.upload_result(task.get("task_id"), result_file_path)
+        finally:
+            os.remove(result_file_path)
+
+    @staticmethod
+    def _make_callback(task, payload):
+        """任务没有回调地址时返回 None; 回调至少投递一次, data 中带上 task_id 供接收方去重"""
+        if not task.get("callback_url"):
+            return None
+        payload["data"]["task_id"] = task.get("task_id")
+        return CallbackModel(task_id=task.get("task_id"), url=task.get("callback_url"), payload=payload)
+
     def run(self):
         while True:
             task = video_with_audio_task_queue.get_task()
             try:
-                full_key = self.process_task(task)
+                full_key = self.generate_and_upload(task)
                 video_with_audio_task_queue.mark_task_as_done(task.get('task_id'),
                                                               VideoAndAudioToVideoResultModel.parse_obj({
                                                                   "video_key": full_key
-                                                              }))
-                # 调用回调
-                if task.get("callback_url"):
-                    requests.post(task.get("callback_url"),
-                                  json={"code": 200, "msg": "success", "data": {"video_key": full_key}})
+                                                              }),
+                                                              self._make_callback(task, {
+                                                                  "code": 200, "msg": "success",
+                                                                  "data": {"video_key": full_key}}))
 
             except Exception as e:
                 logger.error(f"任务 {task.get('task_id')} 处理失败: {e}")
-                video_with_audio_task_queue.mark_task_as_failed(task.get('task_id'), str(e))
-                if task.get("callback_url"):
-                    requests.post(task.get("callback_url"),
-                                  json={"code": 500, "msg": "failed", "data": {"reason": str(e)}})
+                try:
+                    video_with_audio_task_queue.mark_task_as_failed(task.get('task_id'), str(e), self._make_callback(
+                        task, {"code": 500, "msg": "failed", "data": {"reason": str(e)}}))
+                except Exception:
+                    # 数据库出错时任务线程继续领取任务, 该任务的租约过期后由其他 worker 重新处理
+                    logger.exception(f"任务 {task.get('task_id')} 标记失败时出错")
+            # 回调由 callback_dispatcher 投递, 任务线程直接领取下一个任务
+            if task.get("callback_url"):
+                self.callback_dispatcher.notify()
 
     def stop(self):
+        if self.supervisor is not None:
+            self.supervisor.stop()
+        self.callback_dispatcher.stop(config.get("callback_timeout_seconds", 10, float))
         # 等待所有线程完成
         logger.info("所有线程已停止")
 
@@ -0,0 +1,95 @@
+"""
+多进程 worker 模式
+
+每个子进程加载独立的 Wav2Lip 模型, 使用独立的临时目录, 从数据库任务队列中领取任务, 互不争抢 GIL.
+主进程中的 ProcessWorkerSupervisor 负责启动子进程, 子进程异常退出后自动重启.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def worker_main(worker_index, device, thread_num, temp_path):
+    """
+    子进程入口, 在子进程中导入服务模块, 避免主进程的模型和 CUDA 上下文被继承
+    """
+    # 在导入服务模块 (创建任务队列) 之前设置, 每个子进程生成 ID 时使用不同的 worker_id, 主进程为 0
+    os.environ["snowflake_worker_id"] = str(worker_index + 1)
+    import torch
+    from services.model_inference.wav2lip.model_service import VideoAndAudioToVideoService
+
+    if device is not None and device.startswith("cuda"):
+        torch.cuda.set_device(device)
+    service = VideoAndAudioToVideoService(thread_num, worker_mode="thread", device=device, temp_path=temp_path)
+    service.start_threads()
+    logger.info(f"wav2lip worker 进程 {worker_index} 已启动, pid: {os.getpid()}, 设备: {service.face_handle.device}")
+    for thd in service.ThreadPool:
+        thd.join()
+
+
+class ProcessWorkerSupervisor:
+    """
+    管理 wav2lip worker 子进程
+    """
+
+    def __init__(self, devices, thread_num=1, temp_root="model/Wav2Lip/temp", check_interval=5):
+        """
+        :param devices: 每个子进程使用的设备, 进程数与列表长度相同, None 表示自动选择
+        :param thread_num: 每个子进程中的任务线程数
+        :param temp_root: 子进程临时目录的根目录, 每个进程使用 worker_<序号> 子目录
+        :param check_interval: 检查子进程存活的间隔秒数
+        """
+        # 子进程的 snowflake_worker_id 为序号 + 1, 只有 5 位
+        if len(devices) > 31:
+            raise ValueError(f"worker 子进程数不能超过 31: {len(devices)}")
+        self.devices = devices
+        self.thread_num = thread_num
+        self.temp_root = temp_root
+        self.check_interval = check_interval
+        # 使用 spawn 启动, fork 会复制主进程中已经初始化的 CUDA 上下文
+        self.context = multiprocessing.get_context("spawn")
+        self.processes = [None] * len(devices)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def _spawn(self, worker_index):
+        temp_path = os.path.join(self.temp_root, f"worker_{worker_index}")
+        os.makedirs(temp_path, exist_ok=True)
+        process = self.context.Process(target=worker_main,
+                                       args=(worker_index, self.devices[worker_index], self.thread_num, temp_path),
+                                       name=f"wav2lip-worker-{worker_index}", daemon=True)
+        process.start()
+        self.processes[worker_index] = process
+        logger.info(f"启动 wav2lip worker 进程 {worker_index}, pid: {process.pid}, 设备: {self.devices[worker_index]}")
+
+    def start(self):
+        for worker_index in range(len(self.devices)):
+            self._spawn(worker_index)
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.check_interval):
+            for worker_index, process in enumerate(self.processes):
+                if process.is_alive() or self.stopped.is_set():
+                    continue
+                # 子进程退出时正在处理的任务租约会过期, 由其他 worker 重新领取
+                logger.error(f"wav2lip worker 进程 {worker_index} 退出, 退出码: {process.exitcode}, 重新启动")
+                self._spawn(worker_index)
+
+    def stop(self):
+        self.stopped.set()
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                process.join(timeout=10)
+        logger.info("wav2lip worker 进程已停止")
+
+    def status(self):
+        return [{"worker": worker_index, "pid": process.pid, "alive": process.is_alive(),
+                 "device": self.devices[worker_index]}
+                for worker_index, process in enumerate(self.processes) if process is not None]
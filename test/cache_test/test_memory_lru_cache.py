@@ -0,0 +1,23 @@
+from module.cache.memory_lru_cache import MemoryLRUCache
+
+
+def test_memory_lru_cache_evicts_least_recently_used():
+    cache = MemoryLRUCache(100)
+    cache.put("a", 1, 40)
+    cache.put("b", 2, 40)
+    assert cache.get("a") == 1
+    # b 最久未使用, 被淘汰
+    cache.put("c", 3, 40)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["bytes"] == 80
+
+
+def test_memory_lru_cache_skips_oversized_items():
+    cache = MemoryLRUCache(10)
+    cache.put("a", 1, 11)
+    assert cache.get("a") is None
@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+from module.callback.callback_dispatcher import CallbackDispatcher
+
+
+class FakeOutbox:
+    """内存中的发件箱, 只实现 CallbackDispatcher 用到的接口, 重试立即到期"""
+
+    def __init__(self, callbacks):
+        self.pending = [dict(callback, attempts=0) for callback in callbacks]
+        self.results = {}
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+
+    def claim_due(self, limit):
+        with self.lock:
+            claimed, self.pending = self.pending[:limit], self.pending[limit:]
+        return claimed
+
+    def _finish(self, callback_id, result):
+        with self.lock:
+            self.results[callback_id] = result
+            if len(self.results) == self.total:
+                self.done.set()
+
+    def mark_delivered(self, callback_id, attempts):
+        self._finish(callback_id, ("delivered", attempts))
+
+    def mark_abandoned(self, callback_id, attempts, error):
+        self._finish(callback_id, ("abandoned", attempts))
+
+    def schedule_retry(self, callback_id, attempts, delay, error):
+        with self.lock:
+            self.pending.append({"callback_id": callback_id, "task_id": callback_id, "url": self.urls[callback_id],
+                                 "payload": {}, "attempts": attempts})
+
+
+def _make_outbox(urls):
+    outbox = FakeOutbox([{"callback_id": i, "task_id": i, "url": url, "payload": {"code": 200}}
+                         for i, url in enumerate(urls)])
+    outbox.urls, outbox.total = dict(enumerate(urls)), len(urls)
+    return outbox
+
+
+def _run(outbox, handler, **kwargs):
+    dispatcher = CallbackDispatcher(outbox, transport=httpx.MockTransport(handler), base_delay=0, poll_interval=0.05,
+                                    **kwargs)
+    dispatcher.start()
+    dispatcher.notify()
+    assert outbox.done.wait(5)
+    dispatcher.stop(5)
+    assert not dispatcher.thread.is_alive()
+    return outbox.results
+
+
+def test_retries_transient_failures_and_gives_up_on_client_errors():
+    calls = {}
+
+    def handler(request):
+        path = request.url.path
+        calls[path] = calls.get(path, 0) + 1
+        if path == "/flaky" and calls[path] < 3:
+            return httpx.Response(503)
+        if path == "/timeout":
+            raise httpx.ReadTimeout("timed out", request=request)
+        if path == "/gone":
+            return httpx.Response(404)
+        return httpx.Response(200)
+
+    urls = ["http://a/ok", "http://a/flaky", "http://a/timeout", "http://a/gone"]
+    results = _run(_make_outbox(urls), handler, max_attempts=4)
+
+    assert results == {0: ("delivered", 1), 1: ("delivered", 3), 2: ("abandoned", 4), 3: ("abandoned", 1)}
+
+
+def test_slow_endpoints_are_delivered_concurrently():
+    async def handler(request):
+        await asyncio.sleep(0.2)
+        return httpx.Response(200)
+
+    outbox = _make_outbox([f"http://a/{i}" for i in range(10)])
+    start = time.perf_counter()
+    results = _run(outbox, handler, max_connections=10)
+    assert time.perf_counter() - start < 1.5
+    assert all(result == ("delivered", 1) for result in results.values())
+
+
+@pytest.mark.parametrize("attempts, low, high", [(1, 1, 2), (3, 4, 8), (20, 300, 600)])
+def test_retry_delay_is_exponential_with_jitter_and_capped(attempts, low, high):
+    dispatcher = CallbackDispatcher(None, base_delay=2, max_delay=600)
+    for _ in range(20):
+        assert low <= dispatcher.retry_delay(attempts) <= high
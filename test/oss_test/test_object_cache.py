@@ -0,0 +1,96 @@
+import os
+
+# aliyun_oss 在导入时检查 OSS 配置
+for _key in ("oss_access_key_id", "oss_access_key_secret", "endpoint"):
+    os.environ.setdefault(_key, "test")
+os.environ.setdefault("bucket_name", "test-bucket")
+
+from module.OSS.aliyun_oss import OSSBase
+from module.OSS.object_cache import OSSObjectCache
+from test.oss_test.fake_bucket import FakeBucket
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _make_service(tmp_path, max_bytes=1000):
+    service = OSSBase("video", OSSObjectCache(str(tmp_path / "cache"), max_bytes))
+    service.bucket = FakeBucket()
+    return service
+
+
+def test_hit_is_revalidated_with_conditional_get(tmp_path):
+    service = _make_service(tmp_path)
+    service.bucket.put("video/a.mp4", b"a" * 100)
+
+    first, second = str(tmp_path / "1.mp4"), str(tmp_path / "2.mp4")
+    service.download_file_to_file("video/a.mp4", first)
+    # 调用方删除下载的文件不影响缓存
+    os.remove(first)
+    service.bucket.requests.clear()
+    service.download_file_to_file("video/a.mp4", second)
+
+    assert _read(second) == b"a" * 100
+    assert [r[0] for r in service.bucket.requests] == ["get"]
+    stats = service.object_cache.stats()
+    assert (stats["downloaded"], stats["revalidated"], stats["refreshed"]) == (1, 1, 0)
+
+
+def test_updated_object_replaces_cached_version(tmp_path):
+    service = _make_service(tmp_path)
+    service.bucket.put("video/a.mp4", b"old")
+    service.download_file_to_file("video/a.mp4", str(tmp_path / "1.mp4"))
+
+    service.bucket.put("video/a.mp4", b"new")
+    path = str(tmp_path / "2.mp4")
+    service.download_file_to_file("video/a.mp4", path)
+
+    assert _read(path) == b"new"
+    stats = service.object_cache.stats()
+    assert stats["refreshed"] == 1
+    # 旧版本被删除
+    assert stats["entries"] == 1
+
+
+def test_least_recently_used_object_is_evicted(tmp_path):
+    service = _make_service(tmp_path, max_bytes=250)
+    for name in ("a", "b", "c"):
+        service.bucket.put(f"video/{name}.mp4", name.encode() * 100)
+        service.download_file_to_file(f"video/{name}.mp4", str(tmp_path / f"{name}.mp4"))
+        os.utime(service.object_cache._find_entries(f"video/{name}.mp4")[0],
+                 (len(service.bucket.requests),) * 2)
+
+    assert service.object_cache.stats()["evictions"] == 1
+    assert service.object_cache._find_entries("video/a.mp4") == []
+    # 被淘汰的对象重新下载
+    path = str(tmp_path / "a2.mp4")
+    service.download_file_to_file("video/a.mp4", path)
+    assert _read(path) == b"a" * 100
+    assert service.object_cache.stats()["downloaded"] == 4
+
+
+def test_stale_hardlink_at_local_path_does_not_corrupt_cache(tmp_path):
+    service = _make_service(tmp_path)
+    service.bucket.put("video/a.mp4", b"a" * 100)
+    service.bucket.put("video/b.mp4", b"b" * 100)
+    service.bucket.put("video/c.mp4", b"c" * 100)
+    # 上次失败的任务残留的本地文件是缓存文件的硬链接, 重试时同一路径用于其他对象
+    path = str(tmp_path / "task.mp4")
+    service.download_file_to_file("video/a.mp4", path)
+    cached = service.object_cache._find_entries("video/a.mp4")[0]
+    assert os.path.samefile(path, cached)
+
+    # 本地没有缓存时完整下载
+    service.download_file_to_file("video/b.mp4", path)
+    assert _read(path) == b"b" * 100
+    assert _read(cached) == b"a" * 100
+
+    # 对象更新后条件 GET 返回新内容
+    service.download_file_to_file("video/c.mp4", str(tmp_path / "c.mp4"))
+    os.link(service.object_cache._find_entries("video/c.mp4")[0], str(tmp_path / "task2.mp4"))
+    service.bucket.put("video/a.mp4", b"new")
+    service.download_file_to_file("video/a.mp4", str(tmp_path / "task2.mp4"))
+    assert _read(str(tmp_path / "task2.mp4")) == b"new"
+    assert _read(service.object_cache._find_entries("video/c.mp4")[0]) == b"c" * 100
@@ -0,0 +1,82 @@
+import os
+
+# aliyun_oss 在导入时检查 OSS 配置
+for _key in ("oss_access_key_id", "oss_access_key_secret", "endpoint"):
+    os.environ.setdefault(_key, "test")
+os.environ.setdefault("bucket_name", "test-bucket")
+
+import oss2
+import pytest
+
+from module.OSS import aliyun_oss
+from module.OSS.aliyun_oss import OSSBase
+from test.oss_test.fake_bucket import FakeBucket
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(aliyun_oss, "download_threshold", 1000)
+    monkeypatch.setattr(aliyun_oss, "download_part_size", 300)
+    monkeypatch.setattr(aliyun_oss, "download_num_threads", 3)
+    service = OSSBase("video")
+    service.bucket = FakeBucket()
+    return service
+
+
+def test_large_object_downloaded_in_ranges(service, tmp_path):
+    data = os.urandom(2500)
+    service.bucket.put("video/a.mp4", data)
+    path = str(tmp_path / "a.mp4")
+
+    assert service.download_file_to_file("video/a.mp4", path) == path
+    with open(path, "rb") as f:
+        assert f.read() == data
+    # 不发 head_object: 第一个普通 GET 得到大小并下载第一段, 其余分段按 Range 下载
+    requests = service.bucket.requests
+    assert requests[0] == ("get", "video/a.mp4", None)
+    ranges = sorted(r[2] for r in requests[1:])
+    assert ranges == [(start, min(start + 300, 2500) - 1) for start in range(300, 2500, 300)]
+    assert not os.path.exists(path + ".download")
+
+
+def test_object_overwritten_during_ranged_download(service, tmp_path):
+    service.bucket.put("video/d.mp4", os.urandom(2500))
+    get_object = service.bucket.get_object
+
+    def get_object_then_overwrite(key, byte_range=None, headers=None):
+        result = get_object(key, byte_range, headers)
+        # 第一个 GET 返回后对象被覆盖, 后续分段的 If-Match 失败
+        service.bucket.put(key, os.urandom(2500))
+        return result
+
+    service.bucket.get_object = get_object_then_overwrite
+    path = str(tmp_path / "d.mp4")
+    with pytest.raises(oss2.exceptions.PreconditionFailed):
+        service.download_file_to_file("video/d.mp4", path)
+    assert not os.path.exists(path) and not os.path.exists(path + ".download")
+
+
+def test_small_object_downloaded_in_one_request(service, tmp_path):
+    service.bucket.put("video/b.mp4", b"abc")
+    path = str(tmp_path / "b.mp4")
+    service.download_file_to_file("video/b.mp4", path)
+    with open(path, "rb") as f:
+        assert f.read() == b"abc"
+    assert service.bucket.requests == [("get", "video/b.mp4", None)]
+
+
+def test_failed_range_removes_temp_file(service, tmp_path):
+    service.bucket.put("video/c.mp4", os.urandom(2500))
+    get_object = service.bucket.get_object
+
+    def flaky_get_object(key, byte_range=None, headers=None):
+        if byte_range is not None and byte_range[0] == 900:
+            raise IOError("connection reset")
+        return get_object(key, byte_range, headers)
+
+    service.bucket.get_object = flaky_get_object
+    path = str(tmp_path / "c.mp4")
+    with pytest.raises(IOError):
+        service.download_file_to_file("video/c.mp4", path)
+    assert not os.path.exists(path)
+    assert not os.path.exists(path + ".download")
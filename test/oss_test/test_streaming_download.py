@@ -0,0 +1,196 @@
+import io
+import os
+import threading
+from types import SimpleNamespace
+
+import av
+import numpy as np
+import pytest
+
+# aliyun_oss 在导入时检查 OSS 配置
+for _key in ("oss_access_key_id", "oss_access_key_secret", "endpoint"):
+    os.environ.setdefault(_key, "test")
+os.environ.setdefault("bucket_name", "test-bucket")
+
+from model.Interface import BaseHandle
+from model.video_decoder import get_pyav_fps, iter_pyav_frames
+from module.OSS.aliyun_oss import OSSBase
+from module.OSS.object_cache import OSSObjectCache
+from test.oss_test.fake_bucket import FakeBucket
+from test.wav2lip_test.test_video_decoder import ROTATE_90_MATRIX, _encode_video as _encode_rotated_video
+from utils.growing_file import DownloadCancelled, GrowingFile
+
+
+class GatedStream(io.BytesIO):
+    """读到 gate_at 之后等待 gate 被 set, 模拟下载中途还没收到的数据"""
+
+    def __init__(self, data, gate_at, error=None):
+        super().__init__(data)
+        self.gate_at = gate_at
+        self.gate = threading.Event()
+        self.error = error
+
+    def read(self, size=-1):
+        if self.tell() >= self.gate_at:
+            assert self.gate.wait(5)
+            if self.error is not None:
+                raise self.error
+        return super().read(min(size, self.gate_at - self.tell()) if self.tell() < self.gate_at else size)
+
+
+def _write_in_background(growing_file, stream, size, chunk_size=16):
+    def write():
+        try:
+            growing_file.write_from(stream, size, "etag:test", chunk_size=chunk_size)
+        except Exception as e:
+            growing_file.fail(e)
+
+    thread = threading.Thread(target=write, daemon=True)
+    thread.start()
+    return thread
+
+
+def _read_exactly(reader, size):
+    # 原始文件对象只返回已经写入的部分, 需要循环读取
+    data = b""
+    while len(data) < size:
+        chunk = reader.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def _encode_video(path, num_frames=30, fps=25):
+    # faststart 需要在写完后重新打开文件移动 moov, 不能写入 BytesIO
+    with av.open(str(path), "w", options={"movflags": "faststart"}) as container:
+        stream = container.add_stream("mpeg4", rate=fps)
+        stream.width, stream.height, stream.pix_fmt = 160, 120, "yuv420p"
+        rng = np.random.default_rng(0)
+        for _ in range(num_frames):
+            # 随机噪声让每帧足够大, 前一半数据远超过 pyav 探测格式时读取的长度
+            image = rng.integers(0, 256, (120, 160, 3), dtype=np.uint8)
+            container.mux(stream.encode(av.VideoFrame.from_ndarray(image, format="bgr24")))
+        container.mux(stream.encode())
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_reader_reads_written_part_before_download_completes(tmp_path):
+    data = bytes(range(256)) * 4
+    growing_file = GrowingFile(str(tmp_path / "a.bin"))
+    stream = GatedStream(data, gate_at=100)
+    thread = _write_in_background(growing_file, stream, len(data))
+
+    with growing_file.open() as reader:
+        assert _read_exactly(reader, 100) == data[:100]
+        assert not growing_file.complete
+        # 长度在写入开始时已知, 定位到末尾不需要等待
+        assert reader.seek(-4, io.SEEK_END) == len(data) - 4
+        stream.gate.set()
+        assert _read_exactly(reader, 4) == data[-4:]
+        reader.seek(0)
+        assert _read_exactly(reader, len(data) + 1) == data
+    thread.join()
+    assert growing_file.complete and growing_file.content_id == "etag:test"
+
+
+def test_reader_raises_download_error_and_cancel(tmp_path):
+    growing_file = GrowingFile(str(tmp_path / "a.bin"))
+    stream = GatedStream(b"x" * 100, gate_at=50, error=IOError("connection reset"))
+    _write_in_background(growing_file, stream, 100)
+    stream.gate.set()
+    with growing_file.open() as reader:
+        with pytest.raises(IOError, match="connection reset"):
+            reader.read()
+
+    cancelled = GrowingFile(str(tmp_path / "b.bin"))
+    stream = GatedStream(b"x" * 100, gate_at=50)
+    thread = _write_in_background(cancelled, stream, 100)
+    cancelled.cancel()
+    stream.gate.set()
+    thread.join()
+    with pytest.raises(DownloadCancelled):
+        cancelled.wait()
+
+
+def test_pyav_decodes_before_download_completes(tmp_path):
+    data = _encode_video(tmp_path / "source.mp4")
+    growing_file = GrowingFile(str(tmp_path / "a.mp4"))
+    # 只放行视频的前一半, 文件头和前面的帧已经可以解码 (多线程解码会延迟输出若干帧)
+    stream = GatedStream(data, gate_at=len(data) // 2)
+    thread = _write_in_background(growing_file, stream, len(data), chunk_size=4096)
+
+    with growing_file.open() as reader:
+        assert get_pyav_fps(reader) == 25
+    with growing_file.open() as reader:
+        frames = iter_pyav_frames(reader)
+        first = next(frames)
+        assert not growing_file.complete
+        stream.gate.set()
+        rest = list(frames)
+    thread.join()
+    assert first.shape == (120, 160, 3) and len(rest) == 29
+
+
+def test_download_to_growing_file_fills_object_cache(tmp_path):
+    service = OSSBase("video", OSSObjectCache(str(tmp_path / "cache"), 1000))
+    service.bucket = FakeBucket()
+    service.bucket.put("video/a.mp4", b"a" * 100)
+
+    first = GrowingFile(str(tmp_path / "1.mp4"))
+    assert service.download_to_growing_file("video/a.mp4", first)
+    assert first.content_id.startswith("etag:")
+    service.bucket.requests.clear()
+
+    # 第二次命中本地缓存, 条件 GET 确认未更新后整个文件立即可读
+    second = GrowingFile(str(tmp_path / "2.mp4"))
+    assert service.download_to_growing_file("video/a.mp4", second)
+    with second.open() as reader:
+        assert reader.read() == b"a" * 100
+    assert [r[0] for r in service.bucket.requests] == ["get"]
+    assert service.object_cache.stats()["revalidated"] == 1
+
+
+def test_pyav_raises_download_error_instead_of_truncating(tmp_path):
+    data = _encode_video(tmp_path / "source.mp4")
+    growing_file = GrowingFile(str(tmp_path / "a.mp4"))
+    stream = GatedStream(data, gate_at=len(data) // 2, error=IOError("connection reset"))
+    stream.gate.set()
+    _write_in_background(growing_file, stream, len(data), chunk_size=4096)
+
+    with growing_file.open() as reader:
+        with pytest.raises(IOError, match="connection reset"):
+            list(iter_pyav_frames(reader))
+
+
+def test_stream_input_frames_match_opencv_file_input(tmp_path):
+    # 边下载边推理固定使用 pyav, 输出需要与默认的 opencv 后端一致, 包括旋转信息、缩放和 rotate/crop 参数
+    video_path = _encode_rotated_video(tmp_path / "rotated.mp4", matrix=ROTATE_90_MATRIX)
+    with open(video_path, "rb") as f:
+        data = f.read()
+    growing_file = GrowingFile(str(tmp_path / "a.mp4"))
+    _write_in_background(growing_file, io.BytesIO(data), len(data), chunk_size=4096).join()
+
+    handle = SimpleNamespace(video_decoder_backend="opencv", _transform_frame=BaseHandle._transform_frame)
+    args = (2, True, (5, -1, 0, 50))
+    file_frames = list(BaseHandle.iter_video_frames_from_file(handle, video_path, *args))
+    with growing_file.open() as reader:
+        stream_frames = list(BaseHandle.iter_video_frames_from_file(handle, reader, *args, backend="pyav"))
+
+    assert len(stream_frames) == len(file_frames) > 0
+    for stream_frame, file_frame in zip(stream_frames, file_frames):
+        assert stream_frame.shape == file_frame.shape == (55, 50, 3)
+        assert np.abs(stream_frame.astype(np.int16) - file_frame).mean() < 1
+
+
+def test_growing_file_does_not_write_through_stale_hardlink(tmp_path):
+    cached = tmp_path / "cached.mp4"
+    cached.write_bytes(b"cached")
+    path = tmp_path / "task.mp4"
+    os.link(str(cached), str(path))
+
+    growing_file = GrowingFile(str(path))
+    assert growing_file.write_from(io.BytesIO(b"new content"), 11)
+    assert path.read_bytes() == b"new content"
+    assert cached.read_bytes() == b"cached"
@@ -0,0 +1,53 @@
+import threading
+import time
+
+import peewee
+
+from module.task_queue.leased_task_queue import LeasedTaskQueue
+
+
+class FlakyQueue(LeasedTaskQueue):
+    """不连接数据库, 前 failures 次领取或续约抛出 peewee 包装后的数据库异常"""
+
+    def __init__(self, failures, tasks=(), **kwargs):
+        self.failures = {"claim": failures, "renew": failures}
+        self.tasks = list(tasks)
+        self.claim_calls = 0
+        self.renewed = []
+        self.renewed_event = threading.Event()
+        super().__init__(**kwargs)
+
+    def _fail(self, name):
+        if self.failures[name] > 0:
+            self.failures[name] -= 1
+            raise peewee.OperationalError("(2013, 'Lost connection to MySQL server during query')")
+
+    def _claim_task(self):
+        self.claim_calls += 1
+        self._fail("claim")
+        return self.tasks.pop(0) if self.tasks else None
+
+    def _renew_leases(self, task_ids):
+        self._fail("renew")
+        self.renewed.append(task_ids)
+        if len(self.renewed) >= 2:
+            self.renewed_event.set()
+
+
+def test_heartbeat_keeps_renewing_after_database_error():
+    queue = FlakyQueue(failures=1, heartbeat_interval=0.05)
+    with queue.held_tasks_lock:
+        queue.held_tasks.add(1)
+
+    assert queue.renewed_event.wait(5)
+    assert queue.heartbeat_thread.is_alive()
+    assert queue.failures["renew"] == 0 and queue.renewed[:2] == [[1], [1]]
+
+
+def test_get_task_backs_off_on_database_errors():
+    queue = FlakyQueue(failures=3, tasks=[{"task_id": 7}], poll_interval=0.01, max_retry_interval=0.03)
+    start = time.perf_counter()
+    assert queue.get_task() == {"task_id": 7}
+    assert queue.claim_calls == 4
+    # 重试间隔 0.01, 0.02, 0.03 (不超过 max_retry_interval)
+    assert time.perf_counter() - start >= 0.06
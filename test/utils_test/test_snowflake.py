@@ -0,0 +1,35 @@
+import multiprocessing
+
+import pytest
+
+from utils.snowflake import process_snowflake
+
+
+def _generate(worker_id, queue):
+    import os
+    os.environ["snowflake_worker_id"] = str(worker_id)
+    snowflake = process_snowflake()
+    queue.put([snowflake.generate() for _ in range(2000)])
+
+
+def test_processes_with_different_worker_ids_never_collide():
+    # 两个进程同时生成, 同一毫秒内的序列号相同, 只有 worker_id 不同
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    processes = [context.Process(target=_generate, args=(i, queue)) for i in (1, 2)]
+    for process in processes:
+        process.start()
+    ids = queue.get(timeout=30) + queue.get(timeout=30)
+    for process in processes:
+        process.join()
+    assert len(set(ids)) == len(ids)
+
+
+def test_worker_id_comes_from_config(monkeypatch):
+    monkeypatch.setenv("snowflake_worker_id", "7")
+    monkeypatch.setenv("snowflake_datacenter_id", "3")
+    snowflake = process_snowflake()
+    assert (snowflake.worker_id, snowflake.datacenter_id) == (7, 3)
+    monkeypatch.setenv("snowflake_worker_id", "32")
+    with pytest.raises(ValueError):
+        process_snowflake()
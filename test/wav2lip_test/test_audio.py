@@ -0,0 +1,19 @@
+import numpy as np
+import torch
+
+from model.Wav2Lip import audio
+
+
+def test_melspectrogram_torch_matches_librosa():
+    rng = np.random.default_rng(0)
+    t = np.arange(16000 * 2) / 16000
+    wav = (0.3 * np.sin(2 * np.pi * 220 * t) + 0.05 * rng.standard_normal(t.shape)).astype(np.float32)
+    # 包含静音段, 覆盖 min_level_db 截断
+    wav[4000:8000] = 0
+
+    expected = audio.melspectrogram(wav)
+    mel = audio.melspectrogram_torch(torch.from_numpy(wav))
+
+    assert mel.dtype == torch.float32
+    assert mel.shape == expected.shape
+    assert np.abs(mel.numpy() - expected).max() < 1e-3
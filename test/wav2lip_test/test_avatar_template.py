@@ -0,0 +1,72 @@
+import os
+
+import numpy as np
+import pytest
+
+from model.Wav2Lip.avatar_template import AvatarTemplateStore
+
+
+def _face_frames(num_frames, height=180, width=320):
+    # 平滑渐变的帧, JPEG 压缩误差小
+    gradient = np.linspace(0, 255, width, dtype=np.float32)
+    for i in range(num_frames):
+        frame = np.empty((height, width, 3), dtype=np.uint8)
+        frame[:] = ((gradient + i * 10) % 256)[None, :, None].astype(np.uint8)
+        yield frame, frame[40:136, 60:156].copy(), (40, 136, 60, 156)
+
+
+def _build(store, template_id, frames):
+    with store.lock(template_id):
+        return store.build(template_id, 25.0, iter(frames), 96)
+
+
+def test_raw_template_frames_are_lossless(tmp_path):
+    store = AvatarTemplateStore(str(tmp_path))
+    frames = list(_face_frames(5))
+    template = _build(store, 1, frames)
+    assert store.exists(1) and template.frame_count == 5 and template.fps == 25.0
+
+    # 循环使用模板时索引会重复, 每次读取返回独立的数组
+    decoded = template.read_frames(np.array([4, 0, 4]))
+    assert decoded[0] is not decoded[2]
+    for image, (frame, _, _) in zip(decoded, [frames[4], frames[0], frames[4]]):
+        assert np.array_equal(image, frame)
+    decoded[0][:] = 0
+    assert np.array_equal(store.load(1).read_frames([4])[0], frames[4][0])
+    assert np.array_equal(template.faces[3], frames[3][1])
+    assert tuple(template.coords[2]) == (40, 136, 60, 156)
+
+
+def test_raw_template_over_size_limit_is_rejected(tmp_path):
+    frames = list(_face_frames(5))
+    store = AvatarTemplateStore(str(tmp_path), max_frame_bytes=frames[0][0].nbytes * 4)
+    with pytest.raises(ValueError, match="jpg"):
+        _build(store, 2, frames)
+    assert not store.exists(2)
+
+
+def test_jpg_template_frames_are_compressed(tmp_path):
+    store = AvatarTemplateStore(str(tmp_path), frame_format="jpg", max_frame_bytes=1)
+    frames = list(_face_frames(5))
+    template = _build(store, 3, frames)
+
+    raw_size = sum(frame.nbytes for frame, _, _ in frames)
+    assert os.path.getsize(os.path.join(str(tmp_path), "3", "frames.jpg")) < raw_size / 4
+    for image, (frame, face, _) in zip(template.read_frames(range(5)), frames):
+        assert image.shape == frame.shape
+        assert np.abs(image.astype(np.int16) - frame).mean() < 2
+    # 人脸不经过压缩
+    assert np.array_equal(template.faces[1], frames[1][1])
+
+    # 已有模板按保存时的格式读取, 与当前配置无关
+    assert AvatarTemplateStore(str(tmp_path)).load(3).frame_format == "jpg"
+
+
+def test_empty_template_is_rejected(tmp_path):
+    store = AvatarTemplateStore(str(tmp_path))
+    with pytest.raises(ValueError):
+        store.build(4, 25.0, iter([]), 96)
+    assert not store.exists(4)
+    assert [name for name in os.listdir(str(tmp_path)) if not name.endswith(".lock")] == []
+    with pytest.raises(ValueError):
+        AvatarTemplateStore(str(tmp_path), frame_format="png")
@@ -0,0 +1,53 @@
+import threading
+
+import numpy as np
+import pytest
+
+from model.Wav2Lip.batch_scheduler import InferenceScheduler
+
+
+def test_scheduler_packs_batches_across_tasks():
+    batch_sizes = []
+
+    def predict(mel_batch, img_batch):
+        batch_sizes.append(len(mel_batch))
+        return mel_batch + img_batch
+
+    scheduler = InferenceScheduler(predict, batch_size=8, max_wait_ms=50)
+    scheduler.start()
+    results = {}
+
+    def task(task_id):
+        outputs = []
+        for size in (5, 5, 3):
+            mel_batch = np.full((size, 2), task_id, dtype=np.float32)
+            img_batch = np.arange(size * 2, dtype=np.float32).reshape(size, 2)
+            outputs.append((scheduler.submit(mel_batch, img_batch).result(), mel_batch + img_batch))
+        results[task_id] = outputs
+
+    threads = [threading.Thread(target=task, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    scheduler.stop()
+
+    for outputs in results.values():
+        for pred, expected in outputs:
+            assert np.array_equal(pred, expected)
+    assert sum(batch_sizes) == 4 * 13
+    assert max(batch_sizes) <= 8
+    # 不同任务的批次被合并, 批次数少于提交次数
+    assert len(batch_sizes) < 4 * 3
+
+
+def test_scheduler_propagates_errors():
+    def predict(mel_batch, img_batch):
+        raise RuntimeError("predict failed")
+
+    scheduler = InferenceScheduler(predict, batch_size=4, max_wait_ms=1)
+    scheduler.start()
+    future = scheduler.submit(np.zeros((6, 2)), np.zeros((6, 2)))
+    with pytest.raises(RuntimeError):
+        future.result(timeout=5)
+    scheduler.stop()
@@ -0,0 +1,45 @@
+import os
+import time
+
+import numpy as np
+
+from model.Wav2Lip.face_box_cache import FaceBoxCache
+from module.cache.disk_lru_cache import DiskLRUCache
+
+
+def test_face_box_cache_partial_entries(tmp_path):
+    cache = FaceBoxCache(str(tmp_path), 1024 * 1024)
+    boxes = np.arange(40).reshape(10, 4)
+
+    cache.put("key", boxes)
+    assert np.array_equal(cache.get("key", 6), boxes[:6])
+    # 缓存只覆盖了前 10 帧, 需要更多帧时视为未命中
+    assert cache.get("key", 12) is None
+
+    cache.put("key", boxes, complete=True)
+    assert np.array_equal(cache.get("key", 12), boxes)
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 1
+
+
+def test_disk_lru_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), 250)
+    for key in ("a", "b"):
+        with cache.open_for_write(key) as f:
+            f.write(b"0" * 100)
+        time.sleep(0.01)
+
+    # 访问 a 后 b 成为最久未使用的缓存项
+    assert cache.get_path("a") is not None
+    with cache.open_for_write("c") as f:
+        f.write(b"0" * 100)
+
+    assert cache.get_path("b") is None
+    assert os.path.exists(os.path.join(str(tmp_path), "a"))
+    assert cache.stats()["evictions"] == 1
+
+
+def test_face_box_cache_key_depends_on_decoder_backend():
+    args = ("unused.mp4", 1, False, (0, -1, 0, -1), (0, 10, 0, 0), "etag:test")
+    assert FaceBoxCache.make_key(*args, backend="opencv") != FaceBoxCache.make_key(*args, backend="pyav")
+    assert FaceBoxCache.make_key(*args) == FaceBoxCache.make_key(*args, backend="opencv")
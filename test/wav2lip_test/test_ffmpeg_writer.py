@@ -0,0 +1,67 @@
+import shutil
+import stat
+
+import av
+import numpy as np
+import pytest
+
+from model.Wav2Lip.ffmpeg_writer import FFmpegVideoWriter
+
+
+def _fake_ffmpeg(tmp_path, script):
+    """用 shell 脚本代替 ffmpeg, 模拟提前退出和编码失败"""
+    path = tmp_path / "ffmpeg"
+    path.write_text("#!/bin/sh\n" + script)
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+def _frame(width=64, height=48, value=0):
+    return np.full((height, width, 3), value, dtype=np.uint8)
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="需要 ffmpeg")
+def test_writes_frames_and_pads_odd_size(tmp_path):
+    output_path = str(tmp_path / "out.mp4")
+    writer = FFmpegVideoWriter(output_path, 25, (63, 47))
+    for i in range(10):
+        writer.write(_frame(63, 47, i * 20))
+    writer.close()
+
+    with av.open(output_path) as container:
+        stream = container.streams.video[0]
+        frames = list(container.decode(stream))
+    assert len(frames) == 10
+    # yuv420p 要求宽高为偶数, 奇数尺寸补齐一行一列
+    assert (frames[0].width, frames[0].height) == (64, 48)
+
+
+def test_ffmpeg_exiting_early_raises_with_stderr(tmp_path):
+    ffmpeg = _fake_ffmpeg(tmp_path, "echo 'Unknown encoder' >&2\nexit 1\n")
+    writer = FFmpegVideoWriter(str(tmp_path / "out.mp4"), 25, (640, 480), ffmpeg_binary=ffmpeg)
+    # 管道缓冲区写满之前不会发现 ffmpeg 已退出, 持续写入直到出现 BrokenPipeError
+    with pytest.raises(RuntimeError, match="Unknown encoder"):
+        for _ in range(100):
+            writer.write(_frame(640, 480))
+    writer.abort()
+
+
+def test_non_zero_return_code_raises_on_close(tmp_path):
+    ffmpeg = _fake_ffmpeg(tmp_path, "cat > /dev/null\necho 'Conversion failed' >&2\nexit 3\n")
+    writer = FFmpegVideoWriter(str(tmp_path / "out.mp4"), 25, (64, 48), ffmpeg_binary=ffmpeg)
+    writer.write(_frame())
+    with pytest.raises(RuntimeError, match=r"\(3\).*Conversion failed"):
+        writer.close()
+
+
+def test_warnings_do_not_fail_close_and_abort_kills_ffmpeg(tmp_path):
+    ffmpeg = _fake_ffmpeg(tmp_path, "cat > /dev/null\necho 'deprecated pixel format' >&2\n")
+    writer = FFmpegVideoWriter(str(tmp_path / "out.mp4"), 25, (64, 48), ffmpeg_binary=ffmpeg)
+    writer.write(_frame())
+    writer.close()
+
+    # 不读取 stdin 的 ffmpeg 会一直等待, abort 时强制结束
+    writer = FFmpegVideoWriter(str(tmp_path / "out.mp4"), 25, (64, 48),
+                               ffmpeg_binary=_fake_ffmpeg(tmp_path, "exec sleep 60\n"))
+    writer.abort()
+    assert writer.process.returncode is not None and writer.process.returncode != 0
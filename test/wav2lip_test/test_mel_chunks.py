@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from model.Wav2Lip.mel_chunks import split_mel_chunks
+
+
+def reference_mel_chunks(mel, fps):
+    mel_idx_multiplier = 80. / fps
+    i = 0
+    mel_step_size = 16
+    mel_chunks = []
+    while 1:
+        start_idx = int(i * mel_idx_multiplier)
+        if start_idx + mel_step_size > len(mel[0]):
+            mel_chunks.append(mel[:, len(mel[0]) - mel_step_size:])
+            break
+        mel_chunks.append(mel[:, start_idx: start_idx + mel_step_size])
+        i += 1
+    return mel_chunks
+
+
+@pytest.mark.parametrize("fps", [23.976, 24, 25, 29.97, 30, 50, 60])
+@pytest.mark.parametrize("mel_length", [16, 17, 31, 200, 1601])
+def test_split_mel_chunks_matches_loop(fps, mel_length):
+    mel = np.random.default_rng(0).standard_normal((80, mel_length)).astype(np.float32)
+    expected = reference_mel_chunks(mel, fps)
+    chunks = split_mel_chunks(mel, fps)
+
+    assert len(chunks) == len(expected)
+    assert chunks.shape == (len(expected), 80, 16)
+    assert np.array_equal(chunks[:], np.asarray(expected))
+    assert all(np.array_equal(a, b) for a, b in zip(chunks, expected))
+    # 整数索引返回原频谱的视图
+    assert np.shares_memory(chunks[0], mel)
+
+
+def test_split_mel_chunks_rejects_short_mel():
+    with pytest.raises(ValueError):
+        split_mel_chunks(np.zeros((80, 10)), 25)
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+import torch
+
+from model.Wav2Lip.export import export_s3fd_onnx, export_wav2lip_onnx
+from model.Wav2Lip.face_detection.detection.sfd.net_s3fd import L2Norm, s3fd
+from model.Wav2Lip.models.wav2lip import Wav2Lip
+from model.Wav2Lip.onnx_runtime import OnnxS3FD, create_session
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("onnx")
+
+
+def test_wav2lip_onnx_matches_torch(tmp_path):
+    torch.manual_seed(0)
+    model = Wav2Lip().eval()
+    path = str(tmp_path / "wav2lip.onnx")
+    export_wav2lip_onnx(model, path)
+    session = create_session(path, torch.device("cpu"))
+
+    # 批次为动态维度, 与导出时的示例批次不同
+    for batch_size in (1, 5):
+        mel_batch = torch.randn(batch_size, 1, 80, 16)
+        img_batch = torch.rand(batch_size, 6, 96, 96)
+        with torch.no_grad():
+            expected = model(mel_batch, img_batch).numpy()
+        pred, = session.run(None, {"mel": mel_batch.numpy(), "face": img_batch.numpy()})
+        assert pred.shape == expected.shape
+        assert np.abs(pred - expected).max() < 1e-4
+
+
+def test_s3fd_onnx_matches_torch(tmp_path):
+    torch.manual_seed(0)
+    net = s3fd().eval()
+    # L2Norm 的权重由未初始化的张量乘 0 得到, 内存中残留 NaN 时输出全为 NaN; 实际使用时会被权重文件覆盖
+    for module in net.modules():
+        if isinstance(module, L2Norm):
+            torch.nn.init.constant_(module.weight, module.scale)
+    path = str(tmp_path / "s3fd.onnx")
+    export_s3fd_onnx(net, path)
+    detector = OnnxS3FD(create_session(path, torch.device("cpu")))
+
+    images = torch.rand(2, 3, 96, 128) * 255
+    with torch.no_grad():
+        expected = net(images)
+    outputs = detector(images)
+    assert len(outputs) == len(expected)
+    for output, reference in zip(outputs, expected):
+        assert output.shape == reference.shape
+        assert (output - reference).abs().max() < 1e-3
@@ -0,0 +1,26 @@
+import cv2
+import numpy as np
+
+from model.Wav2Lip.paste_back import FacePaster
+
+
+def test_batched_paste_matches_per_frame_resize():
+    rng = np.random.default_rng(0)
+    pred = rng.random((6, 96, 96, 3)) * 255
+    # 两种人脸框尺寸交替出现
+    coords = [(10, 110, 20, 140) if i % 2 else (5, 85, 30, 90) for i in range(6)]
+    frames = [np.zeros((120, 160, 3), dtype=np.uint8) for _ in range(6)]
+    expected = [f.copy() for f in frames]
+    for p, f, (y1, y2, x1, x2) in zip(pred, expected, coords):
+        f[y1:y2, x1:x2] = cv2.resize(p.astype(np.uint8), (x2 - x1, y2 - y1))
+
+    paster = FacePaster()
+    paster.paste(pred, frames, coords)
+    for frame, reference in zip(frames, expected):
+        assert np.abs(frame.astype(int) - reference).max() <= 1
+
+    # 缓冲区复用, 批次变小时结果不受上一批次影响
+    frames = [np.zeros((120, 160, 3), dtype=np.uint8) for _ in range(2)]
+    paster.paste(pred[:2], frames, coords[:2])
+    for frame, reference in zip(frames, expected[:2]):
+        assert np.abs(frame.astype(int) - reference).max() <= 1
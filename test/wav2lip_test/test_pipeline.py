@@ -0,0 +1,55 @@
+import pytest
+
+from model.Wav2Lip.pipeline import BackgroundGenerator, BackgroundWorker
+
+
+def test_background_generator_keeps_order():
+    assert list(BackgroundGenerator(iter(range(100)), max_size=2)) == list(range(100))
+
+
+def test_background_generator_raises_producer_error():
+    def gen():
+        yield 1
+        raise ValueError("boom")
+
+    batches = BackgroundGenerator(gen(), max_size=1)
+    assert next(batches) == 1
+    with pytest.raises(ValueError):
+        next(batches)
+    with pytest.raises(StopIteration):
+        next(batches)
+
+
+def test_background_generator_close_stops_producer():
+    closed = []
+
+    def gen():
+        try:
+            while True:
+                yield 0
+        finally:
+            closed.append(True)
+
+    batches = BackgroundGenerator(gen(), max_size=1)
+    next(batches)
+    batches.close()
+    assert closed == [True]
+
+
+def test_background_worker_runs_in_order_and_raises():
+    results = []
+    worker = BackgroundWorker(results.append, max_size=1)
+    for i in range(50):
+        worker.submit(i)
+    worker.join()
+    assert results == list(range(50))
+
+    def fail(x):
+        raise RuntimeError(x)
+
+    worker = BackgroundWorker(fail, max_size=1)
+    worker.submit(1)
+    with pytest.raises(RuntimeError):
+        for i in range(10):
+            worker.submit(i)
+        worker.join()
@@ -0,0 +1,54 @@
+import torch
+
+from model.Wav2Lip.export import export_wav2lip
+from model.Wav2Lip.inference import load_model, resolve_precision, run_model
+from model.Wav2Lip.models.wav2lip import Wav2Lip
+
+
+def test_reduced_precision_matches_fp32():
+    torch.manual_seed(0)
+    model = Wav2Lip().eval()
+    mel_batch = torch.randn(4, 1, 80, 16)
+    img_batch = torch.rand(4, 6, 96, 96)
+    expected = run_model(model, mel_batch, img_batch)
+
+    pred = run_model(model.to(memory_format=torch.channels_last), mel_batch, img_batch, channels_last=True)
+    assert torch.allclose(pred, expected, atol=1e-5)
+
+    pred = run_model(model, mel_batch, img_batch, precision="bf16", channels_last=True)
+    assert pred.dtype == torch.float32
+    # 输出范围 0~1, 误差小于 1/255 的几倍
+    assert (pred - expected).abs().max() < 0.02
+
+
+def test_resolve_precision_falls_back_on_cpu():
+    assert resolve_precision("fp16", "cpu") == "fp32"
+    assert resolve_precision("bf16", "cpu") == "bf16"
+
+
+def test_exported_model_precision_and_channels_last(tmp_path):
+    torch.manual_seed(0)
+    checkpoint_path = str(tmp_path / "wav2lip.pth")
+    torch.save({"state_dict": Wav2Lip().state_dict()}, checkpoint_path)
+    mel_batch = torch.randn(4, 1, 80, 16)
+    img_batch = torch.rand(4, 6, 96, 96)
+    expected = run_model(load_model(checkpoint_path, "cpu"), mel_batch, img_batch)
+
+    for channels_last in (False, True):
+        # 与 Wav2LipHandle 一样保存后用 torch.jit.load 加载
+        path = str(tmp_path / f"wav2lip.{channels_last}.pt")
+        export_wav2lip(checkpoint_path, torch.device("cpu"), [4], channels_last=channels_last).save(path)
+        model = torch.jit.load(path, map_location="cpu")
+        weights = [v for v in model.code_with_constants[1].const_mapping.values()
+                   if isinstance(v, torch.Tensor) and v.dim() == 4]
+        # freeze 后的卷积权重保持导出时的内存格式 (1x1 卷积两种格式相同, 不计入)
+        num_channels_last = sum(w.is_contiguous(memory_format=torch.channels_last) and not w.is_contiguous()
+                                for w in weights)
+        assert (num_channels_last > 0) == channels_last
+
+        pred = run_model(model, mel_batch, img_batch, channels_last=channels_last)
+        assert torch.allclose(pred, expected, atol=1e-5)
+        # autocast 对 freeze 后的图同样生效: 结果与 fp32 不完全相同, 误差在 bf16 范围内
+        pred = run_model(model, mel_batch, img_batch, precision="bf16", channels_last=channels_last)
+        diff = (pred - expected).abs().max()
+        assert pred.dtype == torch.float32 and 0 < diff < 0.02
@@ -0,0 +1,54 @@
+import os
+import time
+
+import pytest
+
+from services.model_inference.wav2lip import process_worker
+from services.model_inference.wav2lip.process_worker import ProcessWorkerSupervisor
+
+
+def _crash_once_worker(worker_index, device, thread_num, temp_path):
+    """第一次启动时异常退出, 重启后一直运行; 每次启动在临时目录中记录一次"""
+    starts = len(os.listdir(temp_path))
+    with open(os.path.join(temp_path, f"start_{starts}"), "w") as f:
+        f.write(str(os.getpid()))
+    if starts == 0:
+        os._exit(3)
+    time.sleep(60)
+
+
+def _wait_for(predicate, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_supervisor_restarts_exited_worker(tmp_path, monkeypatch):
+    # spawn 子进程按模块路径导入 target, 替换为测试模块中的函数
+    monkeypatch.setattr(process_worker, "worker_main", _crash_once_worker)
+    supervisor = ProcessWorkerSupervisor([None, "cpu"], temp_root=str(tmp_path), check_interval=0.1)
+    supervisor.start()
+    try:
+        worker_dirs = [str(tmp_path / f"worker_{i}") for i in range(2)]
+        # 每个子进程使用独立的临时目录, 各自崩溃一次后被重新启动
+        assert _wait_for(lambda: all(len(os.listdir(path)) == 2 for path in worker_dirs))
+        assert _wait_for(lambda: all(status["alive"] for status in supervisor.status()))
+        status = supervisor.status()
+        assert [s["device"] for s in status] == [None, "cpu"]
+        for s, path in zip(status, worker_dirs):
+            with open(os.path.join(path, "start_1")) as f:
+                assert int(f.read()) == s["pid"]
+    finally:
+        supervisor.stop()
+    assert not any(status["alive"] for status in supervisor.status())
+    # 停止后不再重启
+    time.sleep(0.3)
+    assert all(len(os.listdir(str(tmp_path / f"worker_{i}"))) == 2 for i in range(2))
+
+
+def test_supervisor_rejects_more_workers_than_snowflake_ids():
+    with pytest.raises(ValueError):
+        ProcessWorkerSupervisor([None] * 32)
@@ -0,0 +1,27 @@
+import torch
+
+from model.Wav2Lip.inference import resolve_precision, run_model
+from model.Wav2Lip.models.wav2lip import Wav2Lip
+from model.Wav2Lip.quantization import Wav2LipInference, calibrate, convert_model, prepare_model
+
+
+def test_int8_matches_fp32():
+    torch.manual_seed(0)
+    model = Wav2Lip().eval()
+    mel_batch = torch.randn(4, 1, 80, 16)
+    img_batch = torch.rand(4, 6, 96, 96)
+    expected = run_model(model, mel_batch, img_batch)
+    assert torch.equal(run_model(Wav2LipInference(model), mel_batch, img_batch), expected)
+
+    prepared = prepare_model(model)
+    calibrate(prepared, [(torch.randn(4, 1, 80, 16), torch.rand(4, 6, 96, 96)) for _ in range(2)])
+    quantized = convert_model(prepared, batch_size=4)
+    # 批次为动态维度
+    pred = run_model(quantized, mel_batch[:3], img_batch[:3], precision="int8")
+    assert pred.shape == expected[:3].shape
+    assert (pred - expected[:3]).abs().max() < 0.02
+
+
+def test_resolve_int8_falls_back_on_gpu():
+    assert resolve_precision("int8", "cpu") == "int8"
+    assert resolve_precision("int8", "cuda") == "fp32"
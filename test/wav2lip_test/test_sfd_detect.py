@@ -0,0 +1,63 @@
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from model.Wav2Lip.face_detection.detection.sfd.bbox import batch_decode, nms
+from model.Wav2Lip.face_detection.detection.sfd.detect import batch_detect
+from model.Wav2Lip.face_detection.detection.sfd.net_s3fd import L2Norm, s3fd
+
+
+def _random_s3fd():
+    torch.manual_seed(0)
+    net = s3fd().eval()
+    for m in net.modules():
+        if isinstance(m, torch.nn.Conv2d):
+            torch.nn.init.normal_(m.weight, 0, 0.02)
+            torch.nn.init.normal_(m.bias, 0, 0.5)
+        # L2Norm 的权重由未初始化的张量乘 0 得到, 内存中残留 NaN 时输出全为 NaN
+        elif isinstance(m, L2Norm):
+            torch.nn.init.constant_(m.weight, m.scale)
+    return net
+
+
+def _reference_batch_detect(net, imgs):
+    """逐 anchor 解码的原始实现, 用于对比向量化版本"""
+    imgs = imgs - np.array([104, 117, 123])
+    imgs = torch.from_numpy(imgs.transpose(0, 3, 1, 2)).float()
+    BB = imgs.size(0)
+    with torch.no_grad():
+        olist = net(imgs)
+    for i in range(len(olist) // 2):
+        olist[i * 2] = F.softmax(olist[i * 2], dim=1)
+    bboxlist = []
+    for i in range(len(olist) // 2):
+        ocls, oreg = olist[i * 2], olist[i * 2 + 1]
+        stride = 2 ** (i + 2)
+        for _, hindex, windex in zip(*np.where(ocls[:, 1, :, :] > 0.05)):
+            axc, ayc = stride / 2 + windex * stride, stride / 2 + hindex * stride
+            score = ocls[:, 1, hindex, windex]
+            loc = oreg[:, :, hindex, windex].contiguous().view(BB, 1, 4)
+            priors = torch.Tensor([[axc / 1.0, ayc / 1.0, stride * 4 / 1.0, stride * 4 / 1.0]]).view(1, 1, 4)
+            box = batch_decode(loc, priors, [0.1, 0.2])[:, 0]
+            bboxlist.append(torch.cat([box, score.unsqueeze(1)], 1).numpy())
+    bboxlist = np.array(bboxlist)
+    return [bboxlist[:, i, :] for i in range(BB)]
+
+
+def _final_boxes(bboxlists):
+    bboxlists = [bboxlist[nms(bboxlist, 0.3)] for bboxlist in bboxlists]
+    return [np.array([x for x in bboxlist if x[-1] > 0.5]) for bboxlist in bboxlists]
+
+
+def test_batch_detect_matches_reference():
+    net = _random_s3fd()
+    imgs = np.random.default_rng(0).integers(0, 255, (3, 96, 128, 3)).astype(np.uint8)
+
+    expected = _final_boxes(_reference_batch_detect(net, imgs))
+    result = _final_boxes(batch_detect(net, imgs, device='cpu'))
+
+    assert len(result) == len(expected)
+    # 没有检测到任何人脸框时对比没有意义
+    assert sum(len(r) for r in result) > 0
+    for r, e in zip(result, expected):
+        assert np.array_equal(r, e)
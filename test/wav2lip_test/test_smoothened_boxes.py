@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from model.Wav2Lip.inference import get_smoothened_boxes, iter_smoothened_boxes
+
+
+def _boxes(num_boxes, dtype=np.int64):
+    return np.random.default_rng(num_boxes).integers(0, 500, (num_boxes, 4)).astype(dtype)
+
+
+@pytest.mark.parametrize("num_boxes", [1, 3, 4, 5, 6, 9, 50])
+@pytest.mark.parametrize("dtype", [np.int64, np.float32])
+def test_iter_smoothened_boxes_matches_batch_version(num_boxes, dtype):
+    boxes = _boxes(num_boxes, dtype)
+    # get_smoothened_boxes 原地修改, 末尾窗口会用到已经平滑的结果
+    expected = get_smoothened_boxes(boxes.copy(), T=5)
+    result = np.array(list(iter_smoothened_boxes(iter(boxes), T=5)))
+    assert result.dtype == expected.dtype
+    assert np.array_equal(result, expected)
+
+
+def test_iter_smoothened_boxes_is_lazy():
+    consumed = []
+
+    def boxes():
+        for box in _boxes(20):
+            consumed.append(box)
+            yield box
+
+    smoothed = iter_smoothened_boxes(boxes(), T=5)
+    # 流式检测时只缓存平滑窗口内的帧: 输出第 1 个框只需要读取前 T 个框
+    next(smoothed)
+    assert len(consumed) == 5
+    next(smoothed)
+    assert len(consumed) == 6
+    assert len(list(smoothed)) == 18
+
+
+def test_iter_smoothened_boxes_empty():
+    assert list(iter_smoothened_boxes(iter([]), T=5)) == []
+
+
+def test_stream_face_detect_matches_batch_smoothing():
+    # 导入 wav2lip_handle 需要 GFPGAN
+    pytest.importorskip("GFPGAN.gfpgan_handle")
+    from model.Wav2Lip.wav2lip_handle import Wav2LipHandle
+
+    images = [np.full((100, 120, 3), i, dtype=np.uint8) for i in range(13)]
+    rects = _boxes(13)
+    detected_batches, completed = [], []
+
+    def detect_faces(batch):
+        start = sum(len(b) for b in detected_batches)
+        detected_batches.append(batch)
+        return list(rects[start:start + len(batch)])
+
+    handle = Wav2LipHandle.__new__(Wav2LipHandle)
+    handle.face_det_batch_size, handle.nosmooth, handle.pad = 4, False, [0, 10, 0, 0]
+    handle._detect_faces = detect_faces
+
+    results = list(handle.stream_face_detect(iter(images), completed.append))
+
+    padded = [handle._pad_face_rect(rect, image) for rect, image in zip(rects, images)]
+    assert [len(batch) for batch in detected_batches] == [4, 4, 4, 1]
+    assert len(completed) == 1 and np.array_equal(completed[0], padded)
+    assert [coords for _, coords in results] == handle._boxes_to_coords(padded)
+    # 每个人脸坐标与对应的视频帧一起输出
+    assert all(frame is image for (frame, _), image in zip(results, images))
@@ -0,0 +1,77 @@
+import struct
+
+import av
+import numpy as np
+import pytest
+
+from model import video_decoder
+from model.video_decoder import display_matrix_rotation, iter_opencv_frames, iter_pyav_frames
+
+# tkhd 中逆时针旋转 90 度的变换矩阵, 与 ffmpeg -display_rotation 90 写入的相同
+ROTATE_90_MATRIX = (0, -65536, 0, 65536, 0, 0, 0, 0, 1 << 30)
+
+
+def _encode_video(path, num_frames=6, fps=25, matrix=None):
+    with av.open(str(path), "w") as container:
+        stream = container.add_stream("mpeg4", rate=fps)
+        stream.width, stream.height, stream.pix_fmt = 160, 120, "yuv420p"
+        for i in range(num_frames):
+            # 左上角的白块用于判断方向
+            image = np.full((120, 160, 3), i * 20, dtype=np.uint8)
+            image[:30, :40] = 255
+            container.mux(stream.encode(av.VideoFrame.from_ndarray(image, format="bgr24")))
+        container.mux(stream.encode())
+    if matrix is not None:
+        data = bytearray(path.read_bytes())
+        # tkhd (version 0) 的变换矩阵位于类型字段之后第 40 字节
+        offset = data.index(b"tkhd") + 44
+        data[offset:offset + 36] = struct.pack(">9i", *matrix)
+        path.write_bytes(bytes(data))
+    return str(path)
+
+
+@pytest.mark.parametrize("resize_factor", [1, 2])
+def test_pyav_matches_opencv_orientation_and_resize(tmp_path, resize_factor):
+    video_path = _encode_video(tmp_path / "rotated.mp4", matrix=ROTATE_90_MATRIX)
+    opencv_frames = list(iter_opencv_frames(video_path, resize_factor))
+    pyav_frames = list(iter_pyav_frames(video_path, resize_factor))
+
+    assert len(pyav_frames) == len(opencv_frames) == 6
+    assert opencv_frames[0].shape == (160 // resize_factor, 120 // resize_factor, 3)
+    for pyav_frame, opencv_frame in zip(pyav_frames, opencv_frames):
+        assert pyav_frame.shape == opencv_frame.shape
+        assert np.abs(pyav_frame.astype(np.int16) - opencv_frame).mean() < 1
+    # 逆时针旋转后白块在左下角
+    assert pyav_frames[0][-5, 5].min() > 200 and pyav_frames[0][5, 5].max() < 50
+
+
+def test_display_matrix_rotation():
+    # 内存中的 display matrix 为本机字节序的 int32
+    matrix = np.array(ROTATE_90_MATRIX, dtype=np.int32).tobytes()
+    assert display_matrix_rotation(matrix) == pytest.approx(90)
+    assert display_matrix_rotation(np.array([65536, 0, 0, 0, 65536, 0, 0, 0, 1 << 30], dtype=np.int32)) == 0
+
+
+def test_pyav_stops_decoding_at_max_frames(tmp_path, monkeypatch):
+    video_path = _encode_video(tmp_path / "a.mp4")
+    decoded = []
+
+    class CountingContainer:
+        def __init__(self, container):
+            self.container = container
+            self.streams = container.streams
+
+        def decode(self, stream):
+            for frame in self.container.decode(stream):
+                decoded.append(frame)
+                yield frame
+
+        def close(self):
+            self.container.close()
+
+    open_container = av.open
+    monkeypatch.setattr(video_decoder.av, "open", lambda path: CountingContainer(open_container(path)))
+
+    assert len(list(iter_pyav_frames(video_path, max_frames=3))) == 3
+    assert len(decoded) == 3
+    assert list(iter_pyav_frames(video_path, max_frames=0)) == []
@@ -0,0 +1,13 @@
+import hashlib
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024) -> str:
+    """分块计算文件内容的 sha256, 避免将整个文件读入内存
+    :param file_path: 文件路径
+    :param chunk_size: 每次读取的字节数
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
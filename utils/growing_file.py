@@ -0,0 +1,159 @@
+"""
+边写入边读取的文件
+
+下载线程通过 write_from 顺序写入, 每写入一块就通知已写入的字节数; 解码器通过 open() 得到的
+GrowingFileReader 读取, 读到尚未写入的位置时阻塞等待, 因此可以在下载完成前开始解码.
+下载失败时正在等待的读取抛出同一个异常, cancel 后写入方在下一块停止, 读取方抛出 DownloadCancelled.
+"""
+import io
+import os
+from threading import Condition
+
+
+class DownloadCancelled(Exception):
+    pass
+
+
+class GrowingFile:
+    def __init__(self, path):
+        """
+        :param path: 写入的本地文件路径, 由写入方创建
+        """
+        self.path = path
+        self.condition = Condition()
+        # 文件总字节数, 写入开始前未知
+        self.size = None
+        # 内容标识 (如 OSS ETag), 文件写完之前用于代替内容哈希
+        self.content_id = None
+        self.written = 0
+        self.complete = False
+        self.cancelled = False
+        self.error = None
+
+    def write_from(self, stream, size, content_id=None, chunk_size=1024 * 1024):
+        """
+        从 stream 顺序读取并写入文件, 完成后标记为完整
+        :return: 被 cancel 时返回 False
+        """
+        with self.condition:
+            self.size, self.content_id = size, content_id
+            self.condition.notify_all()
+        # 路径可能是上次失败残留的缓存硬链接, 先删除再创建新文件, 不改写缓存内容
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        with open(self.path, "wb") as f:
+            while not self.cancelled:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                f.write(chunk)
+                # 先写入系统缓存再通知, 读取方另外打开的文件句柄才能读到
+                f.flush()
+                with self.condition:
+                    self.written += len(chunk)
+                    self.condition.notify_all()
+        if self.cancelled:
+            return False
+        if self.written != size:
+            raise IOError(f"{self.path} 写入长度不一致: {self.written} != {size}")
+        self.finish()
+        return True
+
+    def finish(self, content_id=None):
+        """文件已经完整写入, 也用于不经 write_from 直接生成的文件"""
+        with self.condition:
+            self.size = self.written = os.path.getsize(self.path)
+            self.content_id = self.content_id or content_id
+            self.complete = True
+            self.condition.notify_all()
+
+    def fail(self, error):
+        with self.condition:
+            self.error = error
+            self.condition.notify_all()
+
+    def cancel(self):
+        """不再需要剩余内容, 写入方在下一块停止"""
+        with self.condition:
+            if not self.complete:
+                self.cancelled = True
+            self.condition.notify_all()
+
+    def _wait_for(self, predicate):
+        """在持有 condition 时调用, 等到 predicate 成立, 下载失败或取消时抛出异常"""
+        while not predicate():
+            if self.error is not None:
+                raise self.error
+            if self.cancelled:
+                raise DownloadCancelled(self.path)
+            self.condition.wait()
+
+    def wait_started(self):
+        """等待写入开始, 此时 size 和 content_id 已知"""
+        with self.condition:
+            self._wait_for(lambda: self.size is not None)
+
+    def wait(self):
+        """等待文件完整写入"""
+        with self.condition:
+            self._wait_for(lambda: self.complete)
+
+    def open(self):
+        return GrowingFileReader(self)
+
+
+class GrowingFileReader(io.RawIOBase):
+    """
+    GrowingFile 的只读文件对象, 可以传给 av.open. 实际文件在首次读取到数据时才打开,
+    写入方以替换文件的方式完成 (如硬链接缓存文件) 时也能读到新文件
+    """
+
+    def __init__(self, growing_file: GrowingFile):
+        super().__init__()
+        self.growing_file = growing_file
+        self.file = None
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            # 总长度在写入开始时已知, 不需要等待写完
+            self.growing_file.wait_started()
+            self.position = self.growing_file.size + offset
+        else:
+            raise ValueError(f"invalid whence: {whence}")
+        return self.position
+
+    def readinto(self, buffer):
+        growing_file = self.growing_file
+        with growing_file.condition:
+            growing_file._wait_for(lambda: growing_file.complete or growing_file.written > self.position)
+            available = growing_file.written - self.position
+        if available <= 0:
+            return 0
+        if self.file is None:
+            self.file = open(growing_file.path, "rb")
+        self.file.seek(self.position)
+        count = self.file.readinto(memoryview(buffer)[:min(len(buffer), available)])
+        self.position += count
+        return count
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        super().close()
@@ -2,10 +2,14 @@
 This module contains the Snowflake class which is used to generate unique IDs for each object in the database.
 """
 
+import socket
 import time
 import logging
+import zlib
 from threading import Lock
 
+from module.config.env_config import config
+
 logger = logging.getLogger(__name__)
 
 
@@ -45,6 +49,19 @@ class Snowflake:
         return str(self.generate())
 
 
+def process_snowflake() -> Snowflake:
+    """
+    当前进程专用的 Snowflake. 多个进程往同一张表写入时使用相同的 worker_id 和 datacenter_id,
+    同一毫秒内会生成相同的 ID. datacenter_id 默认取主机名的哈希, 可通过 snowflake_datacenter_id 指定;
+    worker_id 为 snowflake_worker_id, 多进程模式下由子进程设置为 worker 序号 + 1, 主进程为 0.
+    """
+    datacenter_id = config.get("snowflake_datacenter_id", zlib.crc32(socket.gethostname().encode()) % 32, int)
+    worker_id = config.get("snowflake_worker_id", 0, int)
+    if not (0 <= datacenter_id < 32 and 0 <= worker_id < 32):
+        raise ValueError(f"snowflake_datacenter_id 和 snowflake_worker_id 需要在 0~31 之间: {datacenter_id}, {worker_id}")
+    return Snowflake(worker_id, datacenter_id)
+
+
 if __name__ == '__main__':
     snowflake = Snowflake(1, 1)
     for i in range(10):